@@ -1,3 +1,148 @@
 from django.contrib import admin
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
 
-# Register your models here.
+from .dead_letters import DeadLetterReplayService
+from .models import (
+    DashboardCounter,
+    DeadLetterTask,
+    IdempotencyKey,
+    LogDailyRollup,
+    PeriodicTaskRun,
+    ProfilingRule,
+    RequestProfile,
+)
+from .profiling import CACHE_REGRAS, comparar_perfis
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ("chave", "escopo", "status", "response_status", "created_at", "expires_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("chave", "escopo")
+    readonly_fields = ("request_hash", "response_body", "created_at")
+
+
+@admin.register(LogDailyRollup)
+class LogDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ("tabela", "dia", "status", "total", "updated_at")
+    list_filter = ("tabela", "status")
+    date_hierarchy = "dia"
+
+
+@admin.register(DashboardCounter)
+class DashboardCounterAdmin(admin.ModelAdmin):
+    list_display = ("metrica", "dia", "status", "valor", "updated_at")
+    list_filter = ("metrica", "status")
+    date_hierarchy = "dia"
+
+
+@admin.register(DeadLetterTask)
+class DeadLetterTaskAdmin(admin.ModelAdmin):
+    list_display = ("task_name", "status", "excecao", "falhas", "tentativas", "created_at", "updated_at")
+    list_filter = ("status", "task_name")
+    search_fields = ("task_id", "assinatura", "mensagem_erro")
+    readonly_fields = ("assinatura", "traceback", "created_at", "updated_at", "reenfileirada_em", "resolvida_em")
+    actions = ["reenfileirar", "descartar"]
+
+    @admin.action(description="Reenfileirar selecionadas (em lotes, com vazão limitada)")
+    def reenfileirar(self, request, queryset):
+        resumo = DeadLetterReplayService().reenfileirar(ids=list(queryset.values_list("id", flat=True)))
+        if resumo.get("recusado"):
+            self.message_user(request, f"Replay recusado: {resumo['recusado']}", level="warning")
+        else:
+            self.message_user(request, f"{resumo['reenfileiradas']} task(s) reenfileiradas em {resumo['lotes']} lote(s)")
+
+    @admin.action(description="Descartar selecionadas")
+    def descartar(self, request, queryset):
+        total = queryset.filter(status="pending").update(status="discarded")
+        self.message_user(request, f"{total} dead-letter(s) descartadas")
+
+
+@admin.register(PeriodicTaskRun)
+class PeriodicTaskRunAdmin(admin.ModelAdmin):
+    list_display = ("task_name", "status", "duracao_ms", "motivo", "created_at", "finished_at")
+    list_filter = ("status", "task_name")
+    search_fields = ("task_name", "task_id", "motivo")
+    readonly_fields = ("resultado", "mensagem_erro", "created_at", "finished_at")
+    date_hierarchy = "created_at"
+
+
+@admin.register(ProfilingRule)
+class ProfilingRuleAdmin(admin.ModelAdmin):
+    list_display = ("rota_prefixo", "taxa", "ativo", "expira_em", "created_at")
+    list_editable = ("taxa", "ativo", "expira_em")
+    list_filter = ("ativo",)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        cache.delete(CACHE_REGRAS)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        cache.delete(CACHE_REGRAS)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        cache.delete(CACHE_REGRAS)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        "metodo", "path", "status_code", "duracao_ms", "sql_queries", "sql_ms",
+        "omie_chamadas", "omie_ms", "motivo", "created_at", "baixar",
+    )
+    list_filter = ("motivo", "metodo", "rota")
+    search_fields = ("path", "rota", "trace_id")
+    date_hierarchy = "created_at"
+    exclude = ("perfil",)
+    readonly_fields = (
+        "metodo", "path", "rota", "status_code", "motivo", "trace_id", "usuario", "duracao_ms",
+        "sql_queries", "sql_ms", "omie_chamadas", "omie_ms", "resumo", "sql_detalhes", "omie_detalhes", "created_at",
+    )
+    actions = ["comparar"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<path:object_id>/download/",
+                self.admin_site.admin_view(self.download),
+                name="BackOffice_requestprofile_download",
+            ),
+        ] + super().get_urls()
+
+    @admin.display(description=".prof")
+    def baixar(self, obj):
+        return format_html('<a href="{}">baixar</a>', reverse("admin:BackOffice_requestprofile_download", args=[obj.pk]))
+
+    def download(self, request, object_id):
+        """Estatísticas no formato do cProfile: abra com pstats, snakeviz ou gprof2dot."""
+        registro = get_object_or_404(RequestProfile, pk=object_id)
+        resposta = HttpResponse(bytes(registro.perfil), content_type="application/octet-stream")
+        resposta["Content-Disposition"] = f'attachment; filename="profile-{registro.pk}.prof"'
+        return resposta
+
+    @admin.action(description="Comparar os 2 perfis selecionados")
+    def comparar(self, request, queryset):
+        perfis = list(queryset.order_by("created_at")[:3])
+        if len(perfis) != 2:
+            self.message_user(request, "Selecione exatamente 2 perfis para comparar", level="warning")
+            return None
+        a, b = perfis
+        contexto = {
+            **self.admin_site.each_context(request),
+            "title": "Comparação de perfis",
+            "opts": self.model._meta,
+            "a": a,
+            "b": b,
+            **comparar_perfis(a, b),
+        }
+        return TemplateResponse(request, "admin/BackOffice/requestprofile/comparar.html", contexto)
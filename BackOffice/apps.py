@@ -12,3 +12,18 @@ class BackofficeConfig(AppConfig):
         admin.site.site_header = _("BackOffice - Administração")
         admin.site.site_title = _("BackOffice Admin")
         admin.site.index_title = _("Bem-vindo ao painel de administração")
+
+        # Carimbo de enfileiramento usado para medir a idade das filas (backpressure)
+        from celery.signals import before_task_publish
+        from .backpressure import marcar_enfileiramento
+        before_task_publish.connect(marcar_enfileiramento, weak=False, dispatch_uid="backpressure_enqueued_at")
+
+        # Tracing: traceparent nas mensagens Celery, span por task e SQL somado ao span atual
+        from celery.signals import task_failure, task_postrun, task_prerun
+        from django.db.backends.signals import connection_created
+        from . import tracing
+        before_task_publish.connect(tracing.injetar_traceparent, weak=False, dispatch_uid="tracing_publish")
+        task_prerun.connect(tracing.iniciar_span_task, weak=False, dispatch_uid="tracing_prerun")
+        task_failure.connect(tracing.registrar_excecao_task, weak=False, dispatch_uid="tracing_failure")
+        task_postrun.connect(tracing.encerrar_span_task, weak=False, dispatch_uid="tracing_postrun")
+        connection_created.connect(tracing.instrumentar_conexao, weak=False, dispatch_uid="tracing_sql")
@@ -0,0 +1,70 @@
+# BackOffice/async_views.py
+
+import logging
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+
+def responder(dados, status: int = 200) -> JsonResponse:
+    return JsonResponse(dados, status=status, encoder=DjangoJSONEncoder, safe=False)
+
+
+class AsyncAPIView(View):
+    """
+    View async para endpoints que apenas repassam chamadas à Omie.
+    O DRF não executa views async, então aqui reaproveitamos dele só a
+    autenticação (Token/Session, com CSRF para sessão), as permissões
+    padrão e o parser JSON; os handlers recebem um `rest_framework.Request`
+    já autenticado e devolvem `responder(...)`.
+    """
+
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+    parser_classes = [JSONParser]
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Mesmo comportamento do APIView: CSRF só é exigido pela SessionAuthentication
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def _preparar(self, request) -> tuple[Request, JsonResponse | None]:
+        drf_request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[auth() for auth in self.authentication_classes],
+        )
+        try:
+            drf_request.user  # força a autenticação
+            for permissao in (perm() for perm in self.permission_classes):
+                if not permissao.has_permission(drf_request, self):
+                    if drf_request.successful_authenticator is None and not drf_request.user.is_authenticated:
+                        raise exceptions.NotAuthenticated()
+                    raise exceptions.PermissionDenied()
+            if request.method in ("POST", "PUT", "PATCH"):
+                drf_request.data  # lê e valida o corpo fora do event loop
+        except exceptions.APIException as exc:
+            return drf_request, responder({"erro": str(exc.detail)}, status=exc.status_code)
+        return drf_request, None
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler = getattr(self, request.method.lower(), None)
+        if request.method.lower() not in self.http_method_names or handler is None:
+            return self.http_method_not_allowed(request, *args, **kwargs)
+
+        # Banco (sessão/token) e leitura do corpo são síncronos
+        drf_request, negado = await sync_to_async(self._preparar)(request)
+        if negado is not None:
+            return negado
+        self.request = drf_request
+        return await handler(drf_request, *args, **kwargs)
@@ -0,0 +1,129 @@
+# BackOffice/backpressure.py
+
+import json
+import logging
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = "backpressure:filas"
+
+
+def marcar_enfileiramento(sender=None, headers=None, **kwargs):
+    """before_task_publish: carimba o horário de enfileiramento (idade da fila)."""
+    if headers is not None:
+        headers.setdefault("enqueued_at", time.time())
+
+
+def _ler_broker(filas: list[str]) -> dict:
+    """Profundidade e idade da mensagem mais antiga de cada fila, direto no broker."""
+    from DjangoProject.celery import app
+
+    estado = {}
+    with app.connection_for_read(connect_timeout=1) as conexao:
+        # Sem as retentativas padrão do kombu: broker fora do ar não pode travar a requisição
+        conexao.ensure_connection(max_retries=0)
+        canal = conexao.default_channel
+        for fila in filas:
+            if conexao.transport.driver_type == "redis":
+                # kombu: LPUSH para publicar, BRPOP para consumir -> a mais antiga fica no fim da lista
+                profundidade = canal.client.llen(fila)
+                idade = None
+                bruta = canal.client.lindex(fila, -1) if profundidade else None
+                if bruta:
+                    enfileirada = json.loads(bruta).get("headers", {}).get("enqueued_at")
+                    idade = round(time.time() - enfileirada, 1) if enfileirada else None
+            else:
+                profundidade = canal.queue_declare(queue=fila, passive=True).message_count
+                idade = None
+            estado[fila] = {"profundidade": profundidade, "idade_segundos": idade}
+    return estado
+
+
+def estado_filas(usar_cache: bool = True) -> dict:
+    """
+    {fila: {profundidade, idade_segundos}} das filas em BACKPRESSURE_QUEUES.
+    Lido do broker no máximo a cada BACKPRESSURE_CACHE_SECONDS. Broker
+    inacessível devolve {} (sem dados não há recusa: falha aberta).
+    """
+    if settings.CELERY_TASK_ALWAYS_EAGER:
+        return {}
+    if usar_cache:
+        estado = cache.get(CACHE_KEY)
+        if estado is not None:
+            return estado
+    try:
+        estado = _ler_broker(list(settings.BACKPRESSURE_QUEUES))
+    except Exception:
+        logger.warning("Não foi possível ler a profundidade das filas no broker", exc_info=True)
+        estado = {}
+    cache.set(CACHE_KEY, estado, settings.BACKPRESSURE_CACHE_SECONDS)
+    return estado
+
+
+@dataclass
+class Sobrecarga:
+    status_code: int
+    retry_after: int
+    fila: str
+    motivo: str
+
+
+def avaliar(estado: dict | None = None) -> Sobrecarga | None:
+    """
+    Acima de BACKPRESSURE_SOFT_DEPTH: 429 (desacelere). Acima de
+    BACKPRESSURE_HARD_DEPTH ou com a mensagem mais antiga além de
+    BACKPRESSURE_MAX_AGE_SECONDS: 503 (sistema sobrecarregado).
+    """
+    estado = estado_filas() if estado is None else estado
+    pior = None
+    for fila, dados in estado.items():
+        profundidade = dados.get("profundidade") or 0
+        idade = dados.get("idade_segundos") or 0
+        if profundidade >= settings.BACKPRESSURE_HARD_DEPTH or idade >= settings.BACKPRESSURE_MAX_AGE_SECONDS:
+            return Sobrecarga(
+                503, settings.BACKPRESSURE_RETRY_AFTER_SECONDS * 2, fila,
+                f"fila {fila} com {profundidade} mensagens, mais antiga há {idade:.0f}s",
+            )
+        if profundidade >= settings.BACKPRESSURE_SOFT_DEPTH and pior is None:
+            pior = Sobrecarga(
+                429, settings.BACKPRESSURE_RETRY_AFTER_SECONDS, fila,
+                f"fila {fila} com {profundidade} mensagens",
+            )
+    return pior
+
+
+def resposta_sobrecarga() -> Response | None:
+    """Response 429/503 com Retry-After quando as filas estão acima dos limites; senão None."""
+    sobrecarga = avaliar()
+    if sobrecarga is None:
+        return None
+    logger.warning("Enfileiramento recusado (%s): %s", sobrecarga.status_code, sobrecarga.motivo)
+    resposta = Response(
+        {"erro": "Processamento assíncrono sobrecarregado; tente novamente mais tarde", "motivo": sobrecarga.motivo},
+        status=sobrecarga.status_code,
+    )
+    resposta["Retry-After"] = str(sobrecarga.retry_after)
+    return resposta
+
+
+def metricas_prometheus(estado: dict) -> str:
+    linhas = [
+        "# HELP backoffice_celery_queue_depth Mensagens aguardando na fila",
+        "# TYPE backoffice_celery_queue_depth gauge",
+    ]
+    linhas += [f'backoffice_celery_queue_depth{{queue="{fila}"}} {dados["profundidade"]}' for fila, dados in estado.items()]
+    linhas += [
+        "# HELP backoffice_celery_queue_oldest_age_seconds Idade da mensagem mais antiga",
+        "# TYPE backoffice_celery_queue_oldest_age_seconds gauge",
+    ]
+    linhas += [
+        f'backoffice_celery_queue_oldest_age_seconds{{queue="{fila}"}} {dados["idade_segundos"] or 0}'
+        for fila, dados in estado.items()
+    ]
+    return "\n".join(linhas) + "\n"
@@ -0,0 +1,167 @@
+# BackOffice/dead_letters.py
+
+import hashlib
+import logging
+import re
+import uuid
+from itertools import groupby
+
+from celery import Task, current_app
+from django.conf import settings
+from django.db.models import Count, Max, Min
+
+from .backpressure import avaliar
+from .models import DeadLetterTask
+
+logger = logging.getLogger(__name__)
+
+# Header enviado no replay: a execução reenfileirada atualiza o mesmo registro
+HEADER_DEAD_LETTER = "dead_letter_id"
+
+_VARIAVEIS = re.compile(r"\b0x[0-9a-f]+\b|\d+", re.I)
+
+
+def assinatura_falha(exc: BaseException) -> tuple[str, str]:
+    """
+    (hash, texto) da falha: tipo da exceção + mensagem com números trocados
+    por <n>, para que "pedido 123" e "pedido 456" caiam no mesmo grupo.
+    """
+    texto = f"{type(exc).__name__}: {_VARIAVEIS.sub('<n>', str(exc))}"[:500]
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest(), texto
+
+
+def _dead_letter_id(request) -> int | None:
+    valor = getattr(request, HEADER_DEAD_LETTER, None) or (getattr(request, "headers", None) or {}).get(HEADER_DEAD_LETTER)
+    return int(valor) if valor else None
+
+
+class TaskComDeadLetter(Task):
+    """
+    Base para tasks com retentativas: ao falhar de vez (retentativas esgotadas
+    ou exceção sem retry), registra/atualiza um DeadLetterTask. Uma execução
+    vinda de replay bem-sucedida marca o registro como resolvido.
+    """
+
+    abstract = True
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        try:
+            registrar_falha(self, exc, task_id, args, kwargs, str(einfo or ""))
+        except Exception:
+            # Nunca deixa a dead-letter mascarar a falha original
+            logger.exception("Falha ao registrar dead-letter de %s (%s)", self.name, task_id)
+        super().on_failure(exc, task_id, args, kwargs, einfo)
+
+    def on_success(self, retval, task_id, args, kwargs):
+        dead_letter_id = _dead_letter_id(self.request)
+        if dead_letter_id:
+            registro = DeadLetterTask.objects.filter(pk=dead_letter_id, status="replaying").first()
+            if registro:
+                registro.mark_as_resolved()
+        super().on_success(retval, task_id, args, kwargs)
+
+
+def registrar_falha(task, exc, task_id, args, kwargs, traceback: str = "") -> DeadLetterTask:
+    assinatura, texto = assinatura_falha(exc)
+    campos = {
+        "task_id": task_id,
+        "assinatura": assinatura,
+        "excecao": texto[:255],
+        "mensagem_erro": str(exc),
+        "traceback": traceback[-10000:],
+        "tentativas": task.request.retries or 0,
+    }
+    dead_letter_id = _dead_letter_id(task.request)
+    registro = DeadLetterTask.objects.filter(pk=dead_letter_id).first() if dead_letter_id else None
+    if registro is not None:
+        for campo, valor in campos.items():
+            setattr(registro, campo, valor)
+        registro.status = "pending"
+        registro.falhas += 1
+        registro.save()
+    else:
+        registro = DeadLetterTask.objects.create(
+            task_name=task.name, args=list(args or []), kwargs=dict(kwargs or {}), **campos
+        )
+    logger.error("Task %s (%s) enviada para dead-letter: %s", task.name, task_id, texto)
+    return registro
+
+
+class DeadLetterReplayService:
+    """
+    Reenfileira dead-letters pendentes agrupadas por assinatura de falha.
+    Cada lote (DEAD_LETTER_REPLAY_BATCH_SIZE) sai com um countdown maior que
+    o anterior, de forma que a vazão chegue à Omie limitada a
+    `taxa_por_segundo` sem o comando ficar bloqueado esperando.
+    """
+
+    def __init__(self, tamanho_lote: int | None = None, taxa_por_segundo: float | None = None):
+        self.tamanho_lote = max(1, tamanho_lote or settings.DEAD_LETTER_REPLAY_BATCH_SIZE)
+        self.taxa_por_segundo = taxa_por_segundo or settings.DEAD_LETTER_REPLAY_RATE_PER_SECOND
+
+    @staticmethod
+    def grupos(status: str = "pending") -> list[dict]:
+        linhas = (
+            DeadLetterTask.objects.filter(status=status)
+            .values("assinatura", "task_name")
+            .annotate(total=Count("id"), primeira=Min("created_at"), ultima=Max("updated_at"), excecao=Max("excecao"))
+            .order_by("-total")
+        )
+        return list(linhas)
+
+    def reenfileirar(
+        self,
+        assinatura: str | None = None,
+        task_name: str | None = None,
+        ids: list[int] | None = None,
+        limite: int | None = None,
+        forcar: bool = False,
+        dry_run: bool = False,
+    ) -> dict:
+        sobrecarga = None if forcar else avaliar()
+        if sobrecarga is not None:
+            return {"reenfileiradas": 0, "recusado": sobrecarga.motivo}
+
+        qs = DeadLetterTask.objects.filter(status="pending")
+        if assinatura:
+            qs = qs.filter(assinatura=assinatura)
+        if task_name:
+            qs = qs.filter(task_name=task_name)
+        if ids:
+            qs = qs.filter(id__in=ids)
+        qs = qs.order_by("assinatura", "created_at")
+        registros = list(qs[:limite] if limite else qs)
+
+        intervalo = self.tamanho_lote / self.taxa_por_segundo
+        resumo = {"reenfileiradas": 0, "lotes": 0, "grupos": {}, "duracao_estimada_segundos": 0}
+        indice = 0
+        for chave, grupo in groupby(registros, key=lambda r: r.assinatura):
+            grupo = list(grupo)
+            resumo["grupos"][chave] = len(grupo)
+            for registro in grupo:
+                countdown = int((indice // self.tamanho_lote) * intervalo)
+                if not dry_run:
+                    self._reenfileirar(registro, countdown)
+                indice += 1
+        resumo["reenfileiradas"] = indice
+        resumo["lotes"] = -(-indice // self.tamanho_lote)
+        resumo["duracao_estimada_segundos"] = int(max(resumo["lotes"] - 1, 0) * intervalo)
+        logger.info("Replay de dead-letters: %s", resumo)
+        return resumo
+
+    def _reenfileirar(self, registro: DeadLetterTask, countdown: int):
+        task = current_app.tasks.get(registro.task_name)
+        if task is None:
+            logger.warning("Task %s não registrada; dead-letter %s descartada", registro.task_name, registro.id)
+            registro.mark_as_discarded()
+            return
+        # Marca antes de publicar: o worker (ou o modo eager) pode terminar antes do retorno
+        task_id = str(uuid.uuid4())
+        registro.mark_as_replaying(task_id)
+        task.apply_async(
+            args=registro.args,
+            kwargs=registro.kwargs,
+            countdown=countdown,
+            task_id=task_id,
+            headers={HEADER_DEAD_LETTER: registro.id},
+        )
@@ -0,0 +1,236 @@
+# BackOffice/idempotency.py
+
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+
+
+def _escopo(request) -> str:
+    usuario = request.user.pk if getattr(request, "user", None) and request.user.is_authenticated else "anon"
+    return f"{usuario}:{request.method}:{request.path}"[:255]
+
+
+def _serializar_valor(valor):
+    # Arquivos enviados (multipart) entram no hash por nome e tamanho
+    if hasattr(valor, "read"):
+        return {"arquivo": getattr(valor, "name", ""), "tamanho": getattr(valor, "size", None)}
+    return str(valor)
+
+
+def _hash_requisicao(request) -> str:
+    dados = request.data
+    if hasattr(dados, "getlist"):
+        dados = {chave: dados.getlist(chave) for chave in dados.keys()}
+    corpo = json.dumps(dados, sort_keys=True, default=_serializar_valor)
+    return hashlib.sha256(corpo.encode("utf-8")).hexdigest()
+
+
+def _replay(registro: IdempotencyKey) -> Response:
+    resposta = Response(registro.response_body, status=registro.response_status)
+    resposta["Idempotent-Replayed"] = "true"
+    return resposta
+
+
+def _reservar(escopo: str, chave: str, request_hash: str):
+    """Cria o registro in_progress; retorna (registro, criado)."""
+    expira = timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+    try:
+        with transaction.atomic():
+            registro = IdempotencyKey.objects.create(
+                escopo=escopo, chave=chave, request_hash=request_hash, expires_at=expira
+            )
+        return registro, True
+    except IntegrityError:
+        existente = IdempotencyKey.objects.filter(escopo=escopo, chave=chave).first()
+        if existente is None:
+            return _reservar(escopo, chave, request_hash)
+        if existente.expirada or existente.abandonada:
+            # Reaproveita a chave: só quem conseguir apagar o registro antigo assume
+            if IdempotencyKey.objects.filter(pk=existente.pk, status=existente.status).delete()[0]:
+                return _reservar(escopo, chave, request_hash)
+            existente = IdempotencyKey.objects.filter(escopo=escopo, chave=chave).first() or existente
+        return existente, False
+
+
+@contextmanager
+def _batimento(registro: IdempotencyKey):
+    """
+    Renova `updated_at` a cada IDEMPOTENCY_HEARTBEAT_SECONDS enquanto a view roda
+    (numa thread à parte, serve a views sync e async): execução longa continua
+    dona da chave; só processo morto para de bater e vira `abandonada`.
+    """
+    parar = threading.Event()
+
+    def _bater():
+        try:
+            while not parar.wait(settings.IDEMPOTENCY_HEARTBEAT_SECONDS):
+                IdempotencyKey.objects.filter(pk=registro.pk, status="in_progress").update(
+                    updated_at=timezone.now()
+                )
+        except Exception:
+            logger.exception("Falha no batimento da Idempotency-Key %s", registro.chave)
+        finally:
+            connection.close()
+
+    threading.Thread(target=_bater, name="idempotency-heartbeat", daemon=True).start()
+    try:
+        yield
+    finally:
+        parar.set()
+
+
+def _aguardar_conclusao(registro: IdempotencyKey):
+    """Espera a requisição original terminar (até IDEMPOTENCY_WAIT_SECONDS)."""
+    limite = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < limite:
+        time.sleep(0.2)
+        atual = IdempotencyKey.objects.filter(pk=registro.pk).first()
+        if atual is None or atual.status == "completed":
+            return atual
+    return None
+
+
+async def _aguardar_conclusao_async(registro: IdempotencyKey):
+    limite = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < limite:
+        await asyncio.sleep(0.2)
+        atual = await IdempotencyKey.objects.filter(pk=registro.pk).afirst()
+        if atual is None or atual.status == "completed":
+            return atual
+    return None
+
+
+def _recusa(registro: IdempotencyKey, request_hash: str) -> tuple[int, dict] | None:
+    """(status, corpo) quando a chave existente não pode ser usada por esta requisição."""
+    if registro.request_hash != request_hash:
+        return status.HTTP_422_UNPROCESSABLE_ENTITY, {"erro": "Idempotency-Key já utilizada com outro payload"}
+    return None
+
+
+def _liberar_chave(status_code: int) -> bool:
+    # Falhas transitórias não são gravadas: o cliente deve poder repetir com a mesma chave
+    return status_code >= 500 or status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+
+_EM_PROCESSAMENTO = {"erro": "Requisição com esta Idempotency-Key ainda em processamento"}
+
+
+def idempotente(view_func):
+    """
+    Torna um POST idempotente quando o cliente envia o cabeçalho Idempotency-Key.
+    A mesma chave com payload diferente é rejeitada (422); respostas 5xx, 429
+    (sobrecarga) ou exceções liberam a chave para nova tentativa. Aceita também handlers
+    async de AsyncAPIView (respostas JsonResponse).
+    """
+    if inspect.iscoroutinefunction(view_func):
+        return _idempotente_async(view_func)
+
+    @wraps(view_func)
+    def _wrapped(self, request, *args, **kwargs):
+        chave = request.headers.get(HEADER)
+        if not chave:
+            return view_func(self, request, *args, **kwargs)
+
+        chave = chave.strip()[:255]
+        escopo = _escopo(request)
+        request_hash = _hash_requisicao(request)
+        registro, criado = _reservar(escopo, chave, request_hash)
+
+        if not criado:
+            recusa = _recusa(registro, request_hash)
+            if recusa:
+                return Response(recusa[1], status=recusa[0])
+            if registro.status == "in_progress":
+                concluido = _aguardar_conclusao(registro)
+                if concluido is None:
+                    resposta = Response(_EM_PROCESSAMENTO, status=status.HTTP_409_CONFLICT)
+                    resposta["Retry-After"] = str(settings.IDEMPOTENCY_WAIT_SECONDS)
+                    return resposta
+                registro = concluido
+            logger.info("Replay de resposta idempotente: %s %s", escopo, chave)
+            return _replay(registro)
+
+        try:
+            with _batimento(registro):
+                resposta = view_func(self, request, *args, **kwargs)
+        except Exception:
+            registro.delete()
+            raise
+
+        if _liberar_chave(resposta.status_code):
+            registro.delete()
+            return resposta
+
+        corpo = json.loads(json.dumps(resposta.data, cls=DjangoJSONEncoder))
+        registro.mark_as_completed(resposta.status_code, corpo)
+        return resposta
+
+    return _wrapped
+
+
+def _idempotente_async(view_func):
+    from .async_views import responder
+
+    @wraps(view_func)
+    async def _wrapped(self, request, *args, **kwargs):
+        chave = request.headers.get(HEADER)
+        if not chave:
+            return await view_func(self, request, *args, **kwargs)
+
+        chave = chave.strip()[:255]
+        escopo = _escopo(request)
+        request_hash = _hash_requisicao(request)
+        registro, criado = await sync_to_async(_reservar)(escopo, chave, request_hash)
+
+        if not criado:
+            recusa = _recusa(registro, request_hash)
+            if recusa:
+                return responder(recusa[1], status=recusa[0])
+            if registro.status == "in_progress":
+                concluido = await _aguardar_conclusao_async(registro)
+                if concluido is None:
+                    resposta = responder(_EM_PROCESSAMENTO, status=status.HTTP_409_CONFLICT)
+                    resposta["Retry-After"] = str(settings.IDEMPOTENCY_WAIT_SECONDS)
+                    return resposta
+                registro = concluido
+            logger.info("Replay de resposta idempotente: %s %s", escopo, chave)
+            resposta = responder(registro.response_body, status=registro.response_status)
+            resposta["Idempotent-Replayed"] = "true"
+            return resposta
+
+        try:
+            with _batimento(registro):
+                resposta = await view_func(self, request, *args, **kwargs)
+        except Exception:
+            await registro.adelete()
+            raise
+
+        if _liberar_chave(resposta.status_code):
+            await registro.adelete()
+            return resposta
+
+        await sync_to_async(registro.mark_as_completed)(resposta.status_code, json.loads(resposta.content))
+        return resposta
+
+    return _wrapped
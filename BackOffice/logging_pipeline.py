@@ -0,0 +1,174 @@
+# BackOffice/logging_pipeline.py
+
+import atexit
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.utils.module_loading import import_string
+
+# Atributos que todo LogRecord tem; o resto veio de `extra=` e vai para o JSON
+_ATRIBUTOS_PADRAO = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com os campos passados em `extra` (origem_id, log_id...)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        dados = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO and not chave.startswith("_"):
+                dados[chave] = valor
+        if record.exc_info:
+            dados["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            dados["exc_info"] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class AmostragemDebugFilter(logging.Filter):
+    """
+    Deixa passar 1 a cada `taxa` registros DEBUG de cada mensagem (mesmo
+    template, mesmo logger); INFO ou acima passa sempre. O registro que passa
+    leva `amostragem=taxa` para que a contagem possa ser reconstruída.
+    """
+
+    def __init__(self, taxa: int = 10):
+        super().__init__()
+        self.taxa = max(1, int(taxa))
+        self._contadores: dict[tuple[str, str], itertools.count] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.taxa == 1:
+            return True
+        chave = (record.name, str(record.msg))
+        contador = self._contadores.get(chave)
+        if contador is None:
+            contador = self._contadores.setdefault(chave, itertools.count())
+        if next(contador) % self.taxa:
+            return False
+        record.amostragem = self.taxa
+        return True
+
+
+class FilaHandler(logging.handlers.QueueHandler):
+    """
+    Handler da aplicação: só enfileira (sem I/O no caminho da requisição ou da
+    task). Uma thread QueueListener por processo formata e grava no console e
+    num arquivo rotativo próprio do processo (<prefixo>-<pid>.jsonl); vários
+    processos num mesmo RotatingFileHandler corrompem a rotação.
+    Fila cheia descarta o registro e contabiliza em `descartados`;
+    `formato_arquivo` é o formatter do arquivo (caminho pontuado).
+    Após um fork (prefork do Celery/gunicorn) o filho sobe a própria fila,
+    thread e arquivo no primeiro log.
+    """
+
+    def __init__(
+        self,
+        diretorio: str,
+        prefixo: str = "django",
+        max_bytes: int = 20 * 1024 * 1024,
+        backups: int = 5,
+        tamanho_fila: int = 10000,
+        console: bool = True,
+        retencao_dias: int = 7,
+        formato_arquivo: str = "BackOffice.logging_pipeline.JSONFormatter",
+    ):
+        super().__init__(queue.Queue(tamanho_fila))
+        self.diretorio = Path(diretorio)
+        self.prefixo = prefixo
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.tamanho_fila = tamanho_fila
+        self.console = console
+        self.retencao_dias = retencao_dias
+        self.formato_arquivo = formato_arquivo
+        self.descartados = 0
+        self.listener = None
+        self._pid = None
+        self._lock_inicio = threading.Lock()
+        atexit.register(self.parar)
+
+    # ---------- destino (thread do listener) ----------
+
+    def _destinos(self) -> list[logging.Handler]:
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        arquivo = logging.handlers.RotatingFileHandler(
+            self.diretorio / f"{self.prefixo}-{os.getpid()}.jsonl",
+            maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8", delay=True,
+        )
+        arquivo.setFormatter(import_string(self.formato_arquivo)())
+        destinos = [arquivo]
+        if self.console:
+            tela = logging.StreamHandler(sys.stderr)
+            tela.setFormatter(logging.Formatter("{levelname} {asctime} {module} {message}", style="{"))
+            destinos.append(tela)
+        return destinos
+
+    def _limpar_arquivos_antigos(self):
+        # Cada processo deixa o seu arquivo para trás ao reiniciar
+        limite = time.time() - self.retencao_dias * 86400
+        for antigo in self.diretorio.glob(f"{self.prefixo}-*.jsonl*"):
+            try:
+                if antigo.stat().st_mtime < limite:
+                    antigo.unlink()
+            except OSError:
+                pass
+
+    def _iniciar(self):
+        with self._lock_inicio:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Filho de fork: a fila e a thread herdadas pertencem ao pai
+                self.queue = queue.Queue(self.tamanho_fila)
+            self._limpar_arquivos_antigos()
+            self.listener = logging.handlers.QueueListener(self.queue, *self._destinos(), respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def parar(self):
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            for destino in self.listener.handlers:
+                destino.close()
+            self.listener = None
+            self._pid = None
+
+    # ---------- caminho quente ----------
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve mensagem e traceback agora (args/exceção podem mudar depois),
+        # mantendo os campos de `extra` e a exceção separada da mensagem
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self._pid != os.getpid():
+            self._iniciar()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from BackOffice.dead_letters import DeadLetterReplayService
+
+
+class Command(BaseCommand):
+    help = (
+        "Lista as dead-letters pendentes agrupadas por assinatura de falha ou "
+        "reenfileira em lotes com vazão limitada (ex.: após uma queda da Omie)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listar", action="store_true", help="Só lista os grupos pendentes")
+        parser.add_argument("--assinatura", help="Reenfileira apenas este grupo")
+        parser.add_argument("--task", dest="task_name", help="Reenfileira apenas esta task (nome completo)")
+        parser.add_argument("--limite", type=int, help="Máximo de registros nesta execução")
+        parser.add_argument("--lote", type=int, help="Tamanho do lote (DEAD_LETTER_REPLAY_BATCH_SIZE)")
+        parser.add_argument("--taxa", type=float, help="Tasks por segundo (DEAD_LETTER_REPLAY_RATE_PER_SECOND)")
+        parser.add_argument("--forcar", action="store_true", help="Ignora a verificação de backpressure")
+        parser.add_argument("--dry-run", action="store_true", help="Mostra o plano sem reenfileirar")
+
+    def handle(self, *args, **options):
+        service = DeadLetterReplayService(tamanho_lote=options["lote"], taxa_por_segundo=options["taxa"])
+        if options["listar"]:
+            for grupo in service.grupos():
+                self.stdout.write(
+                    f"{grupo['assinatura'][:12]}  {grupo['total']:>5}  {grupo['task_name']}  {grupo['excecao']}"
+                )
+            return
+
+        resumo = service.reenfileirar(
+            assinatura=options["assinatura"],
+            task_name=options["task_name"],
+            limite=options["limite"],
+            forcar=options["forcar"],
+            dry_run=options["dry_run"],
+        )
+        if resumo.get("recusado"):
+            self.stderr.write(self.style.WARNING(f"Replay recusado: {resumo['recusado']} (use --forcar)"))
+            return
+        self.stdout.write(self.style.SUCCESS(json.dumps(resumo, ensure_ascii=False, indent=2)))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BackOffice', '0001_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tabela', models.CharField(help_text='app_label.Model', max_length=100)),
+                ('dia', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('total', models.IntegerField(default=0)),
+                ('somas', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'log_daily_rollup',
+                'ordering': ['-dia', 'tabela', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('tabela', 'dia', 'status'), name='uniq_log_rollup_tabela_dia_status')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BackOffice', '0002_logdailyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metrica', models.CharField(max_length=50)),
+                ('dia', models.DateField()),
+                ('status', models.CharField(max_length=30)),
+                ('valor', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'dashboard_counter',
+                'ordering': ['-dia', 'metrica', 'status'],
+                'constraints': [models.UniqueConstraint(fields=('metrica', 'dia', 'status'), name='uniq_dashboard_counter')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BackOffice', '0003_dashboardcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadLetterTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_name', models.CharField(max_length=255)),
+                ('task_id', models.CharField(help_text='Id da última execução que falhou', max_length=255)),
+                ('args', models.JSONField(blank=True, default=list)),
+                ('kwargs', models.JSONField(blank=True, default=dict)),
+                ('assinatura', models.CharField(help_text='Hash de tipo + mensagem normalizada da exceção', max_length=40)),
+                ('excecao', models.CharField(max_length=255)),
+                ('mensagem_erro', models.TextField(blank=True)),
+                ('traceback', models.TextField(blank=True)),
+                ('tentativas', models.IntegerField(default=0, help_text='Retentativas do Celery antes de desistir')),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('replaying', 'Reenfileirada'), ('resolved', 'Resolvida'), ('discarded', 'Descartada')], default='pending', max_length=20)),
+                ('falhas', models.IntegerField(default=1, help_text='Quantas vezes chegou à dead-letter (inclui replays)')),
+                ('replay_task_id', models.CharField(blank=True, max_length=255)),
+                ('reenfileirada_em', models.DateTimeField(blank=True, null=True)),
+                ('resolvida_em', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Task em dead-letter',
+                'verbose_name_plural': 'Tasks em dead-letter',
+                'db_table': 'dead_letter_task',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'assinatura', 'created_at'], name='dlt_status_assinatura_idx'), models.Index(fields=['task_name', 'status'], name='dlt_task_status_idx')],
+            },
+        ),
+    ]
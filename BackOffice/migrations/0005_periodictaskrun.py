@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BackOffice', '0004_deadlettertask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodicTaskRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_name', models.CharField(max_length=255)),
+                ('task_id', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('running', 'Em execução'), ('success', 'Sucesso'), ('failed', 'Falhou'), ('skipped', 'Pulada')], default='running', max_length=20)),
+                ('motivo', models.CharField(blank=True, help_text='Por que foi pulada (lock, backpressure)', max_length=255)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('mensagem_erro', models.TextField(blank=True)),
+                ('duracao_ms', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'periodic_task_run',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['task_name', 'created_at'], name='ptr_task_created_idx')],
+            },
+        ),
+    ]
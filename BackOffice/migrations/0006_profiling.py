@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BackOffice', '0005_periodictaskrun'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rota_prefixo', models.CharField(help_text='Ex.: /api/purchase-orders/full-flow/', max_length=255)),
+                ('taxa', models.FloatField(default=1.0, help_text='Fração das requisições perfiladas (0 a 1)')),
+                ('ativo', models.BooleanField(default=True)),
+                ('expira_em', models.DateTimeField(blank=True, help_text='Desliga sozinha após este horário', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'profiling_rule',
+                'ordering': ['rota_prefixo'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metodo', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('rota', models.CharField(blank=True, max_length=255)),
+                ('status_code', models.IntegerField(blank=True, null=True)),
+                ('motivo', models.CharField(choices=[('header', 'Header'), ('amostragem', 'Amostragem'), ('regra', 'Regra do Admin')], max_length=20)),
+                ('trace_id', models.CharField(blank=True, max_length=32)),
+                ('duracao_ms', models.IntegerField(default=0)),
+                ('sql_queries', models.IntegerField(default=0)),
+                ('sql_ms', models.FloatField(default=0)),
+                ('omie_chamadas', models.IntegerField(default=0)),
+                ('omie_ms', models.FloatField(default=0)),
+                ('resumo', models.TextField(blank=True, help_text='Funções mais caras (tempo acumulado)')),
+                ('sql_detalhes', models.JSONField(blank=True, default=list, help_text='Queries mais lentas')),
+                ('omie_detalhes', models.JSONField(blank=True, default=list)),
+                ('perfil', models.BinaryField(help_text='Estatísticas do cProfile (pstats/.prof)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'request_profile',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['rota', 'created_at'], name='rprof_rota_created_idx')],
+            },
+        ),
+    ]
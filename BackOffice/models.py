@@ -1,3 +1,353 @@
-from django.db import models
+from collections import Counter
+from datetime import timedelta
 
-# Create your models here.
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+class IdempotencyKey(models.Model):
+    """
+    Resposta de um POST caro associada ao cabeçalho Idempotency-Key.
+    Enquanto `in_progress`, duplicatas concorrentes aguardam; depois de
+    `completed`, a resposta armazenada é reenviada sem tocar na Omie.
+    """
+
+    STATUS_CHOICES = [
+        ("in_progress", "Em andamento"),
+        ("completed", "Concluída"),
+    ]
+
+    chave = models.CharField(max_length=255)
+    escopo = models.CharField(max_length=255, help_text="Usuário + método + rota")
+    request_hash = models.CharField(max_length=64)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="in_progress")
+    response_status = models.IntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Renovado periodicamente pela requisição em andamento (batimento)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = "idempotency_key"
+        ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["escopo", "chave"], name="uniq_idempotency_escopo_chave"),
+        ]
+
+    def __str__(self):
+        return f"{self.escopo} {self.chave} [{self.status}]"
+
+    @property
+    def expirada(self) -> bool:
+        return self.expires_at <= timezone.now()
+
+    @property
+    def abandonada(self) -> bool:
+        """Em andamento e sem batimento há mais que IDEMPOTENCY_LOCK_SECONDS (processo caiu no meio)."""
+        limite = self.updated_at + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+        return self.status == "in_progress" and limite <= timezone.now()
+
+    def mark_as_completed(self, response_status: int, response_body):
+        self.status = "completed"
+        self.response_status = response_status
+        self.response_body = response_body
+        self.save(update_fields=["status", "response_status", "response_body", "updated_at"])
+
+
+class LogDailyRollup(models.Model):
+    """
+    Agregado diário de linhas de log já compactadas pela retenção.
+    `somas` guarda os totais dos campos numéricos configurados na política.
+    """
+
+    tabela = models.CharField(max_length=100, help_text="app_label.Model")
+    dia = models.DateField()
+    status = models.CharField(max_length=20)
+    total = models.IntegerField(default=0)
+    somas = models.JSONField(default=dict, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "log_daily_rollup"
+        ordering = ["-dia", "tabela", "status"]
+        constraints = [
+            models.UniqueConstraint(fields=["tabela", "dia", "status"], name="uniq_log_rollup_tabela_dia_status"),
+        ]
+
+    def __str__(self):
+        return f"{self.tabela} {self.dia} [{self.status}]: {self.total}"
+
+    def acumular(self, total: int, somas: dict):
+        self.total += total
+        for campo, valor in somas.items():
+            self.somas[campo] = self.somas.get(campo, 0) + valor
+
+
+def dia_local(momento=None):
+    return timezone.localdate(momento) if momento else timezone.localdate()
+
+
+class DashboardCounter(models.Model):
+    """
+    Contagem de linhas por (métrica, dia de criação, status), mantida de forma
+    incremental a cada transição de status. O dashboard lê esta tabela
+    (poucas linhas por dia) em vez de COUNT ... GROUP BY nos logs.
+    """
+
+    metrica = models.CharField(max_length=50)
+    dia = models.DateField()
+    status = models.CharField(max_length=30)
+    valor = models.BigIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "dashboard_counter"
+        ordering = ["-dia", "metrica", "status"]
+        constraints = [
+            models.UniqueConstraint(fields=["metrica", "dia", "status"], name="uniq_dashboard_counter"),
+        ]
+
+    def __str__(self):
+        return f"{self.metrica} {self.dia} [{self.status}] = {self.valor}"
+
+    @classmethod
+    def aplicar(cls, deltas: dict):
+        """Soma {(metrica, dia, status): delta} com UPDATE atômico (valor = valor + delta)."""
+        agora = timezone.now()
+        for (metrica, dia, status), delta in deltas.items():
+            if not delta:
+                continue
+            filtro = cls.objects.filter(metrica=metrica, dia=dia, status=status)
+            if filtro.update(valor=F("valor") + delta, updated_at=agora):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(metrica=metrica, dia=dia, status=status, valor=delta)
+            except IntegrityError:
+                # Outro processo criou a linha entre o UPDATE e o INSERT
+                filtro.update(valor=F("valor") + delta, updated_at=agora)
+
+    @classmethod
+    def transicao(cls, metrica: str, criado_em, de: str | None, para: str | None):
+        if de == para:
+            return
+        dia = dia_local(criado_em)
+        deltas = {}
+        if de:
+            deltas[(metrica, dia, de)] = -1
+        if para:
+            deltas[(metrica, dia, para)] = deltas.get((metrica, dia, para), 0) + 1
+        cls.aplicar(deltas)
+
+    @classmethod
+    def registrar_lote(cls, metrica: str, linhas, de: str | None = None, campo_status: str = "status"):
+        """Contabiliza muitas linhas de uma vez (bulk_create / bulk_update)."""
+        deltas = Counter()
+        for linha in linhas:
+            dia = dia_local(linha.created_at)
+            para = getattr(linha, campo_status)
+            if de == para:
+                continue
+            if de:
+                deltas[(metrica, dia, de)] -= 1
+            deltas[(metrica, dia, para)] += 1
+        cls.aplicar(deltas)
+
+
+class DashboardCounterMixin(models.Model):
+    """
+    Mantém DashboardCounter a cada save(): criação soma no status inicial e
+    mudança de status (mark_as_*) move a contagem entre status, na mesma
+    transação da gravação. bulk_create/update() não passam por aqui: use
+    DashboardCounter.registrar_lote nesses caminhos.
+    """
+
+    metrica_dashboard: str = ""
+    campo_status_dashboard: str = "status"
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._status_contabilizado = instancia.__dict__.get(cls.campo_status_dashboard)
+        return instancia
+
+    def save(self, *args, **kwargs):
+        novo = self._state.adding
+        anterior = None if novo else getattr(self, "_status_contabilizado", None)
+        atual = getattr(self, self.campo_status_dashboard)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if novo or (anterior is not None and anterior != atual):
+                DashboardCounter.transicao(self.metrica_dashboard, self.created_at, anterior, atual)
+        self._status_contabilizado = atual
+
+
+class DeadLetterTask(models.Model):
+    """
+    Task Celery que esgotou as retentativas. Guarda o necessário para
+    reenfileirar (nome, args, kwargs) e a assinatura da falha, que agrupa
+    ocorrências da mesma causa (ex.: Omie fora do ar) para replay em lote.
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Pendente"),
+        ("replaying", "Reenfileirada"),
+        ("resolved", "Resolvida"),
+        ("discarded", "Descartada"),
+    ]
+
+    task_name = models.CharField(max_length=255)
+    task_id = models.CharField(max_length=255, help_text="Id da última execução que falhou")
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+
+    assinatura = models.CharField(max_length=40, help_text="Hash de tipo + mensagem normalizada da exceção")
+    excecao = models.CharField(max_length=255)
+    mensagem_erro = models.TextField(blank=True)
+    traceback = models.TextField(blank=True)
+    tentativas = models.IntegerField(default=0, help_text="Retentativas do Celery antes de desistir")
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    falhas = models.IntegerField(default=1, help_text="Quantas vezes chegou à dead-letter (inclui replays)")
+    replay_task_id = models.CharField(max_length=255, blank=True)
+    reenfileirada_em = models.DateTimeField(null=True, blank=True)
+    resolvida_em = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "dead_letter_task"
+        ordering = ["-created_at"]
+        verbose_name = "Task em dead-letter"
+        verbose_name_plural = "Tasks em dead-letter"
+        indexes = [
+            models.Index(fields=["status", "assinatura", "created_at"], name="dlt_status_assinatura_idx"),
+            models.Index(fields=["task_name", "status"], name="dlt_task_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.task_name} [{self.status}] {self.excecao}"
+
+    def mark_as_replaying(self, replay_task_id: str):
+        self.status = "replaying"
+        self.replay_task_id = replay_task_id
+        self.reenfileirada_em = timezone.now()
+        self.save(update_fields=["status", "replay_task_id", "reenfileirada_em", "updated_at"])
+
+    def mark_as_resolved(self):
+        self.status = "resolved"
+        self.resolvida_em = timezone.now()
+        self.save(update_fields=["status", "resolvida_em", "updated_at"])
+
+    def mark_as_discarded(self):
+        self.status = "discarded"
+        self.save(update_fields=["status", "updated_at"])
+
+
+class PeriodicTaskRun(models.Model):
+    """Uma execução de task periódica: duração, resultado ou motivo de ter sido pulada."""
+
+    STATUS_CHOICES = [
+        ("running", "Em execução"),
+        ("success", "Sucesso"),
+        ("failed", "Falhou"),
+        ("skipped", "Pulada"),
+    ]
+
+    task_name = models.CharField(max_length=255)
+    task_id = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="running")
+    motivo = models.CharField(max_length=255, blank=True, help_text="Por que foi pulada (lock, backpressure)")
+    resultado = models.JSONField(null=True, blank=True)
+    mensagem_erro = models.TextField(blank=True)
+    duracao_ms = models.IntegerField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "periodic_task_run"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["task_name", "created_at"], name="ptr_task_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.task_name} [{self.status}] {self.duracao_ms}ms"
+
+    def finalizar(self, status: str, duracao_ms: int, resultado=None, mensagem_erro: str = ""):
+        self.status = status
+        self.duracao_ms = duracao_ms
+        self.resultado = resultado
+        self.mensagem_erro = mensagem_erro
+        self.finished_at = timezone.now()
+        self.save(update_fields=["status", "duracao_ms", "resultado", "mensagem_erro", "finished_at"])
+
+
+class ProfilingRule(models.Model):
+    """Liga o profiling pelo Admin para um prefixo de rota, com amostragem e prazo."""
+
+    rota_prefixo = models.CharField(max_length=255, help_text="Ex.: /api/purchase-orders/full-flow/")
+    taxa = models.FloatField(default=1.0, help_text="Fração das requisições perfiladas (0 a 1)")
+    ativo = models.BooleanField(default=True)
+    expira_em = models.DateTimeField(null=True, blank=True, help_text="Desliga sozinha após este horário")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "profiling_rule"
+        ordering = ["rota_prefixo"]
+
+    def __str__(self):
+        return f"{self.rota_prefixo} ({self.taxa:.0%})"
+
+
+class RequestProfile(models.Model):
+    """Perfil de uma requisição: cProfile (formato .prof), SQL e chamadas Omie."""
+
+    MOTIVO_CHOICES = [
+        ("header", "Header"),
+        ("amostragem", "Amostragem"),
+        ("regra", "Regra do Admin"),
+    ]
+
+    metodo = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    rota = models.CharField(max_length=255, blank=True)
+    status_code = models.IntegerField(null=True, blank=True)
+    motivo = models.CharField(max_length=20, choices=MOTIVO_CHOICES)
+    trace_id = models.CharField(max_length=32, blank=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+
+    duracao_ms = models.IntegerField(default=0)
+    sql_queries = models.IntegerField(default=0)
+    sql_ms = models.FloatField(default=0)
+    omie_chamadas = models.IntegerField(default=0)
+    omie_ms = models.FloatField(default=0)
+
+    resumo = models.TextField(blank=True, help_text="Funções mais caras (tempo acumulado)")
+    sql_detalhes = models.JSONField(default=list, blank=True, help_text="Queries mais lentas")
+    omie_detalhes = models.JSONField(default=list, blank=True)
+    perfil = models.BinaryField(help_text="Estatísticas do cProfile (pstats/.prof)")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "request_profile"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["rota", "created_at"], name="rprof_rota_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.metodo} {self.path} {self.duracao_ms}ms"
@@ -0,0 +1,158 @@
+# BackOffice/pagination.py
+
+import base64
+import json
+from collections import OrderedDict
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimar_total(queryset, limite: int = 10000) -> dict:
+    """
+    Total aproximado sem COUNT(*) completo.
+    Postgres: estimativa do planner (EXPLAIN). Demais bancos: contagem limitada
+    a `limite` linhas (`exato=False` quando o limite foi atingido).
+    """
+    if connection.vendor == "postgresql":
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plano = cursor.fetchone()[0]
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        return {"valor": int(plano[0]["Plan"]["Plan Rows"]), "exato": False}
+
+    contagem = queryset.order_by()[: limite + 1].count()
+    return {"valor": min(contagem, limite), "exato": contagem <= limite}
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginação por cursor em (created_at, id), mais recentes primeiro.
+    Cada página é um `WHERE (created_at, id) < cursor ORDER BY ... LIMIT n`:
+    sem COUNT(*) nem OFFSET, o custo não depende da profundidade da página.
+    `?total=1` inclui um total aproximado (ver `estimar_total`).
+    """
+
+    page_size = api_settings.PAGE_SIZE or 50
+    max_page_size = 200
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    total_query_param = "total"
+
+    def _fatia(self, queryset, request):
+        """Queryset da página pedida (cursor aplicado, ordenado, page_size + 1 linhas) e a direção."""
+        page_size = self._page_size(request)
+        cursor = self._decodificar(request.query_params.get(self.cursor_query_param))
+        anterior = cursor is not None and cursor["d"] == "prev"
+        if cursor is not None:
+            criado, pk = cursor["c"], cursor["i"]
+            if anterior:
+                queryset = queryset.filter(Q(created_at__gt=criado) | Q(created_at=criado, id__gt=pk))
+            else:
+                queryset = queryset.filter(Q(created_at__lt=criado) | Q(created_at=criado, id__lt=pk))
+
+        ordem = ("created_at", "id") if anterior else ("-created_at", "-id")
+        return queryset.order_by(*ordem)[: page_size + 1], cursor, anterior
+
+    def chaves_pagina(self, queryset, request, campo_versao: str = "updated_at") -> list[tuple]:
+        """
+        (id, versão) das linhas que a página pedida vai mostrar, mais a primeira
+        da página seguinte: base da ETag, no mesmo índice e LIMIT da listagem.
+        """
+        fatia, _, _ = self._fatia(queryset, request)
+        return list(fatia.values_list("id", campo_versao))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self._page_size(request)
+
+        self.total = estimar_total(queryset) if request.query_params.get(self.total_query_param) else None
+
+        fatia, cursor, anterior = self._fatia(queryset, request)
+        itens = list(fatia)
+        ha_mais = len(itens) > self.page_size
+        itens = itens[: self.page_size]
+        if anterior:
+            itens.reverse()
+
+        # Voltando de uma página, sempre existe a seguinte; indo adiante, sempre há a anterior
+        self.tem_proxima = ha_mais if not anterior else True
+        self.tem_anterior = (ha_mais if anterior else cursor is not None) and bool(itens)
+        self.primeiro = itens[0] if itens else None
+        self.ultimo = itens[-1] if itens else None
+        return itens
+
+    def get_paginated_response(self, data):
+        corpo = OrderedDict(
+            [
+                ("next", self.get_next_link()),
+                ("previous", self.get_previous_link()),
+            ]
+        )
+        if self.total is not None:
+            corpo["total_aproximado"] = self.total
+        corpo["results"] = data
+        return Response(corpo)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "total_aproximado": {"type": "object", "nullable": True},
+                "results": schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.tem_proxima or self.ultimo is None:
+            return None
+        return self._link(self.ultimo, "next")
+
+    def get_previous_link(self):
+        if not self.tem_anterior or self.primeiro is None:
+            return None
+        return self._link(self.primeiro, "prev")
+
+    # ---------- utilitários ----------
+
+    def _page_size(self, request) -> int:
+        try:
+            valor = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(valor, self.max_page_size))
+
+    def _link(self, obj, direcao: str) -> str:
+        # Aceita instâncias ou dicionários de .values() (LeanListMixin)
+        if isinstance(obj, dict):
+            criado, pk = obj["created_at"], obj["id"]
+        else:
+            criado, pk = obj.created_at, obj.pk
+        bruto = json.dumps({"c": criado.isoformat(), "i": pk, "d": direcao})
+        cursor = base64.urlsafe_b64encode(bruto.encode("utf-8")).decode("ascii")
+        url = remove_query_param(self.base_url, self.total_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def _decodificar(self, valor: str | None):
+        if not valor:
+            return None
+        try:
+            dados = json.loads(base64.urlsafe_b64decode(valor.encode("ascii")).decode("utf-8"))
+            criado = parse_datetime(dados["c"])
+            if criado is None or dados.get("d") not in ("next", "prev"):
+                raise ValueError
+            return {"c": criado, "i": int(dados["i"]), "d": dados["d"]}
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound("Cursor inválido.")
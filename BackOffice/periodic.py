@@ -0,0 +1,158 @@
+# BackOffice/periodic.py
+
+import logging
+import random
+import time
+import uuid
+from functools import wraps
+
+from celery import current_task
+from celery.beat import PersistentScheduler
+from django.conf import settings
+from django.core.cache import cache
+
+from .backpressure import avaliar
+
+logger = logging.getLogger(__name__)
+
+PREFIXO_LOCK = "periodic:lock:"
+
+# Libera o lock só se ele ainda for nosso (o TTL pode ter expirado e outro worker assumido)
+_LIBERAR_SE_DONO = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class CacheLock:
+    """Lock no cache do Django: só é distribuído se o cache for compartilhado (dev/testes)."""
+
+    def adquirir(self, chave: str, token: str, ttl: int) -> bool:
+        return cache.add(chave, token, ttl)
+
+    def liberar(self, chave: str, token: str):
+        if cache.get(chave) == token:
+            cache.delete(chave)
+
+
+class RedisLock:
+    """SET NX EX no Redis: um único dono por chave entre todos os workers."""
+
+    def __init__(self, url: str):
+        import redis
+
+        self._cliente = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=2)
+        self._liberar = self._cliente.register_script(_LIBERAR_SE_DONO)
+
+    def adquirir(self, chave: str, token: str, ttl: int) -> bool:
+        return bool(self._cliente.set(chave, token, nx=True, ex=ttl))
+
+    def liberar(self, chave: str, token: str):
+        self._liberar(keys=[chave], args=[token])
+
+
+_backend = None
+
+
+def obter_lock():
+    global _backend
+    if _backend is None:
+        if settings.PERIODIC_LOCK_BACKEND == "redis":
+            _backend = RedisLock(settings.PERIODIC_LOCK_REDIS_URL)
+        else:
+            _backend = CacheLock()
+    return _backend
+
+
+def _registrar_pulo(nome: str, task_id: str, motivo: str) -> dict:
+    from .models import PeriodicTaskRun
+
+    logger.warning("%s pulada: %s", nome, motivo)
+    PeriodicTaskRun.objects.create(task_name=nome, task_id=task_id, status="skipped", motivo=motivo[:255])
+    return {"pulado": True, "motivo": motivo}
+
+
+def tarefa_periodica(lock_ttl: int | None = None, checar_filas: bool = True):
+    """
+    Envolve uma task disparada pelo beat:
+      - pula o ciclo quando as filas estão acima do limite brando (backpressure);
+      - pula se outra execução da mesma task ainda estiver rodando (lock por
+        task com TTL = `lock_ttl`, que deve cobrir a duração máxima esperada);
+      - registra cada execução em PeriodicTaskRun (duração, status, resultado).
+    Fica abaixo do @shared_task.
+    """
+
+    def decorator(task_func):
+        nome = f"{task_func.__module__}.{task_func.__name__}"
+        chave = PREFIXO_LOCK + nome
+
+        @wraps(task_func)
+        def _wrapped(*args, **kwargs):
+            from .models import PeriodicTaskRun
+
+            task_id = getattr(getattr(current_task, "request", None), "id", None) or ""
+            if checar_filas:
+                sobrecarga = avaliar()
+                if sobrecarga is not None:
+                    return _registrar_pulo(nome, task_id, sobrecarga.motivo)
+
+            lock = obter_lock()
+            token = uuid.uuid4().hex
+            try:
+                adquirido = lock.adquirir(chave, token, lock_ttl or settings.PERIODIC_LOCK_TTL_SECONDS)
+            except Exception:
+                # Sem Redis não dá para garantir exclusividade: melhor pular que duplicar
+                logger.exception("Falha ao obter lock de %s", nome)
+                return _registrar_pulo(nome, task_id, "lock indisponível")
+            if not adquirido:
+                return _registrar_pulo(nome, task_id, "execução anterior ainda em andamento")
+
+            execucao = PeriodicTaskRun.objects.create(task_name=nome, task_id=task_id)
+            inicio = time.monotonic()
+            try:
+                resultado = task_func(*args, **kwargs)
+            except Exception as exc:
+                execucao.finalizar("failed", int((time.monotonic() - inicio) * 1000), mensagem_erro=str(exc))
+                raise
+            else:
+                duracao_ms = int((time.monotonic() - inicio) * 1000)
+                execucao.finalizar("success", duracao_ms, resultado=resultado if isinstance(resultado, dict) else None)
+                logger.info("%s concluída em %sms", nome, duracao_ms)
+                return resultado
+            finally:
+                try:
+                    lock.liberar(chave, token)
+                except Exception:
+                    # O TTL libera de qualquer forma
+                    logger.warning("Falha ao liberar lock de %s", nome, exc_info=True)
+
+        return _wrapped
+
+    return decorator
+
+
+class JitterScheduler(PersistentScheduler):
+    """
+    Beat que aceita `jitter` (segundos) nas options de cada entrada do
+    beat_schedule: a mensagem sai com countdown aleatório em [0, jitter],
+    espalhando tasks com o mesmo intervalo para que não batam na Omie juntas.
+    """
+
+    def apply_async(self, entry, producer=None, advance=True, **kwargs):
+        jitter = entry.options.get("jitter")
+        if not jitter:
+            return super().apply_async(entry, producer, advance, **kwargs)
+        # As options da entrada são copiadas para a próxima execução e gravadas
+        # no arquivo do beat; o countdown sorteado vale só para este envio
+        original = entry.options
+        entry.options = {chave: valor for chave, valor in original.items() if chave != "jitter"}
+        entry.options["countdown"] = round(random.uniform(0, jitter), 1)
+        try:
+            return super().apply_async(entry, producer, advance, **kwargs)
+        finally:
+            entry.options = original
+            proxima = self.schedule.get(entry.name)
+            if proxima is not None:
+                proxima.options = original
@@ -0,0 +1,223 @@
+# BackOffice/profiling.py
+
+import cProfile
+import io
+import logging
+import marshal
+import os
+import pstats
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .models import ProfilingRule, RequestProfile
+from .tracing import coletar_spans, span_atual
+
+logger = logging.getLogger(__name__)
+
+CACHE_REGRAS = "profiling:regras"
+
+
+def regras_ativas() -> list[tuple[str, float]]:
+    """(prefixo, taxa) das ProfilingRule ativas e não expiradas, em cache curto."""
+    regras = cache.get(CACHE_REGRAS)
+    if regras is None:
+        regras = list(
+            ProfilingRule.objects.filter(ativo=True)
+            .filter(Q(expira_em__isnull=True) | Q(expira_em__gt=timezone.now()))
+            .values_list("rota_prefixo", "taxa")
+        )
+        cache.set(CACHE_REGRAS, regras, settings.PROFILING_RULES_CACHE_SECONDS)
+    return regras
+
+
+def motivo_para_perfilar(request) -> str | None:
+    """
+    'header' (X-Profile com o segredo, ou usuário staff na sessão), 'regra'
+    (ProfilingRule do Admin) ou 'amostragem' (PROFILING_SAMPLE_RATE); None = não perfilar.
+    """
+    if not settings.PROFILING_ENABLED or request.path.startswith("/admin/"):
+        return None
+    valor = request.headers.get(settings.PROFILING_HEADER)
+    if valor:
+        segredo = settings.PROFILING_HEADER_SECRET
+        usuario = getattr(request, "user", None)
+        if (segredo and constant_time_compare(valor, segredo)) or (usuario is not None and usuario.is_staff):
+            return "header"
+    for prefixo, taxa in regras_ativas():
+        if request.path.startswith(prefixo) and random.random() < taxa:
+            return "regra"
+    if (
+        settings.PROFILING_SAMPLE_RATE
+        and request.path.startswith(tuple(settings.PROFILING_PATH_PREFIXES))
+        and random.random() < settings.PROFILING_SAMPLE_RATE
+    ):
+        return "amostragem"
+    return None
+
+
+def _agrupar_sql(consultas: list[tuple[str, float]], limite: int = 20) -> list[dict]:
+    # Mesma SQL repetida (N+1) aparece numa linha só, com o número de execuções
+    grupos: dict[str, dict] = {}
+    for sql, ms in consultas:
+        grupo = grupos.setdefault(sql, {"sql": sql[:1000], "vezes": 0, "ms": 0.0})
+        grupo["vezes"] += 1
+        grupo["ms"] += ms
+    ordenados = sorted(grupos.values(), key=lambda g: g["ms"], reverse=True)[:limite]
+    return [{**g, "ms": round(g["ms"], 2)} for g in ordenados]
+
+
+def salvar_perfil(request, resposta, motivo: str, perfil: cProfile.Profile, consultas, spans, duracao_ms: int) -> RequestProfile:
+    saida = io.StringIO()
+    estatisticas = pstats.Stats(perfil, stream=saida)
+    estatisticas.sort_stats("cumulative").print_stats(settings.PROFILING_TOP_FUNCTIONS)
+
+    omie = [s for s in spans if s.tipo == "CLIENT" and s.nome.startswith("omie ")]
+    rota = getattr(getattr(request, "resolver_match", None), "route", "") or ""
+    usuario = getattr(request, "user", None)
+    trace = span_atual()
+    return RequestProfile.objects.create(
+        metodo=request.method,
+        path=request.get_full_path()[:500],
+        rota=rota.replace("^", "").replace("$", "")[:255],
+        status_code=getattr(resposta, "status_code", None),
+        motivo=motivo,
+        trace_id=trace.trace_id if trace else "",
+        usuario=usuario if usuario is not None and usuario.is_authenticated else None,
+        duracao_ms=duracao_ms,
+        sql_queries=len(consultas),
+        sql_ms=round(sum(ms for _, ms in consultas), 2),
+        omie_chamadas=len(omie),
+        omie_ms=round(sum(s.duracao_ms for s in omie), 2),
+        resumo=saida.getvalue(),
+        sql_detalhes=_agrupar_sql(consultas),
+        omie_detalhes=[
+            {"call": s.atributos.get("omie.call", s.nome), "ms": round(s.duracao_ms, 2), "erro": s.erro}
+            for s in omie
+        ],
+        perfil=marshal.dumps(estatisticas.stats),
+    )
+
+
+class ProfilingMiddleware:
+    """
+    Profiling opt-in por requisição (header, regra do Admin ou amostragem):
+    cProfile da view, SQL (quantidade, tempo, repetições) e chamadas Omie,
+    gravados em RequestProfile. A resposta ganha o header X-Profile-Id.
+    No ASGI o cProfile não pode ligar no event loop (mediria a thread inteira,
+    misturando as requisições concorrentes): o process_view perfila só a view
+    síncrona, na thread do sync_to_async onde ela roda. Views async não são
+    perfiladas e a resposta sai com X-Profile-Skipped.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        motivo = motivo_para_perfilar(request)
+        if motivo is None:
+            return self.get_response(request)
+        return self._perfilar(request, motivo, self.get_response)
+
+    async def __acall__(self, request):
+        resposta = await self.get_response(request)
+        if getattr(request, "_perfil_ignorado", None):
+            resposta["X-Profile-Skipped"] = "async-view"
+        return resposta
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Só no modo async; o Django chama este hook síncrono via sync_to_async
+        if not iscoroutinefunction(self):
+            return None
+        motivo = motivo_para_perfilar(request)
+        if motivo is None:
+            return None
+        if iscoroutinefunction(view_func):
+            request._perfil_ignorado = motivo
+            logger.info("Perfil não gravado: view async em %s %s", request.method, request.path)
+            return None
+        return self._perfilar(request, motivo, lambda r: view_func(r, *view_args, **view_kwargs))
+
+    def _perfilar(self, request, motivo: str, chamar):
+        consultas: list[tuple[str, float]] = []
+
+        def _medir_sql(execute, sql, params, many, context):
+            inicio_sql = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                consultas.append((sql, (time.perf_counter() - inicio_sql) * 1000))
+
+        perfil = cProfile.Profile()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(_medir_sql), coletar_spans() as spans:
+            try:
+                perfil.enable()
+            except ValueError:
+                # Outro profiler já ativo nesta thread
+                return chamar(request)
+            try:
+                resposta = chamar(request)
+            finally:
+                perfil.disable()
+        duracao_ms = int((time.perf_counter() - inicio) * 1000)
+
+        try:
+            registro = salvar_perfil(request, resposta, motivo, perfil, consultas, spans, duracao_ms)
+        except Exception:
+            logger.exception("Falha ao gravar o perfil de %s", request.path)
+            return resposta
+        resposta["X-Profile-Id"] = str(registro.pk)
+        logger.info("Perfil %s gravado: %s %s (%sms)", registro.pk, request.method, request.path, duracao_ms)
+        return resposta
+
+
+# ---------- Comparação ----------
+
+
+def _funcoes(registro: RequestProfile) -> dict[str, tuple[int, float, float]]:
+    """{arquivo:linha(função): (chamadas, tempo próprio s, tempo acumulado s)}"""
+    estatisticas = marshal.loads(bytes(registro.perfil))
+    return {
+        f"{os.path.basename(arquivo)}:{linha}({funcao})": (chamadas, proprio, acumulado)
+        for (arquivo, linha, funcao), (_, chamadas, proprio, acumulado, _) in estatisticas.items()
+    }
+
+
+def comparar_perfis(a: RequestProfile, b: RequestProfile, limite: int = 30) -> dict:
+    """Métricas lado a lado e as funções cujo tempo acumulado mais mudou de A para B."""
+    campos = ["duracao_ms", "sql_queries", "sql_ms", "omie_chamadas", "omie_ms"]
+    metricas = [
+        {"metrica": campo, "a": getattr(a, campo), "b": getattr(b, campo), "diferenca": round(getattr(b, campo) - getattr(a, campo), 2)}
+        for campo in campos
+    ]
+    funcoes_a, funcoes_b = _funcoes(a), _funcoes(b)
+    vazio = (0, 0.0, 0.0)
+    funcoes = []
+    for nome in set(funcoes_a) | set(funcoes_b):
+        chamadas_a, _, acumulado_a = funcoes_a.get(nome, vazio)
+        chamadas_b, _, acumulado_b = funcoes_b.get(nome, vazio)
+        funcoes.append({
+            "funcao": nome,
+            "chamadas_a": chamadas_a,
+            "chamadas_b": chamadas_b,
+            "acumulado_ms_a": round(acumulado_a * 1000, 2),
+            "acumulado_ms_b": round(acumulado_b * 1000, 2),
+            "diferenca_ms": round((acumulado_b - acumulado_a) * 1000, 2),
+        })
+    funcoes.sort(key=lambda f: abs(f["diferenca_ms"]), reverse=True)
+    return {"metricas": metricas, "funcoes": funcoes[:limite]}
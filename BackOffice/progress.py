@@ -0,0 +1,225 @@
+# BackOffice/progress.py
+
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Canais aceitos pelo stream SSE: <tipo>:<id>
+TIPOS_CANAL = ("transfer", "outbox", "task")
+
+
+def canal(tipo: str, identificador) -> str:
+    return f"{tipo}:{identificador}"
+
+
+class MemoryBackend:
+    """
+    Pub/sub dentro do processo (desenvolvimento/testes). Só funciona quando
+    quem publica e quem assiste estão no mesmo processo (ex.: CELERY_TASK_ALWAYS_EAGER).
+    """
+
+    def __init__(self, max_eventos: int = 500, ttl: int = 3600):
+        self._lock = threading.Lock()
+        self._canais: dict[str, deque] = {}
+        self._donos: dict[str, str] = {}
+        self._seq = 0
+        self._max_eventos = max_eventos
+        self._ttl = ttl
+
+    def publicar(self, nome: str, dados: dict) -> str:
+        with self._lock:
+            self._seq += 1
+            evento_id = f"{int(time.time() * 1000)}-{self._seq}"
+            eventos = self._canais.setdefault(nome, deque(maxlen=self._max_eventos))
+            eventos.append((evento_id, time.monotonic(), dados))
+            self._limpar()
+            return evento_id
+
+    def _limpar(self):
+        limite = time.monotonic() - self._ttl
+        for nome in [n for n, evs in self._canais.items() if evs and evs[-1][1] < limite]:
+            del self._canais[nome]
+
+    def _depois_de(self, nome: str, ultimo_id: str | None) -> list[tuple[str, dict]]:
+        with self._lock:
+            eventos = list(self._canais.get(nome, ()))
+        if ultimo_id:
+            ids = [evento_id for evento_id, _, _ in eventos]
+            if ultimo_id in ids:
+                eventos = eventos[ids.index(ultimo_id) + 1:]
+        return [(evento_id, dados) for evento_id, _, dados in eventos]
+
+    async def ler(self, nome: str, ultimo_id: str | None, timeout: float) -> list[tuple[str, dict]]:
+        fim = time.monotonic() + timeout
+        while True:
+            eventos = self._depois_de(nome, ultimo_id)
+            if eventos or time.monotonic() >= fim:
+                return eventos
+            await asyncio.sleep(0.2)
+
+    async def historico(self, nome: str) -> list[tuple[str, dict]]:
+        return self._depois_de(nome, None)
+
+    def definir_dono(self, nome: str, usuario_id) -> None:
+        with self._lock:
+            self._donos[nome] = str(usuario_id)
+
+    async def dono(self, nome: str) -> str | None:
+        return self._donos.get(nome)
+
+
+class RedisBackend:
+    """
+    Redis Streams: XADD com MAXLEN limita o histórico por canal e XREAD BLOCK
+    entrega eventos novos; o id do stream vira o `id:` do SSE (Last-Event-ID).
+    Leituras usam um cliente async por event loop (como o pool httpx da Omie),
+    em vez de abrir uma conexão a cada poll.
+    """
+
+    def __init__(self, url: str, max_eventos: int = 500, ttl: int = 3600):
+        import redis
+
+        self._url = url
+        self._max_eventos = max_eventos
+        self._ttl = ttl
+        self._sync = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=2)
+        self._clientes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, object]" = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _chave(nome: str) -> str:
+        return f"progress:{nome}"
+
+    @staticmethod
+    def _chave_dono(nome: str) -> str:
+        return f"progress-dono:{nome}"
+
+    def _cliente(self):
+        import redis.asyncio as aioredis
+
+        loop = asyncio.get_running_loop()
+        cliente = self._clientes.get(loop)
+        if cliente is None:
+            cliente = aioredis.Redis.from_url(self._url)
+            self._clientes[loop] = cliente
+        return cliente
+
+    def publicar(self, nome: str, dados: dict) -> str:
+        chave = self._chave(nome)
+        pipe = self._sync.pipeline()
+        pipe.xadd(chave, {"d": json.dumps(dados, default=str)}, maxlen=self._max_eventos, approximate=True)
+        pipe.expire(chave, self._ttl)
+        evento_id = pipe.execute()[0]
+        return evento_id.decode() if isinstance(evento_id, bytes) else evento_id
+
+    @staticmethod
+    def _decodificar(itens) -> list[tuple[str, dict]]:
+        eventos = []
+        for evento_id, campos in itens:
+            evento_id = evento_id.decode() if isinstance(evento_id, bytes) else evento_id
+            eventos.append((evento_id, json.loads(campos[b"d"])))
+        return eventos
+
+    async def ler(self, nome: str, ultimo_id: str | None, timeout: float) -> list[tuple[str, dict]]:
+        # BLOCK 0 no Redis é "esperar para sempre": nunca menos de 1 ms
+        resposta = await self._cliente().xread(
+            {self._chave(nome): ultimo_id or "0-0"}, block=max(1, int(timeout * 1000)), count=100
+        )
+        eventos = []
+        for _, itens in resposta or []:
+            eventos.extend(self._decodificar(itens))
+        return eventos
+
+    async def historico(self, nome: str) -> list[tuple[str, dict]]:
+        return self._decodificar(await self._cliente().xrange(self._chave(nome), count=self._max_eventos))
+
+    def definir_dono(self, nome: str, usuario_id) -> None:
+        self._sync.set(self._chave_dono(nome), str(usuario_id), ex=self._ttl)
+
+    async def dono(self, nome: str) -> str | None:
+        valor = await self._cliente().get(self._chave_dono(nome))
+        return valor.decode() if isinstance(valor, bytes) else valor
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def obter_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if settings.PROGRESS_BACKEND == "redis":
+                    _backend = RedisBackend(
+                        settings.PROGRESS_REDIS_URL,
+                        max_eventos=settings.PROGRESS_MAX_EVENTS,
+                        ttl=settings.PROGRESS_TTL_SECONDS,
+                    )
+                else:
+                    _backend = MemoryBackend(
+                        max_eventos=settings.PROGRESS_MAX_EVENTS, ttl=settings.PROGRESS_TTL_SECONDS
+                    )
+    return _backend
+
+
+def publicar(nome: str, tipo: str, /, **dados) -> str | None:
+    """Publica um evento de progresso; falhas no pub/sub nunca interrompem o serviço."""
+    evento = {"tipo": tipo, "ts": time.time(), **dados}
+    try:
+        return obter_backend().publicar(nome, evento)
+    except Exception:
+        logger.warning("Falha ao publicar progresso no canal %s", nome, exc_info=True)
+        return None
+
+
+def registrar_dono(nome: str, usuario) -> None:
+    """
+    Guarda quem disparou o trabalho do canal: só esse usuário (ou staff)
+    assiste o stream. Sem dono registrado, o canal é só para staff.
+    """
+    if usuario is None or not usuario.is_authenticated:
+        return
+    try:
+        obter_backend().definir_dono(nome, usuario.pk)
+    except Exception:
+        logger.warning("Falha ao registrar o dono do canal %s", nome, exc_info=True)
+
+
+async def pode_assistir(nome: str, usuario) -> bool:
+    if usuario.is_staff:
+        return True
+    try:
+        dono = await obter_backend().dono(nome)
+    except Exception:
+        logger.warning("Falha ao ler o dono do canal %s", nome, exc_info=True)
+        return False
+    return dono is not None and dono == str(usuario.pk)
+
+
+class Progresso:
+    """
+    Publica o mesmo evento em vários canais (ex.: transfer:<log_id> e task:<task_id>).
+    Cada tentativa começa com um evento "inicio" (o stream começa na última);
+    eventos com final=True encerram o stream SSE.
+    """
+
+    def __init__(self, *canais: str):
+        self.canais = [c for c in canais if c]
+
+    def com(self, *canais: str) -> "Progresso":
+        return Progresso(*self.canais, *canais)
+
+    def publicar(self, tipo: str, /, **dados):
+        for nome in self.canais:
+            publicar(nome, tipo, **dados)
+
+    def finalizar(self, status: str, /, **dados):
+        self.publicar("fim", status=status, final=True, **dados)
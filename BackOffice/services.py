@@ -0,0 +1,168 @@
+import gzip
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DashboardCounter, DashboardCounterMixin, LogDailyRollup, dia_local
+
+logger = logging.getLogger(__name__)
+
+
+class LogRetentionService:
+    """
+    Retenção das tabelas de log configuradas em LOG_RETENTION_POLICIES.
+
+    Para cada lote (LOG_RETENTION_BATCH_SIZE linhas mais antigas que `dias`
+    e em status final): exporta as linhas em JSONL gzip, acumula os agregados
+    diários e apaga o lote numa transação curta. O arquivo é gravado antes
+    da exclusão; se o processo cair entre os dois passos, o lote é exportado
+    de novo na próxima execução (linhas identificáveis pelo `id`).
+    """
+
+    def __init__(self, politicas: dict | None = None, batch_size: int | None = None):
+        self.politicas = politicas if politicas is not None else settings.LOG_RETENTION_POLICIES
+        self.batch_size = batch_size or settings.LOG_RETENTION_BATCH_SIZE
+        self.archive_dir = Path(settings.LOG_RETENTION_ARCHIVE_DIR)
+
+    def aplicar(self, tabela: str | None = None, dry_run: bool = False) -> dict:
+        resumo = {}
+        for nome, politica in self.politicas.items():
+            if tabela and nome != tabela:
+                continue
+            try:
+                resumo[nome] = self._aplicar_politica(nome, politica, dry_run=dry_run)
+            except Exception as exc:
+                logger.exception("Retenção falhou para %s", nome)
+                resumo[nome] = {"erro": str(exc)}
+        return resumo
+
+    def _queryset_expirado(self, model, politica: dict):
+        corte = timezone.now() - timedelta(days=politica["dias"])
+        qs = model.objects.filter(created_at__lt=corte)
+        if politica.get("status"):
+            qs = qs.filter(status__in=politica["status"])
+        return qs
+
+    def _aplicar_politica(self, nome: str, politica: dict, dry_run: bool = False) -> dict:
+        model = apps.get_model(nome)
+        qs = self._queryset_expirado(model, politica)
+        if dry_run:
+            return {"elegiveis": qs.count(), "removidos": 0, "lotes": 0}
+
+        arquivo = self._caminho_arquivo(nome) if politica.get("arquivar", True) else None
+        removidos = 0
+        lotes = 0
+        while lotes < settings.LOG_RETENTION_MAX_BATCHES_PER_RUN:
+            ids = list(qs.order_by("id").values_list("id", flat=True)[: self.batch_size])
+            if not ids:
+                break
+            linhas = list(model.objects.filter(id__in=ids).values())
+            if arquivo:
+                self._exportar(arquivo, linhas)
+
+            with transaction.atomic():
+                self._acumular_rollups(nome, linhas, politica.get("somar", []))
+                removidos += model.objects.filter(id__in=ids).delete()[0]
+            lotes += 1
+            if len(ids) < self.batch_size:
+                break
+
+        logger.info("Retenção %s: %s linhas removidas em %s lotes", nome, removidos, lotes)
+        return {
+            "removidos": removidos,
+            "lotes": lotes,
+            "arquivo": str(arquivo) if arquivo and removidos else None,
+        }
+
+    def _caminho_arquivo(self, nome: str) -> Path:
+        carimbo = timezone.now().strftime("%Y%m%d%H%M%S")
+        return self.archive_dir / nome / f"{nome}-{carimbo}.jsonl.gz"
+
+    def _exportar(self, arquivo: Path, linhas: list[dict]):
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        # Cada lote vira um membro gzip anexado ao mesmo arquivo (leitura com gzip.open normal)
+        with open(arquivo, "ab") as bruto:
+            with gzip.GzipFile(fileobj=bruto, mode="ab") as gz:
+                for linha in linhas:
+                    gz.write(json.dumps(linha, cls=DjangoJSONEncoder, ensure_ascii=False).encode("utf-8"))
+                    gz.write(b"\n")
+            bruto.flush()
+            os.fsync(bruto.fileno())
+
+    def _acumular_rollups(self, nome: str, linhas: list[dict], campos_soma: list[str]):
+        agregados = defaultdict(lambda: {"total": 0, "somas": defaultdict(int)})
+        for linha in linhas:
+            chave = (timezone.localtime(linha["created_at"]).date(), linha.get("status") or "")
+            agregados[chave]["total"] += 1
+            for campo in campos_soma:
+                agregados[chave]["somas"][campo] += linha.get(campo) or 0
+
+        for (dia, status), valores in agregados.items():
+            rollup, _ = LogDailyRollup.objects.select_for_update().get_or_create(
+                tabela=nome, dia=dia, status=status
+            )
+            rollup.acumular(valores["total"], dict(valores["somas"]))
+            rollup.save(update_fields=["total", "somas", "updated_at"])
+
+
+class DashboardCounterService:
+    """Leitura dos contadores do dashboard e reconciliação com as tabelas de origem."""
+
+    @staticmethod
+    def modelos_contabilizados():
+        return [
+            model for model in apps.get_models()
+            if issubclass(model, DashboardCounterMixin) and model.metrica_dashboard
+        ]
+
+    def resumo(self, dias: int = 7) -> dict:
+        desde = dia_local() - timedelta(days=max(dias, 1) - 1)
+        metricas = {
+            model.metrica_dashboard: {"por_dia": {}, "totais": {}}
+            for model in self.modelos_contabilizados()
+        }
+        for contador in DashboardCounter.objects.filter(dia__gte=desde):
+            metrica = metricas.setdefault(contador.metrica, {"por_dia": {}, "totais": {}})
+            metrica["por_dia"].setdefault(contador.dia.isoformat(), {})[contador.status] = contador.valor
+            metrica["totais"][contador.status] = metrica["totais"].get(contador.status, 0) + contador.valor
+        return {"desde": desde.isoformat(), "metricas": metricas}
+
+    def recalcular(self, dias: int = 7) -> dict:
+        """
+        Refaz os contadores dos últimos `dias` com COUNT ... GROUP BY.
+        Corrige deriva (ex.: transição gravada com instância desatualizada);
+        dias mais antigos que a retenção dos logs não devem ser recalculados.
+        """
+        desde = dia_local() - timedelta(days=max(dias, 1) - 1)
+        resumo = {}
+        for model in self.modelos_contabilizados():
+            campo = model.campo_status_dashboard
+            linhas = (
+                model.objects.annotate(dia=TruncDate("created_at"))
+                .filter(dia__gte=desde)
+                .values("dia", campo)
+                .annotate(total=Count("pk"))
+                .order_by()
+            )
+            novos = [
+                DashboardCounter(
+                    metrica=model.metrica_dashboard, dia=linha["dia"], status=linha[campo], valor=linha["total"]
+                )
+                for linha in linhas
+            ]
+            with transaction.atomic():
+                DashboardCounter.objects.filter(metrica=model.metrica_dashboard, dia__gte=desde).delete()
+                DashboardCounter.objects.bulk_create(novos)
+            resumo[model.metrica_dashboard] = len(novos)
+        return resumo
@@ -0,0 +1,46 @@
+from celery import shared_task
+import logging
+
+from django.utils import timezone
+
+from .models import IdempotencyKey
+from .periodic import tarefa_periodica
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+@tarefa_periodica(lock_ttl=30 * 60, checar_filas=False)
+def limpar_chaves_idempotencia_task():
+    """Task periódica: remove chaves de idempotência expiradas."""
+    removidas, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    logger.info("Chaves de idempotência expiradas removidas: %s", removidas)
+    return {"removidas": removidas}
+
+
+@shared_task
+@tarefa_periodica(lock_ttl=2 * 60 * 60, checar_filas=False)
+def aplicar_retencao_logs_task():
+    """
+    Task periódica: compacta as tabelas de log conforme LOG_RETENTION_POLICIES
+    (agregado diário + exportação JSONL gzip + exclusão em lotes).
+    """
+    from .services import LogRetentionService
+
+    resumo = LogRetentionService().aplicar()
+    logger.info("Retenção de logs concluída: %s", resumo)
+    return resumo
+
+
+@shared_task
+@tarefa_periodica(lock_ttl=60 * 60, checar_filas=False)
+def recalcular_contadores_dashboard_task(dias: int = 7):
+    """
+    Task periódica (ex.: diária): reconcilia os contadores incrementais do
+    dashboard com as tabelas de origem. Também serve de carga inicial.
+    """
+    from .services import DashboardCounterService
+
+    resumo = DashboardCounterService().recalcular(dias=dias)
+    logger.info("Contadores do dashboard recalculados: %s", resumo)
+    return resumo
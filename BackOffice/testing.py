@@ -0,0 +1,66 @@
+# BackOffice/testing.py
+
+import re
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+# Comandos de controle de transação não contam no orçamento (variam por backend)
+_CONTROLE = re.compile(r"^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT|BEGIN|COMMIT)", re.I)
+
+
+def explicar(sql: str) -> list[str]:
+    """
+    Plano de execução da consulta no banco atual.
+    No Postgres, desliga seq scan na sessão: se ainda assim aparecer um
+    Seq Scan, não existe índice utilizável (tabelas de teste são pequenas
+    demais para o planner preferir índice por conta própria).
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            with transaction.atomic():
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("EXPLAIN " + sql)
+                return [linha[0] for linha in cursor.fetchall()]
+        if connection.vendor == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return [linha[-1] for linha in cursor.fetchall()]
+    return []
+
+
+def varreduras_sequenciais(plano: list[str], tabela: str) -> list[str]:
+    if connection.vendor == "postgresql":
+        padrao = re.compile(rf"Seq Scan on {re.escape(tabela)}\b")
+    else:
+        # SQLite: SCAN percorre a tabela (ou um índice) inteira; SEARCH usa a chave do índice
+        padrao = re.compile(rf"^SCAN {re.escape(tabela)}\b")
+    return [linha for linha in plano if padrao.search(linha.strip())]
+
+
+class QueryBudgetMixin:
+    """
+    Asserções para pontos de entrada de serviço: número máximo de queries
+    (pega N+1) e ausência de varredura sequencial nas tabelas quentes
+    (pega índice faltando ou filtro que deixou de casar com o índice parcial).
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries: int, tabelas: tuple[str, ...] = ()):
+        with CaptureQueriesContext(connection) as ctx:
+            yield ctx
+
+        queries = [q["sql"] for q in ctx.captured_queries if not _CONTROLE.match(q["sql"])]
+        if len(queries) > max_queries:
+            listagem = "\n".join(f"{i}. {sql}" for i, sql in enumerate(queries, 1))
+            self.fail(f"{len(queries)} queries executadas, orçamento {max_queries}:\n{listagem}")
+
+        for sql in queries:
+            if not sql.lstrip().upper().startswith("SELECT") or " WHERE " not in sql.upper():
+                continue
+            for tabela in tabelas:
+                if f'"{tabela}"' not in sql:
+                    continue
+                scans = varreduras_sequenciais(explicar(sql), tabela)
+                if scans:
+                    self.fail(f"Varredura sequencial em {tabela}: {scans}\nSQL: {sql}")
@@ -1,3 +1,854 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import logging
+import marshal
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from purchase_orders.models import PurchaseOrderClosureLog
+from purchase_orders.services import PurchaseOrderClosureService
+from .dead_letters import DeadLetterReplayService, assinatura_falha
+from .logging_pipeline import AmostragemDebugFilter, FilaHandler
+from .models import (
+    DashboardCounter,
+    DeadLetterTask,
+    IdempotencyKey,
+    LogDailyRollup,
+    PeriodicTaskRun,
+    ProfilingRule,
+    RequestProfile,
+)
+from .periodic import PREFIXO_LOCK, JitterScheduler
+from . import tracing
+from .progress import MemoryBackend, Progresso, canal
+from .services import DashboardCounterService, LogRetentionService
+from .testing import QueryBudgetMixin
+
+
+class IdempotencyKeyTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("operador", password="x")
+        self.client.force_authenticate(self.user)
+        self.url = reverse("attachments-transferir")
+        self.payload = {"origem_id": 1, "destino_id": 2, "assincrono": True}
+
+    @patch("attachments.views.transferir_anexos_task.delay")
+    def test_replay_da_resposta_armazenada(self, mock_delay):
+        mock_delay.return_value.id = "task-1"
+
+        primeira = self.client.post(self.url, self.payload, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        segunda = self.client.post(self.url, self.payload, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+
+        self.assertEqual(primeira.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(segunda.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(segunda.json(), primeira.json())
+        self.assertEqual(segunda["Idempotent-Replayed"], "true")
+        mock_delay.assert_called_once()
+
+    @patch("attachments.views.transferir_anexos_task.delay")
+    def test_mesma_chave_com_outro_payload_e_rejeitada(self, mock_delay):
+        mock_delay.return_value.id = "task-1"
+        self.client.post(self.url, self.payload, format="json", HTTP_IDEMPOTENCY_KEY="k2")
+
+        outro = dict(self.payload, destino_id=3)
+        resp = self.client.post(self.url, outro, format="json", HTTP_IDEMPOTENCY_KEY="k2")
+
+        self.assertEqual(resp.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        mock_delay.assert_called_once()
+
+    @patch("attachments.views.transferir_anexos_task.delay")
+    def test_chave_expirada_executa_de_novo(self, mock_delay):
+        mock_delay.return_value.id = "task-1"
+        self.client.post(self.url, self.payload, format="json", HTTP_IDEMPOTENCY_KEY="k3")
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.client.post(self.url, self.payload, format="json", HTTP_IDEMPOTENCY_KEY="k3")
+
+        self.assertEqual(mock_delay.call_count, 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    @patch("BackOffice.idempotency.time.sleep")
+    @patch("attachments.views.transferir_anexos_task.delay")
+    def test_duplicata_em_andamento_recebe_409(self, mock_delay, _sleep):
+        request_hash = hashlib.sha256(json.dumps(self.payload, sort_keys=True).encode()).hexdigest()
+        IdempotencyKey.objects.create(
+            escopo=f"{self.user.pk}:POST:{self.url}", chave="k4",
+            request_hash=request_hash, expires_at=timezone.now() + timedelta(hours=1),
+        )
+        with self.settings(IDEMPOTENCY_WAIT_SECONDS=0):
+            resp = self.client.post(self.url, self.payload, format="json", HTTP_IDEMPOTENCY_KEY="k4")
+
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(resp["Retry-After"], "0")
+        mock_delay.assert_not_called()
+
+    @patch("BackOffice.idempotency.time.sleep")
+    @patch("attachments.views.transferir_anexos_task.delay")
+    def test_execucao_longa_com_batimento_nao_e_abandonada(self, mock_delay, _sleep):
+        mock_delay.return_value.id = "task-1"
+        request_hash = hashlib.sha256(json.dumps(self.payload, sort_keys=True).encode()).hexdigest()
+        registro = IdempotencyKey.objects.create(
+            escopo=f"{self.user.pk}:POST:{self.url}", chave="k5",
+            request_hash=request_hash, expires_at=timezone.now() + timedelta(hours=1),
+        )
+        # Criada há muito mais que IDEMPOTENCY_LOCK_SECONDS, mas ainda batendo
+        IdempotencyKey.objects.filter(pk=registro.pk).update(created_at=timezone.now() - timedelta(hours=1))
+
+        with self.settings(IDEMPOTENCY_WAIT_SECONDS=0, IDEMPOTENCY_LOCK_SECONDS=300):
+            viva = self.client.post(self.url, self.payload, format="json", HTTP_IDEMPOTENCY_KEY="k5")
+            IdempotencyKey.objects.filter(pk=registro.pk).update(updated_at=timezone.now() - timedelta(seconds=301))
+            abandonada = self.client.post(self.url, self.payload, format="json", HTTP_IDEMPOTENCY_KEY="k5")
+
+        self.assertEqual(viva.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(abandonada.status_code, status.HTTP_202_ACCEPTED)
+        mock_delay.assert_called_once()
+
+
+class IdempotencyHeartbeatTests(TransactionTestCase):
+    @override_settings(IDEMPOTENCY_HEARTBEAT_SECONDS=0.05)
+    def test_batimento_renova_a_chave_enquanto_a_view_roda(self):
+        from .idempotency import _batimento
+
+        registro = IdempotencyKey.objects.create(
+            escopo="1:POST:/api/x/", chave="hb", request_hash="h",
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+        IdempotencyKey.objects.filter(pk=registro.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        with _batimento(registro):
+            time.sleep(0.3)
+
+        registro.refresh_from_db()
+        self.assertFalse(registro.abandonada)
+
+
+class LogRetentionTests(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+
+    def _log(self, status_log, dias_atras, tentativas=1):
+        log = PurchaseOrderClosureLog.objects.create(
+            numero_pedido="PO1", numero_nf_servico="1", id_nf_servico=1,
+            status=status_log, tentativas=tentativas, detalhes={"x": 1},
+        )
+        PurchaseOrderClosureLog.objects.filter(pk=log.pk).update(
+            created_at=timezone.now() - timedelta(days=dias_atras)
+        )
+        return log
+
+    def test_compacta_exporta_e_apaga_em_lotes(self):
+        antigos = [self._log("success", 200, tentativas=2) for _ in range(3)]
+        pendente_antigo = self._log("pending", 200)
+        recente = self._log("success", 1)
+        politicas = {
+            "purchase_orders.PurchaseOrderClosureLog": {
+                "dias": 180, "status": ["success", "failed"], "somar": ["tentativas"], "arquivar": True,
+            }
+        }
+
+        with self.settings(LOG_RETENTION_ARCHIVE_DIR=self.archive_dir):
+            resumo = LogRetentionService(politicas=politicas, batch_size=2).aplicar()
+
+        resultado = resumo["purchase_orders.PurchaseOrderClosureLog"]
+        self.assertEqual(resultado["removidos"], 3)
+        self.assertEqual(resultado["lotes"], 2)
+        self.assertEqual(
+            set(PurchaseOrderClosureLog.objects.values_list("id", flat=True)),
+            {pendente_antigo.id, recente.id},
+        )
+
+        rollup = LogDailyRollup.objects.get(tabela="purchase_orders.PurchaseOrderClosureLog", status="success")
+        self.assertEqual(rollup.total, 3)
+        self.assertEqual(rollup.somas, {"tentativas": 6})
+
+        with gzip.open(resultado["arquivo"], "rt", encoding="utf-8") as fh:
+            exportados = [json.loads(linha) for linha in fh]
+        self.assertEqual(sorted(l["id"] for l in exportados), sorted(l.id for l in antigos))
+
+
+class HotQueryPlanTests(QueryBudgetMixin, TestCase):
+    """Orçamento de queries e planos dos pontos de entrada que varrem trabalho pendente."""
+
+    def setUp(self):
+        from attachments.models import AttachmentTransferLog
+
+        # Volume morto (status final) para que um filtro sem índice apareça no plano
+        AttachmentTransferLog.objects.bulk_create(
+            AttachmentTransferLog(origem_id=i, destino_id=i, status="success") for i in range(50)
+        )
+        PurchaseOrderClosureLog.objects.bulk_create(
+            PurchaseOrderClosureLog(numero_pedido=f"PO{i}", numero_nf_servico="1", id_nf_servico=1, status="success")
+            for i in range(50)
+        )
+
+    @patch("attachments.services.OmieAPIClient")
+    def test_processar_transferencias_pendentes(self, _client):
+        from attachments.services import AttachmentTransferService
+
+        with self.assertQueryBudget(1, tabelas=("attachment_transfer_log",)):
+            AttachmentTransferService().processar_transferencias_pendentes()
+
+    @patch("attachments.services.OmieAPIClient")
+    def test_registrar_mapeamento_existente(self, _client):
+        from attachments.models import AttachmentIntegrationMap, AttachmentTransferLog
+        from attachments.services import AttachmentTransferService
+
+        AttachmentIntegrationMap.objects.create(origem_recebimento_id=700, destino_conta_pagar_id=700)
+        falho = AttachmentTransferLog.objects.create(origem_id=700, destino_id=700, status="failed")
+        with self.assertQueryBudget(2, tabelas=("attachment_transfer_log", "attachment_integration_map")):
+            log = AttachmentTransferService().registrar_mapeamento_para_transferencia(700, 700)
+        self.assertEqual(log.pk, falho.pk)
+
+    @patch("purchase_orders.services.OmieAPIClient")
+    def test_reprocessar_falhas_encerramento(self, _client):
+        with self.assertQueryBudget(1, tabelas=("purchase_order_closure_log",)):
+            PurchaseOrderClosureService().reprocessar_falhas()
+
+    @patch("purchase_orders.services.OmieAPIClient")
+    def test_consolidar_encerramentos_sem_pendentes(self, _client):
+        with self.assertQueryBudget(1, tabelas=("purchase_order_closure_log",)):
+            PurchaseOrderClosureService().consolidar_encerramentos("PO1")
+
+    def test_reverificacao_full_flow(self):
+        from purchase_orders.services import FullFlowPurchaseOrderService
+
+        with self.assertQueryBudget(1, tabelas=("purchase_orders_purchaseorderintegration",)):
+            FullFlowPurchaseOrderService(omie_client=MagicMock()).processar_pedidos_pendentes()
+
+    def test_reprocessar_outbox_e_webhooks(self):
+        from omie_api.tasks import reprocessar_webhooks_pendentes_task
+        from purchase_orders.tasks import reprocessar_outbox_pendentes_task
+
+        # 1 SELECT por task + INSERT/UPDATE do PeriodicTaskRun de cada execução
+        with self.assertQueryBudget(6, tabelas=("purchase_order_outbox", "omie_webhook_event")):
+            reprocessar_outbox_pendentes_task()
+            reprocessar_webhooks_pendentes_task()
+
+    def _omie_encerramento(self, MockClient):
+        omie = MockClient.return_value
+        omie.po_close_status = "Encerrado"
+        omie.consultar_pedido_compra.return_value = {"cStatus": "Aberto"}
+        omie.encerrar_pedido_compra.return_value = {"ok": True}
+        return omie
+
+    @patch("purchase_orders.services.OmieAPIClient")
+    def test_encerrar_pedidos_em_lote(self, MockClient):
+        self._omie_encerramento(MockClient)
+        solicitacoes = [
+            {"numero_pedido": f"LOTE{i % 5}", "item_pedido": f"{i:03d}", "numero_nf_servico": "NF", "id_nf_servico": i}
+            for i in range(40)
+        ]
+        # Constante no tamanho do lote: índice local + bulk de logs + upsert do
+        # índice (quando há encerrados) + contador do dashboard (UPDATE e, no 1º do dia, INSERT)
+        with self.assertQueryBudget(5, tabelas=("purchase_order_closure_log", "purchase_order_closed_index")):
+            logs = PurchaseOrderClosureService().encerrar_pedidos_em_lote(solicitacoes)
+        self.assertEqual(len(logs), 40)
+
+    @patch("purchase_orders.services.OmieAPIClient")
+    def test_consolidar_encerramentos_com_pendentes(self, MockClient):
+        self._omie_encerramento(MockClient)
+        PurchaseOrderClosureLog.objects.bulk_create(
+            PurchaseOrderClosureLog(
+                numero_pedido="PO-C", item_pedido=f"{i:03d}", numero_nf_servico="NF", id_nf_servico=i,
+                status="pending", detalhes={"coalescido": True},
+            )
+            for i in range(20)
+        )
+        # Reserva (SELECT FOR UPDATE + UPDATE) + releitura + índice + bulk_update, mais
+        # UPDATE/INSERT dos contadores a cada transição (pending → processing → success)
+        with self.assertQueryBudget(12, tabelas=("purchase_order_closure_log",)):
+            logs = PurchaseOrderClosureService().consolidar_encerramentos("PO-C")
+        self.assertEqual({log.status for log in logs}, {"success"})
+
+    @patch("purchase_orders.services.OmieAPIClient")
+    def test_recuperar_encerramentos_coalescidos(self, _client):
+        # Presos em processing + pedidos pendentes além da janela (sem presos: sem UPDATE)
+        with self.assertQueryBudget(2, tabelas=("purchase_order_closure_log",)):
+            PurchaseOrderClosureService().recuperar_encerramentos_coalescidos()
+
+    @override_settings(FULL_FLOW_SPOOL_DIR=tempfile.gettempdir())
+    def test_processar_outbox(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from purchase_orders.services import FullFlowPurchaseOrderService
+
+        omie = MagicMock()
+        omie.incluir_pedido_compra.return_value = {"nCodPed": 4321}
+        service = FullFlowPurchaseOrderService(omie_client=omie)
+        with patch("purchase_orders.tasks.processar_outbox_pedido_task.delay"):
+            outbox = service.enfileirar_pedido_com_anexos(
+                {"cCodIntPed": "PO-BUDGET"},
+                [SimpleUploadedFile(f"{i}.pdf", b"%PDF") for i in range(5)],
+            )
+        self.addCleanup(shutil.rmtree, Path(tempfile.gettempdir()) / "PO-BUDGET", ignore_errors=True)
+
+        # Leitura + claim (UPDATE condicional + releitura) + pedido (get_or_create + vínculo)
+        # + anexos (SELECT + bulk_update + AttachmentSyncLog + contador) + status final
+        with self.assertQueryBudget(12, tabelas=("purchase_order_outbox", "purchase_order_outbox_file")):
+            resultado = service.processar_outbox(outbox.id)
+        self.assertEqual(resultado.status, "success")
+
+    @patch("purchase_orders.services.OmieClient.call")
+    def test_sincronizar_fornecedores(self, mock_call):
+        from purchase_orders.services import SupplierSyncService
+
+        mock_call.return_value = {"total_de_paginas": 1, "clientes_cadastro": [
+            {"codigo_cliente_omie": i, "razao_social": f"Fornecedor {i}", "cnpj_cpf": f"{i:014d}",
+             "info": {"dAlt": "10/01/2025", "hAlt": "08:00:00"}}
+            for i in range(1, 101)
+        ]}
+        # Marca d'água + um upsert por página (o SQLite o divide pelo limite de parâmetros)
+        with self.assertQueryBudget(3, tabelas=("supplier",)):
+            resumo = SupplierSyncService().sincronizar()
+        self.assertEqual(resumo["gravados"], 100)
+
+
+class DashboardCounterTests(APITestCase):
+    def _contadores(self, metrica):
+        return dict(DashboardCounter.objects.filter(metrica=metrica).values_list("status", "valor"))
+
+    def test_transicoes_movem_a_contagem_entre_status(self):
+        from attachments.models import AttachmentTransferLog
+
+        log = AttachmentTransferLog.objects.create(origem_id=1, destino_id=2)
+        self.assertEqual(self._contadores("transferencias_anexos"), {"pending": 1})
+
+        log.mark_as_processing()
+        log.mark_as_success([{"nome": "a.pdf"}])
+        self.assertEqual(
+            self._contadores("transferencias_anexos"), {"pending": 0, "processing": 0, "success": 1}
+        )
+
+        # Salvar de novo sem mudar status não conta duas vezes
+        log = AttachmentTransferLog.objects.get(pk=log.pk)
+        log.save()
+        self.assertEqual(self._contadores("transferencias_anexos")["success"], 1)
+
+    def test_recalcular_confere_com_incremental_e_endpoint(self):
+        from attachments.models import AttachmentSyncLog
+
+        for status_log in ("success", "success", "failed"):
+            AttachmentSyncLog.objects.create(
+                origem_tabela="pedido-compra", origem_id=1, destino_tabela="pedido-compra",
+                destino_id=1, metodo="robo", nome_arquivo="a.pdf", status=status_log,
+            )
+        incremental = self._contadores("sincronizacao_anexos")
+
+        DashboardCounterService().recalcular(dias=1)
+        self.assertEqual(self._contadores("sincronizacao_anexos"), incremental)
+
+        self.client.force_authenticate(get_user_model().objects.create_user("ops", password="x"))
+        resp = self.client.get(reverse("dashboard-counters"), {"dias": 7})
+        self.assertEqual(resp.data["metricas"]["sincronizacao_anexos"]["totais"], {"success": 2, "failed": 1})
+
+
+class ProgressStreamTests(TestCase):
+    def setUp(self):
+        self.backend = MemoryBackend()
+        patcher = patch("BackOffice.progress._backend", self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _eventos(self, nome):
+        return [dados for _, dados in self.backend._depois_de(nome, None)]
+
+    @patch("attachments.services.OmieAPIClient")
+    def test_transferencia_publica_evento_por_arquivo(self, MockClient):
+        from attachments.services import AttachmentTransferService
+
+        client = MockClient.return_value
+        client.listar_anexos.side_effect = [
+            [{"cNomeArquivo": "a.pdf", "nTamanho": 10}],
+            [{"cNomeArquivo": "a.pdf", "nIdAnexo": 1, "nTamanho": 10},
+             {"cNomeArquivo": "b.pdf", "nIdAnexo": 2, "nTamanho": 20}],
+        ]
+        client.obter_anexo.return_value = {"cArquivo": "ZmFrZQ=="}
+
+        log = AttachmentTransferService().transferir_anexos(1, 2, progresso=Progresso(canal("task", "t1")))
+
+        eventos = self._eventos(canal("transfer", log.id))
+        arquivos = [(e["nome"], e["status"], e["bytes"]) for e in eventos if e["tipo"] == "arquivo"]
+        self.assertEqual(arquivos, [("a.pdf", "duplicado", 0), ("b.pdf", "done", 20)])
+        self.assertTrue(eventos[-1]["final"])
+        self.assertEqual(eventos[-1]["bytes_transferidos"], 20)
+        # O mesmo fluxo é espelhado no canal da task
+        self.assertEqual(len(self._eventos(canal("task", "t1"))), len(eventos))
+
+    async def test_stream_sse_retoma_do_last_event_id_e_encerra_no_final(self):
+        user = await get_user_model().objects.acreate_user("sse", password="x")
+        await self.async_client.aforce_login(user)
+        nome = canal("outbox", 7)
+        self.backend.definir_dono(nome, user.pk)
+        primeiro = self.backend.publicar(nome, {"tipo": "pedido"})
+        self.backend.publicar(nome, {"tipo": "arquivo", "nome": "x.pdf", "status": "done", "bytes": 3})
+        self.backend.publicar(nome, {"tipo": "fim", "status": "success", "final": True})
+
+        resposta = await self.async_client.get(
+            reverse("progress-stream", args=["outbox", 7]), headers={"Last-Event-ID": primeiro}
+        )
+        corpo = "".join([
+            chunk.decode() if isinstance(chunk, bytes) else chunk
+            async for chunk in resposta.streaming_content
+        ])
+
+        self.assertEqual(resposta["Content-Type"], "text/event-stream")
+        dados = [json.loads(linha[6:]) for linha in corpo.splitlines() if linha.startswith("data: ")]
+        self.assertEqual([d["tipo"] for d in dados], ["arquivo", "fim"])
+
+    async def _corpo(self, resposta):
+        corpo = "".join([
+            chunk.decode() if isinstance(chunk, bytes) else chunk
+            async for chunk in resposta.streaming_content
+        ])
+        return [json.loads(linha[6:]) for linha in corpo.splitlines() if linha.startswith("data: ")]
+
+    @override_settings(PROGRESS_STREAM_MAX_SECONDS=0)
+    async def test_stream_comeca_na_tentativa_atual(self):
+        user = await get_user_model().objects.acreate_user("sse2", password="x")
+        await self.async_client.aforce_login(user)
+        nome = canal("outbox", 8)
+        self.backend.definir_dono(nome, user.pk)
+        self.backend.publicar(nome, {"tipo": "inicio", "tentativa": 1})
+        self.backend.publicar(nome, {"tipo": "fim", "status": "failed", "final": True})
+        self.backend.publicar(nome, {"tipo": "inicio", "tentativa": 2})
+        self.backend.publicar(nome, {"tipo": "pedido"})
+
+        resposta = await self.async_client.get(reverse("progress-stream", args=["outbox", 8]))
+
+        dados = await self._corpo(resposta)
+        self.assertEqual([(d["tipo"], d.get("tentativa")) for d in dados], [("inicio", 2), ("pedido", None)])
+
+    async def test_stream_so_para_o_dono_ou_staff(self):
+        modelo = get_user_model()
+        dono = await modelo.objects.acreate_user("dono", password="x")
+        outro = await modelo.objects.acreate_user("outro", password="x")
+        staff = await modelo.objects.acreate_user("staff", password="x", is_staff=True)
+        nome = canal("task", "t-dono")
+        self.backend.definir_dono(nome, dono.pk)
+        self.backend.publicar(nome, {"tipo": "fim", "status": "success", "final": True})
+        url = reverse("progress-stream", args=["task", "t-dono"])
+
+        await self.async_client.aforce_login(outro)
+        self.assertEqual((await self.async_client.get(url)).status_code, 403)
+        # Canal sem dono registrado: só staff
+        self.assertEqual(
+            (await self.async_client.get(reverse("progress-stream", args=["task", "sem-dono"]))).status_code, 403
+        )
+        for usuario in (dono, staff):
+            await self.async_client.aforce_login(usuario)
+            resposta = await self.async_client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            await self._corpo(resposta)
+
+    async def test_redis_reutiliza_cliente_e_nunca_bloqueia_para_sempre(self):
+        from .progress import RedisBackend
+
+        backend = RedisBackend("redis://localhost:6379/15")
+        cliente = MagicMock()
+
+        async def xread(streams, block, count):
+            return []
+
+        cliente.xread = MagicMock(side_effect=xread)
+        with patch("redis.asyncio.Redis.from_url", return_value=cliente) as criar:
+            await backend.ler("outbox:1", None, timeout=0.0004)
+            await backend.ler("outbox:1", None, timeout=2)
+
+        criar.assert_called_once()
+        self.assertEqual([c.kwargs["block"] for c in cliente.xread.call_args_list], [1, 2000])
+
+    async def test_stream_exige_autenticacao_e_tipo_valido(self):
+        resposta = await self.async_client.get(reverse("progress-stream", args=["outbox", 1]))
+        self.assertEqual(resposta.status_code, 401)
+        resposta = await self.async_client.get(reverse("progress-stream", args=["outro", 1]))
+        self.assertEqual(resposta.status_code, 404)
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=False, BACKPRESSURE_SOFT_DEPTH=100, BACKPRESSURE_HARD_DEPTH=1000,
+    BACKPRESSURE_MAX_AGE_SECONDS=300, BACKPRESSURE_RETRY_AFTER_SECONDS=30,
+)
+class BackpressureTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = get_user_model().objects.create_user("operador", password="x")
+        self.client.force_authenticate(self.user)
+
+    def _filas(self, profundidade, idade=None):
+        return patch(
+            "BackOffice.backpressure._ler_broker",
+            return_value={"celery": {"profundidade": profundidade, "idade_segundos": idade}},
+        )
+
+    @patch("attachments.views.transferir_anexos_task.delay")
+    def test_enfileiramento_recusado_acima_dos_limites(self, mock_delay):
+        url = reverse("attachments-transferir")
+        payload = {"origem_id": 1, "destino_id": 2, "assincrono": True}
+
+        with self._filas(150):
+            resposta = self.client.post(url, payload, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual(resposta.status_code, 429)
+        self.assertEqual(resposta["Retry-After"], "30")
+        # 429 não fica gravado na chave de idempotência
+        self.assertFalse(IdempotencyKey.objects.filter(chave="k1").exists())
+
+        cache.clear()
+        with self._filas(10, idade=900):
+            resposta = self.client.post(url, payload, format="json")
+        self.assertEqual(resposta.status_code, 503)
+        mock_delay.assert_not_called()
+
+    def test_task_periodica_pula_ciclo_com_fila_cheia(self):
+        from attachments.tasks import processar_transferencias_pendentes_task
+
+        with self._filas(150), patch("attachments.tasks.AttachmentTransferService") as MockService:
+            resultado = processar_transferencias_pendentes_task()
+
+        self.assertTrue(resultado["pulado"])
+        MockService.assert_not_called()
+
+    def test_metricas_por_fila(self):
+        with self._filas(42, idade=12.5):
+            resposta = self.client.get(reverse("queue-metrics"), {"formato": "prometheus"})
+            json_resposta = self.client.get(reverse("queue-metrics")).json()
+
+        self.assertIn('backoffice_celery_queue_depth{queue="celery"} 42', resposta.content.decode())
+        self.assertEqual(json_resposta["filas"]["celery"]["profundidade"], 42)
+        self.assertIsNone(json_resposta["sobrecarga"])
+
+
+class DeadLetterTests(APITestCase):
+    @patch("attachments.tasks.AttachmentTransferService")
+    def test_task_esgotada_vai_para_dead_letter(self, MockService):
+        from attachments.tasks import transferir_anexos_task
+
+        MockService.return_value.transferir_anexos.return_value = MagicMock(
+            status="failed", mensagem_erro="Erro HTTP ao chamar Omie: 503 pedido 123"
+        )
+
+        # retries=max_retries: a próxima retentativa já estoura o limite
+        resultado = transferir_anexos_task.apply(args=(1, 2), retries=3)
+
+        self.assertTrue(resultado.failed())
+        registro = DeadLetterTask.objects.get()
+        self.assertEqual(registro.task_name, "attachments.tasks.transferir_anexos_task")
+        self.assertEqual(registro.args, [1, 2])
+        self.assertEqual(registro.tentativas, 3)
+        self.assertEqual(registro.status, "pending")
+        self.assertIn("<n>", registro.excecao)
+
+    def _dead_letter(self, mensagem):
+        assinatura, texto = assinatura_falha(Exception(mensagem))
+        return DeadLetterTask.objects.create(
+            task_name="attachments.tasks.transferir_anexos_task", task_id="t", args=[1, 2],
+            assinatura=assinatura, excecao=texto, mensagem_erro=mensagem,
+        )
+
+    def test_replay_agrupado_e_escalonado(self):
+        from celery import current_app
+
+        for numero in (1, 2, 3):
+            self._dead_letter(f"timeout no pedido {numero}")
+        outra = self._dead_letter("faultstring: cliente bloqueado")
+
+        self.assertEqual([g["total"] for g in DeadLetterReplayService.grupos()], [3, 1])
+
+        task = current_app.tasks["attachments.tasks.transferir_anexos_task"]
+        with patch.object(task, "apply_async") as mock_apply:
+            resumo = DeadLetterReplayService(tamanho_lote=2, taxa_por_segundo=1).reenfileirar()
+
+        self.assertEqual(resumo["reenfileiradas"], 4)
+        self.assertEqual(resumo["lotes"], 2)
+        self.assertEqual(sorted(c.kwargs["countdown"] for c in mock_apply.call_args_list), [0, 0, 2, 2])
+        self.assertEqual(
+            {c.kwargs["headers"]["dead_letter_id"] for c in mock_apply.call_args_list},
+            set(DeadLetterTask.objects.values_list("id", flat=True)),
+        )
+        outra.refresh_from_db()
+        self.assertEqual(outra.status, "replaying")
+
+    def test_api_lista_grupos_e_faz_dry_run(self):
+        self.client.force_authenticate(get_user_model().objects.create_user("op", password="x"))
+        self._dead_letter("timeout no pedido 9")
+
+        grupos = self.client.get(reverse("dead-letters")).json()["grupos"]
+        resposta = self.client.post(reverse("dead-letters-replay"), {"dry_run": True}, format="json")
+
+        self.assertEqual(grupos[0]["total"], 1)
+        self.assertEqual(resposta.status_code, 202)
+        self.assertEqual(resposta.json()["reenfileiradas"], 1)
+        self.assertEqual(DeadLetterTask.objects.get().status, "pending")
+
+
+class PeriodicTaskTests(TestCase):
+    NOME = "attachments.tasks.processar_transferencias_pendentes_task"
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    @patch("attachments.tasks.AttachmentTransferService")
+    def test_registra_duracao_e_libera_lock(self, MockService):
+        from attachments.tasks import processar_transferencias_pendentes_task
+
+        MockService.return_value.processar_transferencias_pendentes.return_value = []
+        processar_transferencias_pendentes_task()
+
+        execucao = PeriodicTaskRun.objects.get(task_name=self.NOME)
+        self.assertEqual(execucao.status, "success")
+        self.assertIsNotNone(execucao.duracao_ms)
+        self.assertIsNone(cache.get(PREFIXO_LOCK + self.NOME))
+
+    @patch("attachments.tasks.AttachmentTransferService")
+    def test_pula_se_execucao_anterior_em_andamento(self, MockService):
+        from attachments.tasks import processar_transferencias_pendentes_task
+
+        cache.add(PREFIXO_LOCK + self.NOME, "outro-worker", 60)
+        resultado = processar_transferencias_pendentes_task()
+
+        self.assertTrue(resultado["pulado"])
+        MockService.assert_not_called()
+        self.assertEqual(PeriodicTaskRun.objects.get(task_name=self.NOME).status, "skipped")
+        # O lock do outro worker continua lá
+        self.assertEqual(cache.get(PREFIXO_LOCK + self.NOME), "outro-worker")
+
+    @patch("attachments.tasks.AttachmentTransferService")
+    def test_falha_registrada_e_lock_liberado(self, MockService):
+        from attachments.tasks import processar_transferencias_pendentes_task
+
+        MockService.return_value.processar_transferencias_pendentes.side_effect = RuntimeError("boom")
+        with self.assertRaises(RuntimeError):
+            processar_transferencias_pendentes_task()
+
+        execucao = PeriodicTaskRun.objects.get(task_name=self.NOME)
+        self.assertEqual((execucao.status, execucao.mensagem_erro), ("failed", "boom"))
+        self.assertIsNone(cache.get(PREFIXO_LOCK + self.NOME))
+
+    def test_jitter_vira_countdown_sem_alterar_a_agenda(self):
+        from DjangoProject.celery import app
+
+        scheduler = JitterScheduler(app, lazy=True)
+        entrada = scheduler.Entry(
+            name="x", task="attachments.tasks.processar_transferencias_pendentes_task",
+            schedule=300, options={"jitter": 30, "expires": 240}, app=app,
+        )
+        scheduler._store = {"entries": {"x": entrada}}
+        with patch.object(app.tasks[entrada.task], "apply_async") as mock_apply, \
+                patch.object(scheduler, "should_sync", return_value=False):
+            scheduler.apply_async(entrada)
+
+        opcoes = mock_apply.call_args.kwargs
+        self.assertNotIn("jitter", opcoes)
+        self.assertTrue(0 <= opcoes["countdown"] <= 30)
+        self.assertEqual(scheduler.schedule["x"].options, {"jitter": 30, "expires": 240})
+
+
+class LoggingPipelineTests(TestCase):
+    def _registro(self, nivel, msg, *args, **extra):
+        registro = logging.LogRecord("attachments.services", nivel, __file__, 1, msg, args, None)
+        registro.__dict__.update(extra)
+        return registro
+
+    def test_amostragem_so_afeta_debug(self):
+        filtro = AmostragemDebugFilter(taxa=5)
+
+        debug = [filtro.filter(self._registro(logging.DEBUG, "call=%s", n)) for n in range(20)]
+        info = [filtro.filter(self._registro(logging.INFO, "x")) for _ in range(20)]
+
+        self.assertEqual(sum(debug), 4)
+        self.assertTrue(all(info))
+
+    def test_handler_grava_json_com_extras_em_arquivo_do_processo(self):
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio, ignore_errors=True)
+        handler = FilaHandler(diretorio, prefixo="teste", console=False)
+        try:
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                registro = self._registro(logging.ERROR, "Falha %s->%s", 1, 2, origem_id=1, log_id=7)
+                registro.exc_info = sys.exc_info()
+                handler.handle(registro)
+        finally:
+            handler.parar()
+
+        (arquivo,) = Path(diretorio).glob("teste-*.jsonl")
+        linha = json.loads(arquivo.read_text().strip())
+        self.assertEqual(linha["message"], "Falha 1->2")
+        self.assertEqual((linha["origem_id"], linha["log_id"]), (1, 7))
+        self.assertIn("ValueError: boom", linha["exc_info"])
+
+
+class TracingTests(APITestCase):
+    TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+    PAI_ID = "00f067aa0ba902b7"
+
+    def setUp(self):
+        self.exportados = []
+        patcher = patch.object(tracing.exportador, "info", side_effect=lambda msg, extra: self.exportados.append(extra["span"]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = get_user_model().objects.create_user("operador", password="x")
+        self.client.force_authenticate(self.user)
+
+    def _span(self, nome):
+        return next(s for s in self.exportados if s.nome == nome)
+
+    @patch.dict(os.environ, {"OMIE_APP_KEY": "k", "OMIE_APP_SECRET": "s"})
+    @patch("omie_api.client.sessao_http")
+    def test_trace_da_requisicao_chega_ao_servico_e_as_chamadas_omie(self, mock_sessao):
+        mock_sessao.return_value.post.return_value.json.return_value = {"listaAnexos": []}
+
+        resposta = self.client.post(
+            reverse("attachments-transferir"), {"origem_id": 1, "destino_id": 2}, format="json",
+            HTTP_TRACEPARENT=f"00-{self.TRACE_ID}-{self.PAI_ID}-01",
+        )
+
+        self.assertEqual(resposta["X-Trace-Id"], self.TRACE_ID)
+        raiz = self._span("POST /api/attachments/transferir/")
+        servico = self._span("attachments.transferir_anexos")
+        omie = [s for s in self.exportados if s.nome == "omie ListarAnexo"]
+        self.assertEqual(raiz.parent_id, self.PAI_ID)
+        self.assertEqual(servico.parent_id, raiz.span_id)
+        self.assertEqual(len(omie), 2)
+        self.assertTrue(all(s.parent_id == servico.span_id and s.trace_id == self.TRACE_ID for s in omie))
+        self.assertEqual(servico.atributos["origem_id"], 1)
+        self.assertGreater(servico.atributos["db.queries"], 0)
+
+    def test_traceparent_atravessa_o_header_celery(self):
+        headers = {}
+        with tracing.span("publicador") as publicador:
+            tracing.injetar_traceparent(headers=headers)
+
+        request = MagicMock(retries=0, traceparent=headers["traceparent"])
+        task = MagicMock(request=request)
+        task.name = "attachments.tasks.transferir_anexos_task"
+        tracing.iniciar_span_task(task_id="t1", task=task)
+        self.assertEqual(tracing.span_atual().parent_id, publicador.span_id)
+        tracing.encerrar_span_task(task_id="t1", state="SUCCESS")
+
+        span_task = self._span("celery attachments.tasks.transferir_anexos_task")
+        self.assertEqual(span_task.trace_id, publicador.trace_id)
+        self.assertIsNone(tracing.span_atual())
+
+    def test_endpoint_monta_caminho_critico(self):
+        diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, diretorio, ignore_errors=True)
+        with tracing.span("POST /api/x/") as raiz:
+            with tracing.span("rapido"):
+                pass
+            with tracing.span("lento"):
+                with tracing.span("omie ConsultarPedCompra"):
+                    time.sleep(0.01)
+        formatter = tracing.OTLPSpanFormatter()
+        linhas = [formatter.format(logging.makeLogRecord({"span": s})) for s in self.exportados]
+        Path(diretorio, "traces-1.jsonl").write_text("\n".join(linhas) + "\n")
+
+        with override_settings(LOG_DIR=diretorio):
+            resposta = self.client.get(reverse("trace-detail", args=[raiz.trace_id]))
+            ausente = self.client.get(reverse("trace-detail", args=["0" * 32]))
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.data["spans"]), 4)
+        self.assertEqual(
+            [s["nome"] for s in resposta.data["caminho_critico"]],
+            ["POST /api/x/", "lento", "omie ConsultarPedCompra"],
+        )
+        self.assertEqual(ausente.status_code, 404)
+
+
+@override_settings(PROFILING_HEADER_SECRET="segredo")
+@patch.dict(os.environ, {"OMIE_APP_KEY": "k", "OMIE_APP_SECRET": "s"})
+@patch("omie_api.client.sessao_http")
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = get_user_model().objects.create_user("operador", password="x")
+        self.client.force_authenticate(self.user)
+        self.url = reverse("attachments-transferir")
+
+    def _transferir(self, mock_sessao, **headers):
+        mock_sessao.return_value.post.return_value.json.return_value = {"listaAnexos": []}
+        return self.client.post(self.url, {"origem_id": 1, "destino_id": 2}, format="json", **headers)
+
+    def test_header_com_segredo_grava_perfil_com_sql_e_omie(self, mock_sessao):
+        resposta = self._transferir(mock_sessao, HTTP_X_PROFILE="segredo")
+
+        perfil = RequestProfile.objects.get(pk=resposta["X-Profile-Id"])
+        self.assertEqual((perfil.motivo, perfil.status_code), ("header", 200))
+        self.assertEqual(perfil.omie_chamadas, 2)
+        self.assertEqual({c["call"] for c in perfil.omie_detalhes}, {"ListarAnexo"})
+        self.assertGreater(perfil.sql_queries, 0)
+        self.assertEqual(perfil.trace_id, resposta["X-Trace-Id"])
+        self.assertIn("transferir_anexos", perfil.resumo)
+
+    def test_sem_segredo_nao_perfila(self, mock_sessao):
+        resposta = self._transferir(mock_sessao, HTTP_X_PROFILE="chute")
+
+        self.assertNotIn("X-Profile-Id", resposta)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    async def test_asgi_perfila_a_view_sincrona(self, mock_sessao):
+        mock_sessao.return_value.post.return_value.json.return_value = {"listaAnexos": []}
+        await self.async_client.aforce_login(self.user)
+
+        resposta = await self.async_client.post(
+            self.url, {"origem_id": 1, "destino_id": 2}, content_type="application/json",
+            headers={"X-Profile": "segredo"},
+        )
+
+        perfil = await RequestProfile.objects.aget(pk=resposta["X-Profile-Id"])
+        self.assertEqual((perfil.motivo, perfil.status_code, perfil.omie_chamadas), ("header", 200, 2))
+        self.assertIn("transferir_anexos", perfil.resumo)
+
+    @patch("attachments.views.AsyncOmieAPIClient")
+    async def test_asgi_view_async_sinaliza_que_nao_perfilou(self, MockClient, mock_sessao):
+        MockClient.return_value.incluir_anexo = AsyncMock(return_value={"nIdAnexo": 1})
+
+        resposta = await self.async_client.post(
+            reverse("attachments-incluir"),
+            {"tabela": "pedido-compra", "n_id": 10, "nome_arquivo": "a.pdf", "arquivo_base64": "eA=="},
+            content_type="application/json", headers={"X-Profile": "segredo"},
+        )
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta["X-Profile-Skipped"], "async-view")
+        self.assertNotIn("X-Profile-Id", resposta)
+        self.assertFalse(await RequestProfile.objects.aexists())
+
+    def test_regra_do_admin_download_e_comparacao(self, mock_sessao):
+        ProfilingRule.objects.create(rota_prefixo="/api/attachments/", taxa=1.0)
+        self._transferir(mock_sessao)
+        self._transferir(mock_sessao)
+        perfis = list(RequestProfile.objects.order_by("id"))
+        self.assertEqual([p.motivo for p in perfis], ["regra", "regra"])
+
+        admin = get_user_model().objects.create_superuser("admin", password="x")
+        self.client.force_login(admin)
+        download = self.client.get(reverse("admin:BackOffice_requestprofile_download", args=[perfis[0].pk]))
+        comparacao = self.client.post(
+            reverse("admin:BackOffice_requestprofile_changelist"),
+            {"action": "comparar", "_selected_action": [p.pk for p in perfis]},
+        )
+
+        self.assertIn(".prof", download["Content-Disposition"])
+        self.assertIn("transferir_anexos", str(marshal.loads(download.content).keys()))
+        self.assertEqual(comparacao.status_code, 200)
+        self.assertContains(comparacao, "Funções com maior variação")
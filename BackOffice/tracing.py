@@ -0,0 +1,372 @@
+# BackOffice/tracing.py
+
+import json
+import logging
+import random
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Logger dedicado aos spans concluídos: vai para o arquivo traces-<pid>.jsonl (ver LOGGING)
+exportador = logging.getLogger("BackOffice.tracing.spans")
+
+HEADER_TRACEPARENT = "traceparent"
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_span_atual: ContextVar["Span | None"] = ContextVar("span_atual", default=None)
+# Lista que recebe os spans concluídos dentro de coletar_spans() (ex.: profiling)
+_coletor: ContextVar[list | None] = ContextVar("coletor_spans", default=None)
+
+
+class Span:
+    """Trecho de uma operação (request, task, chamada Omie...) com início, fim e atributos."""
+
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "nome", "tipo", "amostrado",
+        "inicio_ns", "fim_ns", "atributos", "erro", "db_queries", "db_ms",
+    )
+
+    def __init__(self, nome: str, trace_id: str, parent_id: str | None, amostrado: bool, tipo: str = "INTERNAL"):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.nome = nome
+        self.tipo = tipo
+        self.amostrado = amostrado
+        self.inicio_ns = time.time_ns()
+        self.fim_ns = None
+        self.atributos: dict = {}
+        self.erro: str | None = None
+        self.db_queries = 0
+        self.db_ms = 0.0
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.amostrado else '00'}"
+
+    def finalizar(self, erro: BaseException | None = None):
+        self.fim_ns = time.time_ns()
+        if erro is not None:
+            self.erro = f"{type(erro).__name__}: {erro}"
+        if self.db_queries:
+            self.atributos["db.queries"] = self.db_queries
+            self.atributos["db.tempo_ms"] = round(self.db_ms, 2)
+        if self.amostrado:
+            exportador.info(self.nome, extra={"span": self})
+        coletor = _coletor.get()
+        if coletor is not None:
+            coletor.append(self)
+
+    @property
+    def duracao_ms(self) -> float:
+        return ((self.fim_ns or time.time_ns()) - self.inicio_ns) / 1e6
+
+    def otlp(self) -> dict:
+        """Span no formato OTLP/JSON (o mesmo do file exporter do OpenTelemetry Collector)."""
+        dados = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.nome,
+            "kind": f"SPAN_KIND_{self.tipo}",
+            "startTimeUnixNano": str(self.inicio_ns),
+            "endTimeUnixNano": str(self.fim_ns or time.time_ns()),
+            "attributes": [_atributo_otlp(chave, valor) for chave, valor in self.atributos.items()],
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.erro} if self.erro else {"code": "STATUS_CODE_OK"},
+        }
+        if self.parent_id:
+            dados["parentSpanId"] = self.parent_id
+        return dados
+
+
+def _atributo_otlp(chave: str, valor) -> dict:
+    if isinstance(valor, bool):
+        return {"key": chave, "value": {"boolValue": valor}}
+    if isinstance(valor, int):
+        return {"key": chave, "value": {"intValue": str(valor)}}
+    if isinstance(valor, float):
+        return {"key": chave, "value": {"doubleValue": valor}}
+    return {"key": chave, "value": {"stringValue": str(valor)}}
+
+
+def _valor_otlp(valor: dict):
+    for tipo, bruto in valor.items():
+        return int(bruto) if tipo == "intValue" else bruto
+    return None
+
+
+def span_atual() -> Span | None:
+    return _span_atual.get()
+
+
+def _novo_span(nome: str, traceparent: str | None = None, tipo: str = "INTERNAL") -> Span:
+    pai = _span_atual.get()
+    if pai is not None:
+        return Span(nome, pai.trace_id, pai.span_id, pai.amostrado, tipo)
+    casado = _TRACEPARENT.match(traceparent or "")
+    if casado:
+        trace_id, parent_id, flags = casado.groups()
+        return Span(nome, trace_id, parent_id, flags == "01", tipo)
+    amostrado = settings.TRACING_ENABLED and random.random() < settings.TRACING_SAMPLE_RATE
+    return Span(nome, secrets.token_hex(16), None, amostrado, tipo)
+
+
+@contextmanager
+def span(nome: str, traceparent: str | None = None, tipo: str = "INTERNAL", **atributos):
+    """
+    Abre um span filho do atual (ou raiz, continuando `traceparent` se houver).
+    Também funciona como decorator: @span("attachments.transferir_anexos").
+    """
+    atual = _novo_span(nome, traceparent, tipo)
+    atual.atributos.update(atributos)
+    token = _span_atual.set(atual)
+    try:
+        yield atual
+    except BaseException as exc:
+        atual.finalizar(exc)
+        raise
+    else:
+        atual.finalizar()
+    finally:
+        _span_atual.reset(token)
+
+
+@contextmanager
+def coletar_spans():
+    """Junta numa lista os spans concluídos no bloco, amostrados ou não (inclusive em threads filhas)."""
+    coletados: list[Span] = []
+    token = _coletor.set(coletados)
+    try:
+        yield coletados
+    finally:
+        _coletor.reset(token)
+
+
+def anotar(**atributos):
+    """Acrescenta atributos ao span atual (ex.: log_id depois de criado)."""
+    atual = _span_atual.get()
+    if atual is not None:
+        atual.atributos.update({chave: valor for chave, valor in atributos.items() if valor is not None})
+
+
+# ---------- Django: middleware e SQL ----------
+
+
+class TracingMiddleware:
+    """
+    Span raiz de cada requisição da API. Continua o `traceparent` recebido
+    (W3C) e devolve `traceparent` e `X-Trace-Id` na resposta.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _rastrear(self, request) -> bool:
+        return request.path.startswith("/api/")
+
+    def _abrir(self, request):
+        return span(
+            f"{request.method} {request.path}",
+            traceparent=request.headers.get(HEADER_TRACEPARENT),
+            tipo="SERVER",
+            **{"http.method": request.method, "http.target": request.get_full_path()},
+        )
+
+    def _concluir(self, request, resposta, atual: Span):
+        rota = getattr(getattr(request, "resolver_match", None), "route", None)
+        if rota:
+            # Nome pela rota (sem ids): agrupa as requisições do mesmo endpoint
+            atual.nome = f"{request.method} /{rota.replace('^', '').replace('$', '')}"
+        atual.atributos["http.status_code"] = resposta.status_code
+        if resposta.status_code >= 500:
+            atual.erro = f"HTTP {resposta.status_code}"
+        resposta[HEADER_TRACEPARENT] = atual.traceparent
+        resposta["X-Trace-Id"] = atual.trace_id
+        return resposta
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._rastrear(request):
+            return self.get_response(request)
+        with self._abrir(request) as atual:
+            return self._concluir(request, self.get_response(request), atual)
+
+    async def __acall__(self, request):
+        if not self._rastrear(request):
+            return await self.get_response(request)
+        with self._abrir(request) as atual:
+            return self._concluir(request, await self.get_response(request), atual)
+
+
+def _medir_sql(execute, sql, params, many, context):
+    atual = _span_atual.get()
+    if atual is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        atual.db_queries += 1
+        atual.db_ms += (time.perf_counter() - inicio) * 1000
+
+
+def instrumentar_conexao(sender=None, connection=None, **kwargs):
+    """connection_created: soma quantidade e tempo das queries ao span atual."""
+    if _medir_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_sql)
+
+
+class TraceFilter(logging.Filter):
+    """Carimba trace_id/span_id em todo registro de log emitido dentro de um span."""
+
+    def filter(self, record):
+        atual = _span_atual.get()
+        if atual is not None:
+            record.trace_id = atual.trace_id
+            record.span_id = atual.span_id
+        return True
+
+
+# ---------- Celery: propagação pelos headers ----------
+
+_spans_task: dict[str, tuple[Span, object]] = {}
+
+
+def injetar_traceparent(sender=None, headers=None, **kwargs):
+    """before_task_publish: a task enfileirada continua o trace de quem publicou."""
+    atual = _span_atual.get()
+    if headers is not None and atual is not None:
+        headers.setdefault(HEADER_TRACEPARENT, atual.traceparent)
+
+
+def iniciar_span_task(sender=None, task_id=None, task=None, **kwargs):
+    if task is None:
+        return
+    request = task.request
+    traceparent = getattr(request, HEADER_TRACEPARENT, None) or (getattr(request, "headers", None) or {}).get(HEADER_TRACEPARENT)
+    atual = _novo_span(f"celery {task.name}", traceparent, "CONSUMER")
+    atual.atributos.update({"celery.task_id": task_id, "celery.retries": request.retries or 0})
+    _spans_task[task_id] = (atual, _span_atual.set(atual))
+
+
+def encerrar_span_task(sender=None, task_id=None, state=None, **kwargs):
+    registro = _spans_task.pop(task_id, None)
+    if registro is None:
+        return
+    atual, token = registro
+    atual.atributos["celery.state"] = state or ""
+    if state == "FAILURE":
+        atual.erro = atual.erro or "FAILURE"
+    atual.finalizar()
+    try:
+        _span_atual.reset(token)
+    except ValueError:
+        # Token de outro contexto (pool de threads): só limpa o span
+        _span_atual.set(None)
+
+
+def registrar_excecao_task(sender=None, task_id=None, exception=None, **kwargs):
+    registro = _spans_task.get(task_id)
+    if registro is not None and exception is not None:
+        registro[0].erro = f"{type(exception).__name__}: {exception}"
+
+
+# ---------- Exportação (OTLP/JSON) e leitura ----------
+
+
+class OTLPSpanFormatter(logging.Formatter):
+    """Uma linha por span no formato resourceSpans do OTLP/JSON."""
+
+    def format(self, record):
+        atual = getattr(record, "span", None)
+        if atual is None:
+            return json.dumps({"message": record.getMessage()})
+        return json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    _atributo_otlp("service.name", settings.TRACING_SERVICE_NAME),
+                    _atributo_otlp("process.pid", record.process),
+                ]},
+                "scopeSpans": [{"scope": {"name": "BackOffice.tracing"}, "spans": [atual.otlp()]}],
+            }]
+        }, ensure_ascii=False)
+
+
+def carregar_trace(trace_id: str, diretorio: str | None = None) -> list[dict]:
+    """Spans do trace lidos dos arquivos traces-*.jsonl de todos os processos."""
+    spans = []
+    for arquivo in sorted(Path(diretorio or settings.LOG_DIR).glob("traces-*.jsonl*")):
+        try:
+            with open(arquivo, encoding="utf-8") as linhas:
+                for linha in linhas:
+                    if trace_id not in linha:
+                        continue
+                    for recurso in json.loads(linha).get("resourceSpans", []):
+                        for escopo in recurso.get("scopeSpans", []):
+                            spans += [s for s in escopo.get("spans", []) if s.get("traceId") == trace_id]
+        except (OSError, ValueError):
+            logger.warning("Arquivo de trace ilegível: %s", arquivo, exc_info=True)
+    return spans
+
+
+def resumir_trace(spans: list[dict]) -> dict:
+    """
+    Árvore do trace com tempos relativos e o caminho crítico: a partir da raiz,
+    segue sempre o filho que termina por último (o que segurou o pai).
+    """
+    if not spans:
+        return {"spans": [], "caminho_critico": [], "duracao_ms": 0}
+    por_id = {s["spanId"]: s for s in spans}
+    filhos: dict[str | None, list[dict]] = {}
+    for s in spans:
+        pai = s.get("parentSpanId")
+        filhos.setdefault(pai if pai in por_id else None, []).append(s)
+
+    inicio_trace = min(int(s["startTimeUnixNano"]) for s in spans)
+    fim_trace = max(int(s["endTimeUnixNano"]) for s in spans)
+
+    def _linha(s, profundidade):
+        inicio, fim = int(s["startTimeUnixNano"]), int(s["endTimeUnixNano"])
+        return {
+            "span_id": s["spanId"],
+            "parent_id": s.get("parentSpanId"),
+            "nome": s["name"],
+            "profundidade": profundidade,
+            "inicio_ms": round((inicio - inicio_trace) / 1e6, 2),
+            "duracao_ms": round((fim - inicio) / 1e6, 2),
+            "erro": (s.get("status") or {}).get("message"),
+            "atributos": {a["key"]: _valor_otlp(a["value"]) for a in s.get("attributes", [])},
+        }
+
+    arvore = []
+
+    def _percorrer(s, profundidade):
+        arvore.append(_linha(s, profundidade))
+        for filho in sorted(filhos.get(s["spanId"], []), key=lambda f: int(f["startTimeUnixNano"])):
+            _percorrer(filho, profundidade + 1)
+
+    raizes = sorted(filhos.get(None, []), key=lambda s: int(s["startTimeUnixNano"]))
+    for raiz in raizes:
+        _percorrer(raiz, 0)
+
+    caminho = []
+    atual = max(raizes, key=lambda s: int(s["endTimeUnixNano"]))
+    while atual is not None:
+        caminho.append(_linha(atual, len(caminho)))
+        proximos = filhos.get(atual["spanId"])
+        atual = max(proximos, key=lambda s: int(s["endTimeUnixNano"])) if proximos else None
+
+    return {"duracao_ms": round((fim_trace - inicio_trace) / 1e6, 2), "spans": arvore, "caminho_critico": caminho}
@@ -1,5 +1,19 @@
+import json
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .backpressure import avaliar, estado_filas, metricas_prometheus
+from .dead_letters import DeadLetterReplayService
+from .progress import TIPOS_CANAL, canal, obter_backend, pode_assistir
+from .services import DashboardCounterService
+from .tracing import carregar_trace, resumir_trace
 
 
 @login_required
@@ -26,3 +40,159 @@ def purchase_orders_page(request):
         "api_base": "/api/purchase-orders/",
     }
     return render(request, "pages/purchase_orders.html", context)
+
+
+class DashboardCountersView(APIView):
+    """
+    Contadores do dashboard por métrica, dia e status (tabela DashboardCounter).
+    GET /api/dashboard/counters/?dias=7
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            dias = min(int(request.query_params.get("dias", 7)), 90)
+        except (TypeError, ValueError):
+            dias = 7
+        return Response(DashboardCounterService().resumo(dias=dias))
+
+
+class QueueMetricsView(APIView):
+    """
+    Profundidade e idade da mensagem mais antiga por fila Celery.
+    GET /api/metrics/queues/  (?formato=prometheus para exposição em texto)
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        estado = estado_filas()
+        if request.query_params.get("formato") == "prometheus":
+            return HttpResponse(metricas_prometheus(estado), content_type="text/plain; version=0.0.4")
+        sobrecarga = avaliar(estado)
+        return Response({
+            "filas": estado,
+            "sobrecarga": None if sobrecarga is None else {
+                "status_code": sobrecarga.status_code,
+                "fila": sobrecarga.fila,
+                "motivo": sobrecarga.motivo,
+            },
+            "limites": {
+                "profundidade_429": settings.BACKPRESSURE_SOFT_DEPTH,
+                "profundidade_503": settings.BACKPRESSURE_HARD_DEPTH,
+                "idade_503_segundos": settings.BACKPRESSURE_MAX_AGE_SECONDS,
+            },
+        })
+
+
+class DeadLetterView(APIView):
+    """
+    GET  /api/dead-letters/         grupos pendentes por assinatura de falha
+    POST /api/dead-letters/replay/  {"assinatura"?, "task_name"?, "ids"?, "limite"?, "lote"?, "taxa_por_segundo"?, "forcar"?, "dry_run"?}
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({"grupos": DeadLetterReplayService.grupos(request.query_params.get("status", "pending"))})
+
+    def post(self, request):
+        dados = request.data
+        try:
+            service = DeadLetterReplayService(
+                tamanho_lote=int(dados["lote"]) if dados.get("lote") else None,
+                taxa_por_segundo=float(dados["taxa_por_segundo"]) if dados.get("taxa_por_segundo") else None,
+            )
+            limite = int(dados["limite"]) if dados.get("limite") else None
+        except (TypeError, ValueError):
+            return Response({"erro": "lote, limite e taxa_por_segundo devem ser numéricos"}, status=400)
+
+        resumo = service.reenfileirar(
+            assinatura=dados.get("assinatura"),
+            task_name=dados.get("task_name"),
+            ids=dados.get("ids") or None,
+            limite=limite,
+            forcar=bool(dados.get("forcar", False)),
+            dry_run=bool(dados.get("dry_run", False)),
+        )
+        if resumo.get("recusado"):
+            resposta = Response({"erro": "Filas sobrecarregadas", **resumo}, status=503)
+            resposta["Retry-After"] = str(settings.BACKPRESSURE_RETRY_AFTER_SECONDS)
+            return resposta
+        return Response(resumo, status=202)
+
+
+class TraceView(APIView):
+    """
+    Spans de um trace (trace_id do header X-Trace-Id/traceparent) em árvore,
+    com o caminho crítico: a cadeia de spans que determinou a duração total.
+    GET /api/traces/<trace_id>/
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, trace_id):
+        spans = carregar_trace(trace_id.lower())
+        if not spans:
+            return Response({"erro": "Trace não encontrado"}, status=404)
+        return Response({"trace_id": trace_id.lower(), **resumir_trace(spans)})
+
+
+async def progress_stream(request, tipo, identificador):
+    """
+    Stream SSE de progresso de uma transferência, outbox ou task.
+    GET /api/progress/<tipo>/<id>/stream/ (tipo: transfer, outbox, task)
+
+    Reenvia o histórico da tentativa atual (a partir do último evento "inicio":
+    um retry não termina no "fim" da tentativa que falhou) e segue com os
+    eventos novos até um evento final (ou PROGRESS_STREAM_MAX_SECONDS). O
+    navegador reconecta sozinho enviando Last-Event-ID; `?last_event_id=`
+    tem o mesmo efeito. Só quem disparou o trabalho (ou staff) assiste.
+    Exige servidor ASGI: sob WSGI cada stream prende um worker inteiro.
+    """
+    if tipo not in TIPOS_CANAL:
+        return HttpResponse(status=404)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+
+    nome = canal(tipo, identificador)
+    if not await pode_assistir(nome, user):
+        return HttpResponse(status=403)
+    ultimo_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    backend = obter_backend()
+    heartbeat = settings.PROGRESS_HEARTBEAT_SECONDS
+
+    def formatar(evento_id, dados):
+        return f"id: {evento_id}\ndata: {json.dumps(dados, default=str)}\n\n"
+
+    async def eventos():
+        nonlocal ultimo_id
+        fim = time.monotonic() + settings.PROGRESS_STREAM_MAX_SECONDS
+        yield "retry: 3000\n\n"
+        if not ultimo_id:
+            historico = await backend.historico(nome)
+            inicios = [i for i, (_, dados) in enumerate(historico) if dados.get("tipo") == "inicio"]
+            for evento_id, dados in historico[inicios[-1] if inicios else 0:]:
+                yield formatar(evento_id, dados)
+                if dados.get("final"):
+                    return
+            if historico:
+                ultimo_id = historico[-1][0]
+        while time.monotonic() < fim:
+            lidos = await backend.ler(nome, ultimo_id, timeout=min(heartbeat, fim - time.monotonic()))
+            if not lidos:
+                # Comentário SSE: mantém proxies e balanceadores com a conexão aberta
+                yield ": keepalive\n\n"
+                continue
+            for evento_id, dados in lidos:
+                ultimo_id = evento_id
+                yield formatar(evento_id, dados)
+                if dados.get("final"):
+                    return
+
+    resposta = StreamingHttpResponse(eventos(), content_type="text/event-stream")
+    resposta["Cache-Control"] = "no-cache"
+    resposta["X-Accel-Buffering"] = "no"
+    return resposta
@@ -0,0 +1,157 @@
+# BackOffice/viewsets.py
+
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import serializers, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+# Campos cujo valor cru de .values() precisa da mesma formatação do serializer
+_FORMATADOS = (serializers.DateTimeField, serializers.DateField, serializers.DecimalField, serializers.UUIDField)
+
+
+def parametro_booleano(request, nome: str, padrao: bool = False) -> bool:
+    """
+    Flag do corpo (JSON ou form-data) com a mesma regra do BooleanField:
+    "false"/"0"/"off" viram False. Valor não reconhecido -> 400.
+    """
+    valor = request.data.get(nome)
+    if valor is None or valor == "":
+        return padrao
+    try:
+        return serializers.BooleanField().to_internal_value(valor)
+    except ValidationError as exc:
+        raise ValidationError({nome: exc.detail}) from exc
+
+
+class LeanListMixin:
+    """
+    `list` enxuto para ReadOnlyModelViewSet: busca só as colunas de
+    `Meta.list_fields` do serializer via `.values()` (sem instanciar modelos)
+    e monta os dicionários diretamente. Colunas pesadas ficam em
+    `Meta.expandable_fields` e entram com `?expand=a,b`; `?fields=a,b`
+    escolhe exatamente as colunas. `retrieve` continua com o serializer completo.
+    """
+
+    fields_query_param = "fields"
+    expand_query_param = "expand"
+
+    def _colunas_listagem(self) -> list[str]:
+        meta = self.get_serializer_class().Meta
+        padrao = list(meta.list_fields)
+        permitidas = padrao + list(getattr(meta, "expandable_fields", ()))
+
+        pedidas = self._parametro_lista(self.fields_query_param)
+        expandir = self._parametro_lista(self.expand_query_param)
+        invalidas = [c for c in pedidas + expandir if c not in permitidas]
+        if invalidas:
+            raise ValidationError({"fields": f"Campos não disponíveis: {', '.join(invalidas)}"})
+
+        colunas = pedidas or padrao
+        colunas = colunas + [c for c in expandir if c not in colunas]
+        # id e created_at sustentam o cursor da paginação
+        for obrigatoria in ("created_at", "id"):
+            if obrigatoria not in colunas:
+                colunas.insert(0, obrigatoria)
+        return colunas
+
+    def _parametro_lista(self, nome: str) -> list[str]:
+        valor = self.request.query_params.get(nome) or ""
+        return [c.strip() for c in valor.split(",") if c.strip()]
+
+    def _formatadores(self, colunas: list[str]) -> dict:
+        campos = self.get_serializer().fields
+        return {
+            coluna: campos[coluna].to_representation
+            for coluna in colunas
+            if coluna in campos and isinstance(campos[coluna], _FORMATADOS)
+        }
+
+    def list(self, request, *args, **kwargs):
+        colunas = self._colunas_listagem()
+        queryset = self.filter_queryset(self.get_queryset()).values(*colunas)
+        formatadores = self._formatadores(colunas)
+
+        def representar(linhas):
+            for linha in linhas:
+                for coluna, formatar in formatadores.items():
+                    if linha[coluna] is not None:
+                        linha[coluna] = formatar(linha[coluna])
+            return linhas
+
+        pagina = self.paginate_queryset(queryset)
+        if pagina is not None:
+            # O cursor é calculado antes da formatação (usa o datetime original)
+            return self.get_paginated_response(representar([dict(linha) for linha in pagina]))
+        return Response(representar(list(queryset)))
+
+
+class ConditionalListMixin:
+    """
+    Validadores baratos para `list`. Com paginação por cursor, a ETag sai de
+    (id, updated_at) das linhas da própria página (mesmo índice e LIMIT da
+    listagem, sem COUNT nem agregado sobre a tabela inteira): inclusão,
+    alteração ou remoção de algo que a página mostra muda a ETag; mudanças em
+    outras páginas não. Sem paginação por cursor, cai num aggregate
+    (COUNT + MAX(updated_at)) do queryset filtrado. Se o cliente já tem a
+    versão atual, responde 304 sem serializar nada. Com
+    API_LIST_CACHE_SECONDS > 0, o corpo fica em cache pela própria ETag
+    (que já inclui usuário, parâmetros e versão dos dados).
+    `total_aproximado` (?total=1) é estimativa e não entra na ETag.
+    """
+
+    campo_versao = "updated_at"
+
+    def _versao_dados(self, queryset) -> tuple[str, object]:
+        paginador = self.paginator
+        if hasattr(paginador, "chaves_pagina"):
+            linhas = paginador.chaves_pagina(queryset, self.request, self.campo_versao)
+            versoes = [versao for _, versao in linhas if versao is not None]
+            assinatura = ",".join(f"{pk}@{versao.isoformat() if versao else ''}" for pk, versao in linhas)
+            return assinatura, max(versoes) if versoes else None
+        agregado = queryset.aggregate(total=Count("pk"), ultimo=Max(self.campo_versao))
+        ultimo = agregado["ultimo"]
+        return f"{agregado['total']}:{ultimo.isoformat() if ultimo else ''}", ultimo
+
+    def _versao_listagem(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        assinatura, ultimo = self._versao_dados(queryset)
+        usuario = self.request.user.pk if self.request.user.is_authenticated else "anon"
+        parametros = urlencode(sorted(self.request.query_params.lists()), doseq=True)
+        chave = ":".join([queryset.model._meta.label, str(usuario), parametros, assinatura])
+        return 'W/"%s"' % hashlib.sha1(chave.encode("utf-8")).hexdigest(), ultimo
+
+    def _nao_modificado(self, etag: str, ultimo) -> bool:
+        if_none_match = self.request.headers.get("If-None-Match")
+        if if_none_match:
+            return etag in [valor.strip() for valor in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = parse_http_date_safe(self.request.headers.get("If-Modified-Since") or "")
+        return bool(ultimo and if_modified_since and int(ultimo.timestamp()) <= if_modified_since)
+
+    def _com_validadores(self, resposta, etag: str, ultimo):
+        resposta["ETag"] = etag
+        if ultimo:
+            resposta["Last-Modified"] = http_date(ultimo.timestamp())
+        resposta["Cache-Control"] = "private, no-cache"
+        return resposta
+
+    def list(self, request, *args, **kwargs):
+        etag, ultimo = self._versao_listagem()
+        if self._nao_modificado(etag, ultimo):
+            return self._com_validadores(Response(status=status.HTTP_304_NOT_MODIFIED), etag, ultimo)
+
+        ttl = settings.API_LIST_CACHE_SECONDS
+        chave_cache = f"api-list:{etag}"
+        dados = cache.get(chave_cache) if ttl > 0 else None
+        if dados is not None:
+            resposta = Response(dados)
+        else:
+            resposta = super().list(request, *args, **kwargs)
+            if ttl > 0 and resposta.status_code == status.HTTP_200_OK:
+                cache.set(chave_cache, resposta.data, ttl)
+        return self._com_validadores(resposta, etag, ultimo)
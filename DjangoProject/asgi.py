@@ -3,6 +3,11 @@ ASGI config for DjangoProject project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Os streams SSE de progresso (/api/progress/<tipo>/<id>/stream/) e as views
+que repassam chamadas à Omie (ex.: /api/attachments/incluir/) são assíncronas
+e devem ser servidas por este entrypoint (ex.: uvicorn
+DjangoProject.asgi:application); sob WSGI cada conexão ocupa um worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
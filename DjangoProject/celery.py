@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.schedules import crontab
 
 # Define o módulo de settings padrão do Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'DjangoProject.settings')
@@ -13,6 +14,72 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Descobre automaticamente tasks em apps registrados
 app.autodiscover_tasks()
 
+# Agenda das tasks periódicas (celery -A DjangoProject beat).
+# `jitter`: atraso aleatório de até N segundos por disparo (ver JitterScheduler),
+# para que tasks com o mesmo intervalo não batam na Omie no mesmo segundo.
+# `expires`: se a mensagem não for consumida a tempo o ciclo é descartado; o
+# próximo disparo do beat cobre o mesmo trabalho.
+# Sobreposição (execução anterior ainda rodando) é tratada na própria task por
+# BackOffice.periodic.tarefa_periodica.
+app.conf.beat_scheduler = 'BackOffice.periodic:JitterScheduler'
+app.conf.beat_schedule = {
+    'robo-sincronizar-pedidos': {
+        'task': 'purchase_orders.tasks.robo_sincronizar_pedidos',
+        'schedule': 10 * 60,
+        'options': {'jitter': 60, 'expires': 9 * 60},
+    },
+    'full-flow-pedidos-pendentes': {
+        'task': 'purchase_orders.tasks.full_flow_processar_pedidos_pendentes',
+        'schedule': 5 * 60,
+        'options': {'jitter': 30, 'expires': 4 * 60},
+    },
+    'reprocessar-outbox-pendentes': {
+        'task': 'purchase_orders.tasks.reprocessar_outbox_pendentes_task',
+        'schedule': 5 * 60,
+        'options': {'jitter': 30, 'expires': 4 * 60},
+    },
+    'recuperar-encerramentos-coalescidos': {
+        'task': 'purchase_orders.tasks.recuperar_encerramentos_coalescidos_task',
+        'schedule': 5 * 60,
+        'options': {'jitter': 30, 'expires': 4 * 60},
+    },
+    'reprocessar-falhas-encerramento': {
+        'task': 'purchase_orders.tasks.reprocessar_falhas_task',
+        'schedule': 15 * 60,
+        'options': {'jitter': 90, 'expires': 14 * 60},
+    },
+    'processar-transferencias-pendentes': {
+        'task': 'attachments.tasks.processar_transferencias_pendentes_task',
+        'schedule': 5 * 60,
+        'options': {'jitter': 30, 'expires': 4 * 60},
+    },
+    'reprocessar-webhooks-pendentes': {
+        'task': 'omie_api.tasks.reprocessar_webhooks_pendentes_task',
+        'schedule': 5 * 60,
+        'options': {'jitter': 30, 'expires': 4 * 60},
+    },
+    'sincronizar-fornecedores': {
+        'task': 'purchase_orders.tasks.sincronizar_fornecedores_task',
+        'schedule': 60 * 60,
+        'options': {'jitter': 300, 'expires': 50 * 60},
+    },
+    'limpar-chaves-idempotencia': {
+        'task': 'BackOffice.tasks.limpar_chaves_idempotencia_task',
+        'schedule': 60 * 60,
+        'options': {'jitter': 300, 'expires': 50 * 60},
+    },
+    'aplicar-retencao-logs': {
+        'task': 'BackOffice.tasks.aplicar_retencao_logs_task',
+        'schedule': crontab(hour=3, minute=15),
+        'options': {'jitter': 600},
+    },
+    'recalcular-contadores-dashboard': {
+        'task': 'BackOffice.tasks.recalcular_contadores_dashboard_task',
+        'schedule': crontab(hour=4, minute=0),
+        'options': {'jitter': 600},
+    },
+}
+
 
 @app.task(bind=True)
 def debug_task(self):
@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
+import tempfile
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'BackOffice.tracing.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +61,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'omie_api.deadline.PrazoRequisicaoMiddleware',
+    'BackOffice.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'DjangoProject.urls'
@@ -179,49 +184,87 @@ REST_FRAMEWORK = {
 }
 
 # Logging Configuration
+# Os handlers só enfileiram (FilaHandler); uma thread por processo grava
+# o console e um arquivo JSON rotativo por processo (logs/django-<pid>.jsonl).
+# DEBUG dos apps é amostrado (1 a cada LOG_DEBUG_SAMPLE_RATE por mensagem).
+# `manage.py test` grava num diretório temporário para não sujar logs/ a cada execução
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+LOG_DIR = config(
+    'LOG_DIR',
+    default=str(Path(tempfile.gettempdir()) / 'backoffice-test-logs') if TESTING else str(BASE_DIR / 'logs'),
+)
+LOG_APP_LEVEL = config('LOG_APP_LEVEL', default='DEBUG')
+LOG_DEBUG_SAMPLE_RATE = config('LOG_DEBUG_SAMPLE_RATE', default=10, cast=int)
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)
+LOG_FILE_MAX_BYTES = config('LOG_FILE_MAX_BYTES', default=20 * 1024 * 1024, cast=int)
+LOG_FILE_BACKUPS = config('LOG_FILE_BACKUPS', default=5, cast=int)
+# Arquivos de processos que já terminaram são apagados depois de N dias
+LOG_FILE_RETENTION_DAYS = config('LOG_FILE_RETENTION_DAYS', default=7, cast=int)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '{levelname} {asctime} {module} {message}',
-            'style': '{',
+    'filters': {
+        'trace': {
+            '()': 'BackOffice.tracing.TraceFilter',
+        },
+        'amostragem_debug': {
+            '()': 'BackOffice.logging_pipeline.AmostragemDebugFilter',
+            'taxa': LOG_DEBUG_SAMPLE_RATE,
         },
     },
     'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+        'fila': {
+            '()': 'BackOffice.logging_pipeline.FilaHandler',
+            'diretorio': LOG_DIR,
+            'prefixo': 'django',
+            'max_bytes': LOG_FILE_MAX_BYTES,
+            'backups': LOG_FILE_BACKUPS,
+            'tamanho_fila': LOG_QUEUE_SIZE,
+            'retencao_dias': LOG_FILE_RETENTION_DAYS,
+            'filters': ['trace', 'amostragem_debug'],
         },
-        'file': {
-            'class': 'logging.FileHandler',
-            'filename': BASE_DIR / 'logs' / 'django.log',
-            'formatter': 'verbose',
+        # Spans concluídos, em OTLP/JSON (logs/traces-<pid>.jsonl); lidos por /api/traces/<id>/
+        'fila_traces': {
+            '()': 'BackOffice.logging_pipeline.FilaHandler',
+            'diretorio': LOG_DIR,
+            'prefixo': 'traces',
+            'max_bytes': LOG_FILE_MAX_BYTES,
+            'backups': LOG_FILE_BACKUPS,
+            'tamanho_fila': LOG_QUEUE_SIZE,
+            'retencao_dias': LOG_FILE_RETENTION_DAYS,
+            'console': False,
+            'formato_arquivo': 'BackOffice.tracing.OTLPSpanFormatter',
         },
     },
     'root': {
-        'handlers': ['console', 'file'],
+        'handlers': ['fila'],
         'level': 'INFO',
     },
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
+            'handlers': ['fila'],
             'level': 'INFO',
             'propagate': False,
         },
         'omie_api': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'handlers': ['fila'],
+            'level': LOG_APP_LEVEL,
             'propagate': False,
         },
         'attachments': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'handlers': ['fila'],
+            'level': LOG_APP_LEVEL,
             'propagate': False,
         },
         'purchase_orders': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'handlers': ['fila'],
+            'level': LOG_APP_LEVEL,
+            'propagate': False,
+        },
+        'BackOffice.tracing.spans': {
+            'handlers': ['fila_traces'],
+            'level': 'INFO',
             'propagate': False,
         },
     },
@@ -235,9 +278,179 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# O worker mantém o LOGGING acima (fila + JSON) em vez de trocar os handlers do root
+CELERY_WORKER_HIJACK_ROOT_LOGGER = False
+
+# Tasks que passam quase todo o tempo esperando a Omie vão para uma fila própria,
+# consumida por um worker de threads (celery -A DjangoProject worker -P threads -c 32 -Q omie_io).
+# Manutenção (retenção, contadores, idempotência) continua na fila padrão, em prefork.
+# Com -P threads o Celery não aplica soft_time_limit/time_limit: só o prazo cooperativo
+# das chamadas Omie (OMIE_*_DEADLINE_*) limita a duração dessas tasks (ver SETUP.md).
+CELERY_OMIE_IO_QUEUE = config('CELERY_OMIE_IO_QUEUE', default='omie_io')
+CELERY_TASK_ROUTES = {
+    'attachments.tasks.*': {'queue': CELERY_OMIE_IO_QUEUE},
+    'purchase_orders.tasks.*': {'queue': CELERY_OMIE_IO_QUEUE},
+    'omie_api.tasks.*': {'queue': CELERY_OMIE_IO_QUEUE},
+}
 
 # Omie API Configuration
 OMIE_APP_KEY = config('OMIE_APP_KEY', default='')
 OMIE_APP_SECRET = config('OMIE_APP_SECRET', default='')
 OMIE_API_BASE_URL = config('OMIE_API_BASE_URL', default='https://app.omie.com.br/api/v1/')
+# Token exigido na URL/cabeçalho do webhook (?token=... ou X-Webhook-Token). Obrigatório
+# fora do DEBUG: vazio, o webhook recusa todas as requisições. O appKey do evento deve ser OMIE_APP_KEY.
+OMIE_WEBHOOK_TOKEN = config('OMIE_WEBHOOK_TOKEN', default='')
+# Evento de webhook em `processing` sem atualização há mais que isso é considerado abandonado
+# (worker morto) e volta a ser processado; mantenha acima da duração real dos handlers
+# (transferência de anexos, encerramento), que no pool de threads não têm time limit
+OMIE_WEBHOOK_PROCESSING_TIMEOUT = config('OMIE_WEBHOOK_PROCESSING_TIMEOUT', default=30 * 60, cast=int)
+
+# Full-flow: fila de reverificação de pedidos criados pelo BackOffice
+# (backoff exponencial entre consultas ao ConsultarPedCompra)
+FULL_FLOW_RECHECK_BASE_SECONDS = config('FULL_FLOW_RECHECK_BASE_SECONDS', default=300, cast=int)
+FULL_FLOW_RECHECK_MAX_SECONDS = config('FULL_FLOW_RECHECK_MAX_SECONDS', default=6 * 60 * 60, cast=int)
+FULL_FLOW_RECHECK_BATCH_SIZE = config('FULL_FLOW_RECHECK_BATCH_SIZE', default=50, cast=int)
+FULL_FLOW_RECHECK_MAX_PER_RUN = config('FULL_FLOW_RECHECK_MAX_PER_RUN', default=500, cast=int)
+FULL_FLOW_RECHECK_MAX_WORKERS = config('FULL_FLOW_RECHECK_MAX_WORKERS', default=8, cast=int)
+
+# Full-flow: anexos ficam em spool local até o upload assíncrono na Omie
+FULL_FLOW_SPOOL_DIR = config('FULL_FLOW_SPOOL_DIR', default=str(MEDIA_ROOT / 'full_flow_spool'))
+FULL_FLOW_UPLOAD_MAX_WORKERS = config('FULL_FLOW_UPLOAD_MAX_WORKERS', default=4, cast=int)
+# Outbox em `processing` sem atualização há mais que isso é considerada abandonada
+# (worker morto) e volta a ser reenfileirada; mantenha acima da duração real da task
+# (soft_time_limit de 600s, que não é aplicado no pool de threads)
+FULL_FLOW_OUTBOX_PROCESSING_TIMEOUT = config('FULL_FLOW_OUTBOX_PROCESSING_TIMEOUT', default=15 * 60, cast=int)
+
+# Autocomplete de fornecedores: índice de prefixo em memória (por processo)
+SUPPLIER_INDEX_ENABLED = config('SUPPLIER_INDEX_ENABLED', default=True, cast=bool)
+SUPPLIER_INDEX_CHECK_SECONDS = config('SUPPLIER_INDEX_CHECK_SECONDS', default=30, cast=int)
+SUPPLIER_INDEX_MAX_BYTES = config('SUPPLIER_INDEX_MAX_BYTES', default=64 * 1024 * 1024, cast=int)
+
+# RF-002: paralelismo máximo do encerramento em lote (chamadas simultâneas à Omie)
+PO_CLOSURE_BULK_MAX_WORKERS = config('PO_CLOSURE_BULK_MAX_WORKERS', default=8, cast=int)
+
+# RF-002: janela (s) para agrupar solicitações de encerramento do mesmo pedido
+# numa única chamada à Omie; 0 desativa o agrupamento
+PO_CLOSURE_COALESCE_WINDOW_SECONDS = config('PO_CLOSURE_COALESCE_WINDOW_SECONDS', default=10, cast=int)
+# Solicitações coalescidas em `processing` há mais que isso voltam para pending e são
+# reconsolidadas (worker morto); mantenha acima da duração real de consolidar_encerramentos_task
+# (soft_time_limit de 600s, que não é aplicado no pool de threads)
+PO_CLOSURE_COALESCE_STALE_SECONDS = config('PO_CLOSURE_COALESCE_STALE_SECONDS', default=15 * 60, cast=int)
+
+# RF-002: validade (s) do índice local de pedidos já encerrados; depois disso a Omie é consultada de novo
+PO_CLOSED_INDEX_MAX_AGE_SECONDS = config('PO_CLOSED_INDEX_MAX_AGE_SECONDS', default=24 * 60 * 60, cast=int)
+
+# Idempotency-Key nos POSTs caros: validade da resposta armazenada, espera
+# máxima de duplicatas concorrentes e tempo sem batimento para considerar uma
+# execução abandonada (a requisição em andamento renova a chave a cada HEARTBEAT;
+# mantenha LOCK bem acima dele)
+IDEMPOTENCY_TTL_SECONDS = config('IDEMPOTENCY_TTL_SECONDS', default=24 * 60 * 60, cast=int)
+IDEMPOTENCY_WAIT_SECONDS = config('IDEMPOTENCY_WAIT_SECONDS', default=10, cast=int)
+IDEMPOTENCY_LOCK_SECONDS = config('IDEMPOTENCY_LOCK_SECONDS', default=300, cast=int)
+IDEMPOTENCY_HEARTBEAT_SECONDS = config('IDEMPOTENCY_HEARTBEAT_SECONDS', default=30, cast=int)
+
+# Retenção de logs: linhas antigas em status final viram agregados diários
+# (LogDailyRollup), são exportadas em JSONL gzip e apagadas em lotes
+LOG_RETENTION_ARCHIVE_DIR = config('LOG_RETENTION_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'logs'))
+LOG_RETENTION_BATCH_SIZE = config('LOG_RETENTION_BATCH_SIZE', default=1000, cast=int)
+LOG_RETENTION_MAX_BATCHES_PER_RUN = config('LOG_RETENTION_MAX_BATCHES_PER_RUN', default=200, cast=int)
+LOG_RETENTION_POLICIES = {
+    'attachments.AttachmentTransferLog': {
+        'dias': config('LOG_RETENTION_TRANSFER_DAYS', default=90, cast=int),
+        'status': ['success', 'failed'],
+        'somar': ['total_anexos', 'anexos_sucesso', 'tentativas'],
+        'arquivar': True,
+    },
+    'attachments.AttachmentSyncLog': {
+        'dias': config('LOG_RETENTION_SYNC_DAYS', default=90, cast=int),
+        'status': ['success', 'failed'],
+        'somar': [],
+        'arquivar': True,
+    },
+    'purchase_orders.PurchaseOrderClosureLog': {
+        'dias': config('LOG_RETENTION_CLOSURE_DAYS', default=180, cast=int),
+        'status': ['success', 'failed'],
+        'somar': ['tentativas'],
+        'arquivar': True,
+    },
+    'BackOffice.DeadLetterTask': {
+        'dias': config('LOG_RETENTION_DEAD_LETTER_DAYS', default=90, cast=int),
+        'status': ['resolved', 'discarded'],
+        'somar': ['falhas'],
+        'arquivar': True,
+    },
+    'BackOffice.RequestProfile': {
+        'dias': config('LOG_RETENTION_REQUEST_PROFILE_DAYS', default=14, cast=int),
+        'somar': ['duracao_ms', 'sql_queries'],
+        'arquivar': False,
+    },
+    'BackOffice.PeriodicTaskRun': {
+        'dias': config('LOG_RETENTION_PERIODIC_RUN_DAYS', default=30, cast=int),
+        'status': ['success', 'failed', 'skipped'],
+        'somar': ['duracao_ms'],
+        'arquivar': False,
+    },
+}
 
+# Listagens da API: cache curto do corpo por ETag (usuário + parâmetros + versão dos dados); 0 desativa
+API_LIST_CACHE_SECONDS = config('API_LIST_CACHE_SECONDS', default=0, cast=int)
+
+# Progresso em tempo real (SSE): 'redis' (Streams, entre processos) ou 'memory' (mesmo processo)
+PROGRESS_BACKEND = config('PROGRESS_BACKEND', default='memory' if DEBUG else 'redis')
+PROGRESS_REDIS_URL = config('PROGRESS_REDIS_URL', default=CELERY_BROKER_URL)
+PROGRESS_MAX_EVENTS = config('PROGRESS_MAX_EVENTS', default=500, cast=int)
+PROGRESS_TTL_SECONDS = config('PROGRESS_TTL_SECONDS', default=3600, cast=int)
+PROGRESS_STREAM_MAX_SECONDS = config('PROGRESS_STREAM_MAX_SECONDS', default=300, cast=int)
+PROGRESS_HEARTBEAT_SECONDS = config('PROGRESS_HEARTBEAT_SECONDS', default=15, cast=int)
+
+# Cliente Omie async (views ASGI): pool de conexões compartilhado por processo
+OMIE_ASYNC_MAX_CONNECTIONS = config('OMIE_ASYNC_MAX_CONNECTIONS', default=200, cast=int)
+OMIE_ASYNC_MAX_KEEPALIVE = config('OMIE_ASYNC_MAX_KEEPALIVE', default=50, cast=int)
+OMIE_ASYNC_TIMEOUT_SECONDS = config('OMIE_ASYNC_TIMEOUT_SECONDS', default=60, cast=int)
+
+# Prazo (deadline) propagado às chamadas Omie: o timeout de cada chamada é o que resta do prazo
+OMIE_REQUEST_DEADLINE_SECONDS = config('OMIE_REQUEST_DEADLINE_SECONDS', default=55, cast=int)
+# Tasks usam o soft_time_limit (menos a margem); sem limite, este valor (0 = sem prazo).
+# No worker de threads é o único teto de duração: o Celery não aplica os time limits lá
+OMIE_TASK_DEADLINE_SECONDS = config('OMIE_TASK_DEADLINE_SECONDS', default=0, cast=int)
+OMIE_DEADLINE_MARGIN_SECONDS = config('OMIE_DEADLINE_MARGIN_SECONDS', default=5, cast=int)
+# Abaixo disso não vale iniciar uma chamada Omie
+OMIE_DEADLINE_MIN_SECONDS = config('OMIE_DEADLINE_MIN_SECONDS', default=1, cast=float)
+
+# Backpressure: endpoints que enfileiram respondem 429/503 (Retry-After) e tasks
+# periódicas pulam o ciclo quando as filas do broker passam dos limites
+BACKPRESSURE_QUEUES = config('BACKPRESSURE_QUEUES', default=f'celery,{CELERY_OMIE_IO_QUEUE}', cast=Csv())
+BACKPRESSURE_SOFT_DEPTH = config('BACKPRESSURE_SOFT_DEPTH', default=500, cast=int)
+BACKPRESSURE_HARD_DEPTH = config('BACKPRESSURE_HARD_DEPTH', default=2000, cast=int)
+BACKPRESSURE_MAX_AGE_SECONDS = config('BACKPRESSURE_MAX_AGE_SECONDS', default=600, cast=int)
+BACKPRESSURE_RETRY_AFTER_SECONDS = config('BACKPRESSURE_RETRY_AFTER_SECONDS', default=30, cast=int)
+BACKPRESSURE_CACHE_SECONDS = config('BACKPRESSURE_CACHE_SECONDS', default=5, cast=int)
+
+# Dead-letter: replay em lotes escalonados (countdown) para não inundar a Omie
+DEAD_LETTER_REPLAY_BATCH_SIZE = config('DEAD_LETTER_REPLAY_BATCH_SIZE', default=10, cast=int)
+DEAD_LETTER_REPLAY_RATE_PER_SECOND = config('DEAD_LETTER_REPLAY_RATE_PER_SECOND', default=2.0, cast=float)
+
+# Tasks periódicas (beat): lock por task para não sobrepor execuções entre workers.
+# 'redis' em produção; 'cache' (cache do Django) só é distribuído se o cache for compartilhado
+PERIODIC_LOCK_BACKEND = config('PERIODIC_LOCK_BACKEND', default='cache' if DEBUG else 'redis')
+PERIODIC_LOCK_REDIS_URL = config('PERIODIC_LOCK_REDIS_URL', default=CELERY_BROKER_URL)
+# TTL padrão do lock quando a task não define o seu (deve cobrir a duração máxima)
+PERIODIC_LOCK_TTL_SECONDS = config('PERIODIC_LOCK_TTL_SECONDS', default=15 * 60, cast=int)
+
+# Tracing: span raiz por requisição da API, propagado às tasks (header traceparent)
+# e às chamadas Omie; spans exportados em OTLP/JSON para logs/traces-<pid>.jsonl
+TRACING_ENABLED = config('TRACING_ENABLED', default=True, cast=bool)
+# Fração dos traces novos exportados (traceparent recebido decide por si)
+TRACING_SAMPLE_RATE = config('TRACING_SAMPLE_RATE', default=1.0, cast=float)
+TRACING_SERVICE_NAME = config('TRACING_SERVICE_NAME', default='backoffice')
+
+# Profiling de requisições (opt-in): header PROFILING_HEADER com o segredo (ou usuário
+# staff na sessão), regras no Admin (ProfilingRule) ou amostragem; perfis em RequestProfile
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=True, cast=bool)
+PROFILING_HEADER = config('PROFILING_HEADER', default='X-Profile')
+PROFILING_HEADER_SECRET = config('PROFILING_HEADER_SECRET', default='')
+# Fração das requisições em PROFILING_PATH_PREFIXES perfiladas sem pedido explícito (0 = desligado)
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+PROFILING_PATH_PREFIXES = config('PROFILING_PATH_PREFIXES', default='/api/', cast=Csv())
+PROFILING_TOP_FUNCTIONS = config('PROFILING_TOP_FUNCTIONS', default=40, cast=int)
+PROFILING_RULES_CACHE_SECONDS = config('PROFILING_RULES_CACHE_SECONDS', default=10, cast=int)
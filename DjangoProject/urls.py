@@ -6,7 +6,9 @@ from django.contrib.auth.decorators import login_required
 from rest_framework.routers import DefaultRouter
 from purchase_orders.views import SupplierListView
 
-from attachments.views import AttachmentTransferViewSet
+from attachments.views import AttachmentIncluirView, AttachmentTransferViewSet
+from BackOffice.views import DashboardCountersView, DeadLetterView, QueueMetricsView, TraceView, progress_stream
+from omie_api.views import OmieWebhookView
 from purchase_orders.views import (
     PurchaseOrderClosureViewSet,
     PurchaseOrderIntegrationViewSet,
@@ -17,7 +19,7 @@ from purchase_orders.views import (
 
 router = DefaultRouter()
 router.register(r"attachments", AttachmentTransferViewSet, basename="attachments")
-router.register(r"purchase-orders/closure", PurchaseOrderClosureViewSet, basename="po-closure")
+router.register(r"purchase-orders/closure", PurchaseOrderClosureViewSet, basename="purchase-order-closure")
 router.register(r"purchase-orders/integrations", PurchaseOrderIntegrationViewSet, basename="po-integrations")
 router.register(r"purchase-orders/finance-map", PurchaseOrderFinanceMapViewSet, basename="po-finance-map")
 
@@ -95,6 +97,19 @@ urlpatterns = [
 
     # admin e API
     path("admin/", admin.site.urls),
+    # View async (ASGI) registrada antes do router para responder em /api/attachments/incluir/
+    path("api/attachments/incluir/", AttachmentIncluirView.as_view(), name="attachments-incluir"),
     path("api/", include(router.urls)),
     path("api/suppliers/", SupplierListView.as_view(), name="suppliers-list"),
+    path("api/webhooks/omie/", OmieWebhookView.as_view(), name="omie-webhook"),
+    path("api/dashboard/counters/", DashboardCountersView.as_view(), name="dashboard-counters"),
+    path("api/metrics/queues/", QueueMetricsView.as_view(), name="queue-metrics"),
+    path("api/dead-letters/", DeadLetterView.as_view(), name="dead-letters"),
+    path("api/dead-letters/replay/", DeadLetterView.as_view(http_method_names=["post"]), name="dead-letters-replay"),
+    path("api/traces/<str:trace_id>/", TraceView.as_view(), name="trace-detail"),
+    path(
+        "api/progress/<str:tipo>/<str:identificador>/stream/",
+        progress_stream,
+        name="progress-stream",
+    ),
 ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attachments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attachmenttransferlog',
+            name='destino_tabela',
+            field=models.CharField(default='conta-pagar', max_length=50),
+        ),
+        migrations.CreateModel(
+            name='AttachmentSyncLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origem_tabela', models.CharField(max_length=100)),
+                ('origem_id', models.BigIntegerField()),
+                ('destino_tabela', models.CharField(max_length=100)),
+                ('destino_id', models.BigIntegerField()),
+                ('metodo', models.CharField(choices=[('robo', 'Robô'), ('sistema_full_flow', 'Fluxo BackOffice')], max_length=30)),
+                ('nome_arquivo', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('success', 'Sucesso'), ('failed', 'Falha')], max_length=20)),
+                ('mensagem_erro', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['origem_tabela', 'origem_id'], name='attachments_origem__ee84a4_idx'), models.Index(fields=['destino_tabela', 'destino_id'], name='attachments_destino_000df1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attachments', '0002_attachmentsynclog'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='attachmenttransferlog',
+            name='attachment__origem__322b0d_idx',
+        ),
+        migrations.AddIndex(
+            model_name='attachmenttransferlog',
+            index=models.Index(fields=['origem_id', 'destino_id', 'status'], name='attachment__origem__3a482f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attachmenttransferlog',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'failed']), ('tentativas__lt', models.F('max_tentativas'))), fields=['created_at'], name='atl_retentaveis_idx'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 # attachments/models.py
 
 from django.db import models
+from django.db.models import F, Q
+
+from BackOffice.models import DashboardCounterMixin
 from django.utils import timezone
 
 
@@ -26,7 +29,9 @@ class AttachmentIntegrationMap(models.Model):
         return f"Map {self.origem_recebimento_id} -> {self.destino_conta_pagar_id}"
 
 
-class AttachmentTransferLog(models.Model):
+class AttachmentTransferLog(DashboardCounterMixin, models.Model):
+    metrica_dashboard = "transferencias_anexos"
+
     STATUS_CHOICES = [
         ("pending", "Pendente"),
         ("processing", "Processando"),
@@ -59,9 +64,15 @@ class AttachmentTransferLog(models.Model):
         db_table = "attachment_transfer_log"
         ordering = ["-created_at"]
         indexes = [
-            models.Index(fields=["origem_id", "destino_id"]),
+            models.Index(fields=["origem_id", "destino_id", "status"]),
             models.Index(fields=["status"]),
             models.Index(fields=["created_at"]),
+            # Índice parcial: só as linhas ainda retentáveis (processar_transferencias_pendentes)
+            models.Index(
+                fields=["created_at"],
+                name="atl_retentaveis_idx",
+                condition=Q(status__in=["pending", "failed"], tentativas__lt=F("max_tentativas")),
+            ),
         ]
 
     def __str__(self):
@@ -100,6 +111,24 @@ class AttachmentTransferLog(models.Model):
             ]
         )
 
+    def mark_as_interrupted(self, anexos_info: list, erro: str):
+        """Prazo esgotado no meio da transferência: guarda o que já foi feito e deixa para retentativa."""
+        self.status = "failed"
+        self.anexos_transferidos = anexos_info
+        self.anexos_sucesso = len(anexos_info)
+        self.mensagem_erro = erro
+        self.processado_em = timezone.now()
+        self.save(
+            update_fields=[
+                "status",
+                "anexos_transferidos",
+                "anexos_sucesso",
+                "mensagem_erro",
+                "processado_em",
+                "updated_at",
+            ]
+        )
+
     @property
     def pode_retentar(self) -> bool:
         return self.tentativas < self.max_tentativas and self.status in (
@@ -108,7 +137,9 @@ class AttachmentTransferLog(models.Model):
         )
 
 
-class AttachmentSyncLog(models.Model):
+class AttachmentSyncLog(DashboardCounterMixin, models.Model):
+    metrica_dashboard = "sincronizacao_anexos"
+
     METODO_CHOICES = (
         ("robo", "Robô"),
         ("sistema_full_flow", "Fluxo BackOffice"),
@@ -2,7 +2,9 @@ import logging
 import time
 from typing import List, Tuple, Optional
 from django.db import models
-from omie_api.client import OmieAPIClient, OmieAPIException
+from BackOffice.progress import Progresso, canal
+from BackOffice.tracing import anotar, span
+from omie_api.client import OmieAPIClient, OmieAPIException, PrazoExcedido
 from .models import AttachmentTransferLog, AttachmentIntegrationMap
 
 logger = logging.getLogger(__name__)
@@ -23,15 +25,22 @@ class AttachmentTransferService:
                 continue
         return 0
 
-    def transferir_anexos(self, origem_id: int, destino_id: int, origem_tabela: str = 'com-recebimento', destino_tabela: str = 'conta_a_pagar') -> AttachmentTransferLog:
+    @span("attachments.transferir_anexos")
+    def transferir_anexos(self, origem_id: int, destino_id: int, origem_tabela: str = 'com-recebimento', destino_tabela: str = 'conta_a_pagar', progresso: Optional[Progresso] = None, log: Optional[AttachmentTransferLog] = None) -> AttachmentTransferLog:
         inicio = time.monotonic()
-        log = AttachmentTransferLog.objects.create(
-            origem_tabela=origem_tabela,
-            origem_id=origem_id,
-            destino_tabela=destino_tabela,
-            destino_id=destino_id,
-            status='pending'
-        )
+        if log is None:
+            log = AttachmentTransferLog.objects.create(
+                origem_tabela=origem_tabela,
+                origem_id=origem_id,
+                destino_tabela=destino_tabela,
+                destino_id=destino_id,
+                status='pending'
+            )
+        anotar(origem_id=origem_id, destino_id=destino_id, log_id=log.id)
+        # Eventos de progresso (SSE): canal do log + canais extras do chamador (ex.: task)
+        progresso = (progresso or Progresso()).com(canal('transfer', log.id))
+        progresso.publicar('inicio', log_id=log.id, origem_id=origem_id, destino_id=destino_id)
+        bytes_transferidos = 0
         try:
             log.mark_as_processing()
             logger.info(
@@ -52,11 +61,13 @@ class AttachmentTransferService:
             # Lista anexos da origem
             anexos_origem = self.client.listar_anexos(origem_tabela, origem_id) or []
             log.total_anexos = len(anexos_origem)
+            progresso.publicar('total', log_id=log.id, total_anexos=log.total_anexos)
 
             transferidos: List[dict] = []
             duplicados = 0
             sem_conteudo = 0
             erros_inclusao = 0
+            interrompido = None
 
             for anexo in anexos_origem:
                 nome = anexo.get('cNomeArquivo')
@@ -67,11 +78,17 @@ class AttachmentTransferService:
                 # Idempotência por nome e (se disponível) tamanho
                 if nome in nomes_existentes or (nome, tam) in pares_existentes:
                     duplicados += 1
+                    progresso.publicar('arquivo', nome=nome, status='duplicado', bytes=0)
                     continue
-                conteudo = self.client.obter_anexo(n_id_anexo)
+                try:
+                    conteudo = self.client.obter_anexo(n_id_anexo)
+                except PrazoExcedido as e:
+                    interrompido = str(e)
+                    break
                 base64_file = conteudo.get('cArquivo')
                 if not base64_file:
                     sem_conteudo += 1
+                    progresso.publicar('arquivo', nome=nome, status='sem_conteudo', bytes=0)
                     continue
                 try:
                     self.client.incluir_anexo(
@@ -82,12 +99,18 @@ class AttachmentTransferService:
                     # Atualiza conjuntos para evitar incluir novamente no mesmo run
                     nomes_existentes.add(nome)
                     pares_existentes.add((nome, tam))
+                    bytes_transferidos += tam
+                    progresso.publicar('arquivo', nome=nome, status='done', bytes=tam, bytes_transferidos=bytes_transferidos)
+                except PrazoExcedido as e:
+                    interrompido = str(e)
+                    break
                 except OmieAPIException as e:
                     erros_inclusao += 1
                     # Loga faultstring se presente
                     msg = str(e)
+                    progresso.publicar('arquivo', nome=nome, status='failed', bytes=0, erro=msg)
                     logger.error(
-                        f"[RF-001] Erro ao incluir anexo '{nome}' no destino {destino_id}: {msg}",
+                        "[RF-001] Erro ao incluir anexo '%s' no destino %s: %s", nome, destino_id, msg,
                         extra={"origem_id": origem_id, "destino_id": destino_id, "log_id": log.id}
                     )
 
@@ -100,32 +123,47 @@ class AttachmentTransferService:
                 'sem_conteudo': sem_conteudo,
                 'erros_inclusao': erros_inclusao,
                 'elapsed_ms': elapsed_ms,
+                'interrompido_por_prazo': bool(interrompido),
             }
             log.detalhes = detalhes
             log.save(update_fields=['total_anexos', 'detalhes', 'updated_at'])
 
+            if interrompido:
+                # Os já incluídos são pulados na retentativa (deduplicação por nome/tamanho)
+                msg = f"{interrompido}: {len(transferidos)} de {len(anexos_origem)} anexos transferidos"
+                logger.warning(
+                    "[RF-001] Transferência interrompida por prazo: %s", msg,
+                    extra={"origem_id": origem_id, "destino_id": destino_id, "log_id": log.id}
+                )
+                log.mark_as_interrupted(transferidos, msg)
+                progresso.finalizar(log.status, log_id=log.id, erro=msg, anexos_sucesso=log.anexos_sucesso, bytes_transferidos=bytes_transferidos)
+                return log
+
             logger.info(
-                f"[RF-001] Transferência concluída: {len(transferidos)} incluídos, {duplicados} duplicados, {elapsed_ms}ms",
+                "[RF-001] Transferência concluída: %s incluídos, %s duplicados, %sms", len(transferidos), duplicados, elapsed_ms,
                 extra={"origem_id": origem_id, "destino_id": destino_id, "log_id": log.id}
             )
             log.mark_as_success(transferidos)
+            progresso.finalizar(log.status, log_id=log.id, anexos_sucesso=log.anexos_sucesso, bytes_transferidos=bytes_transferidos)
             return log
         except OmieAPIException as e:
             elapsed_ms = int((time.monotonic() - inicio) * 1000)
             msg = str(e)
             logger.error(
-                f"[RF-001] Erro Omie ao transferir anexos {origem_id}->{destino_id}: {msg} ({elapsed_ms}ms)",
+                "[RF-001] Erro Omie ao transferir anexos %s->%s: %s (%sms)", origem_id, destino_id, msg, elapsed_ms,
                 extra={"origem_id": origem_id, "destino_id": destino_id, "log_id": log.id}
             )
             log.mark_as_failed(msg)
+            progresso.finalizar(log.status, log_id=log.id, erro=msg)
             return log
         except Exception as e:
             elapsed_ms = int((time.monotonic() - inicio) * 1000)
             logger.exception(
-                f"[RF-001] Erro inesperado na transferência de anexos ({elapsed_ms}ms)",
+                "[RF-001] Erro inesperado na transferência de anexos (%sms)", elapsed_ms,
                 extra={"origem_id": origem_id, "destino_id": destino_id, "log_id": log.id}
             )
             log.mark_as_failed(f"Erro inesperado: {e}")
+            progresso.finalizar(log.status, log_id=log.id, erro=log.mensagem_erro)
             return log
 
     def processar_transferencias_pendentes(self):
@@ -137,7 +175,7 @@ class AttachmentTransferService:
             # Checa pode_retentar para cada item para respeitar regra de negócio
             if not p.pode_retentar:
                 continue
-            resultados.append(self.transferir_anexos(p.origem_id, p.destino_id))
+            resultados.append(self.transferir_anexos(p.origem_id, p.destino_id, log=p))
         return resultados
 
     def registrar_mapeamento_para_transferencia(
@@ -161,21 +199,23 @@ class AttachmentTransferService:
             defaults={'numero_nf': numero_nf} if numero_nf else {}
         )
 
-        # Evita duplicar se já há sucesso para este par
-        existente_sucesso = AttachmentTransferLog.objects.filter(
-            origem_id=origem_recebimento_id,
-            destino_id=destino_conta_pagar_id,
-            status='success'
-        ).first()
-        if existente_sucesso:
-            return existente_sucesso
-
-        # Reusa pendente/failed existente ou cria novo
-        log = AttachmentTransferLog.objects.filter(
-            origem_id=origem_recebimento_id,
-            destino_id=destino_conta_pagar_id,
-            status__in=['pending', 'failed']
-        ).first()
+        # Uma única consulta (índice origem/destino/status): sucesso tem prioridade,
+        # senão reusa pendente/failed existente; sem nenhum dos dois, cria novo
+        log = (
+            AttachmentTransferLog.objects.filter(
+                origem_id=origem_recebimento_id,
+                destino_id=destino_conta_pagar_id,
+                status__in=['success', 'pending', 'failed'],
+            )
+            .order_by(
+                models.Case(models.When(status='success', then=0), default=1),
+                '-created_at',
+            )
+            .first()
+        )
+        if log and log.status == 'success':
+            # Evita duplicar se já há sucesso para este par
+            return log
         if not log:
             log = AttachmentTransferLog.objects.create(
                 origem_id=origem_recebimento_id,
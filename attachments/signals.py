@@ -28,7 +28,7 @@ def disparar_transferencia_por_integracao(origem_id: int, destino_id: int):
     from .services import AttachmentTransferService
 
     logger.info(
-        f"Disparo explícito de transferência de anexos (origem={origem_id} -> destino={destino_id})"
+        "Disparo explícito de transferência de anexos (origem=%s -> destino=%s)", origem_id, destino_id
     )
     service = AttachmentTransferService()
     return service.transferir_anexos(origem_id=origem_id, destino_id=destino_id)
\ No newline at end of file
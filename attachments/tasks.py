@@ -1,35 +1,53 @@
 from celery import shared_task
 import logging
+from BackOffice.periodic import tarefa_periodica
+from BackOffice.dead_letters import TaskComDeadLetter
+from BackOffice.progress import Progresso, canal
+from omie_api.client import OmieAPIException
+from .models import AttachmentTransferLog
 from .services import AttachmentTransferService
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task(bind=True, max_retries=3)
-def transferir_anexos_task(self, origem_id: int, destino_id: int):
+@shared_task(bind=True, base=TaskComDeadLetter, max_retries=3, soft_time_limit=300)
+def transferir_anexos_task(self, origem_id: int, destino_id: int, log_id: int | None = None):
     """
-    Task assíncrona para transferir anexos
+    Task assíncrona para transferir anexos.
+    Falha registrada no log também é retentada, reutilizando o mesmo log
+    (log_id); esgotadas as tentativas, a task vai para a dead-letter
+    (BackOffice.DeadLetterTask).
     """
     try:
-        logger.info(f"Iniciando transferência assíncrona: {origem_id} -> {destino_id}")
+        logger.info("Iniciando transferência assíncrona: %s -> %s", origem_id, destino_id)
         service = AttachmentTransferService()
-        resultado = service.transferir_anexos(origem_id, destino_id)
-
-        return {
-            'status': resultado.status,
-            'anexos_transferidos': resultado.anexos_sucesso,
-            'total_anexos': resultado.total_anexos
-        }
+        progresso = Progresso(canal('task', self.request.id))
+        log = AttachmentTransferLog.objects.filter(pk=log_id).first() if log_id else None
+        resultado = service.transferir_anexos(origem_id, destino_id, progresso=progresso, log=log)
     except Exception as exc:
-        logger.error(f"Erro na task de transferência: {str(exc)}")
+        logger.error("Erro na task de transferência: %s", exc)
         raise self.retry(exc=exc, countdown=60)
 
+    if resultado.status == 'failed':
+        raise self.retry(
+            exc=OmieAPIException(resultado.mensagem_erro or 'Transferência falhou'),
+            countdown=60,
+            kwargs={**self.request.kwargs, 'log_id': resultado.id},
+        )
+
+    return {
+        'status': resultado.status,
+        'anexos_transferidos': resultado.anexos_sucesso,
+        'total_anexos': resultado.total_anexos
+    }
+
 
 @shared_task
+@tarefa_periodica(lock_ttl=10 * 60)
 def processar_transferencias_pendentes_task():
     """
     Task periódica para processar transferências pendentes
-    Agendar para rodar a cada 5 minutos, por exemplo
+    (a cada 5 minutos, ver beat_schedule em DjangoProject/celery.py)
     """
     logger.info("Processando transferências pendentes...")
     service = AttachmentTransferService()
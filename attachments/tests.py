@@ -1,3 +1,125 @@
+import json
+import os
+from unittest.mock import AsyncMock, patch
+
+import httpx
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+
+from BackOffice.models import IdempotencyKey
+from omie_api.async_client import AsyncOmieAPIClient
+from attachments.services import AttachmentTransferService
+from omie_api.client import OmieAPIException, PrazoExcedido
+
+
+class AttachmentIncluirViewTests(TestCase):
+    def setUp(self):
+        self.url = reverse("attachments-incluir")
+        self.payload = {"tabela": "pedido-compra", "n_id": 10, "nome_arquivo": "a.pdf", "arquivo_base64": "eA=="}
+
+    @patch("attachments.views.AsyncOmieAPIClient")
+    async def test_inclui_anexo_via_cliente_async(self, MockClient):
+        MockClient.return_value.incluir_anexo = AsyncMock(return_value={"nIdAnexo": 99})
+
+        resposta = await self.async_client.post(self.url, self.payload, content_type="application/json")
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json(), {"nIdAnexo": 99})
+        MockClient.return_value.incluir_anexo.assert_awaited_once_with(
+            c_tabela="pedido-compra", n_id=10, nome_arquivo="a.pdf", arquivo_base64="eA==", descricao=None
+        )
+
+    @patch("attachments.views.AsyncOmieAPIClient")
+    async def test_erro_omie_vira_502_e_libera_idempotency_key(self, MockClient):
+        MockClient.return_value.incluir_anexo = AsyncMock(side_effect=OmieAPIException("falhou"))
+
+        resposta = await self.async_client.post(
+            self.url, self.payload, content_type="application/json", headers={"Idempotency-Key": "k1"}
+        )
+
+        self.assertEqual(resposta.status_code, 502)
+        self.assertFalse(await IdempotencyKey.objects.filter(chave="k1").aexists())
+
+    @patch("attachments.views.AsyncOmieAPIClient")
+    async def test_replay_idempotente(self, MockClient):
+        MockClient.return_value.incluir_anexo = AsyncMock(return_value={"nIdAnexo": 1})
+        user = await get_user_model().objects.acreate_user("op", password="x")
+        await self.async_client.aforce_login(user)
+
+        for _ in range(2):
+            resposta = await self.async_client.post(
+                self.url, self.payload, content_type="application/json", headers={"Idempotency-Key": "k2"}
+            )
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta["Idempotent-Replayed"], "true")
+        MockClient.return_value.incluir_anexo.assert_awaited_once()
+
+    async def test_campos_obrigatorios(self):
+        resposta = await self.async_client.post(self.url, {"tabela": "x"}, content_type="application/json")
+        self.assertEqual(resposta.status_code, 400)
+
+
+class AsyncOmieAPIClientTests(TestCase):
+    def setUp(self):
+        patcher = patch.dict(os.environ, {"OMIE_APP_KEY": "k", "OMIE_APP_SECRET": "s"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _cliente(self, handler):
+        return AsyncOmieAPIClient(http=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def test_faultstring_vira_excecao(self):
+        cliente = self._cliente(lambda request: httpx.Response(200, json={"faultstring": "ERROR: bloqueado"}))
+        with self.assertRaisesMessage(OmieAPIException, "ERROR: bloqueado"):
+            await cliente.incluir_anexo(c_tabela="pedido-compra", n_id=1, nome_arquivo="a", arquivo_base64="eA==")
+
+    async def test_listar_anexos_monta_payload(self):
+        recebido = {}
+
+        def handler(request):
+            recebido.update(json.loads(request.content))
+            return httpx.Response(200, json={"listaAnexos": [{"cNomeArquivo": "a.pdf"}]})
+
+        anexos = await self._cliente(handler).listar_anexos("pedido-compra", 5)
+
+        self.assertEqual(anexos, [{"cNomeArquivo": "a.pdf"}])
+        self.assertEqual(recebido["call"], "ListarAnexo")
+        self.assertEqual(recebido["param"], [{"nPagina": 1, "nRegPorPagina": 50, "cTabela": "pedido-compra", "nId": 5}])
+
+
+class AttachmentTransferDeadlineTests(TestCase):
+    @patch("attachments.services.OmieAPIClient")
+    def test_prazo_esgotado_registra_progresso_parcial(self, MockClient):
+        client = MockClient.return_value
+        client.listar_anexos.side_effect = [
+            [],
+            [{"cNomeArquivo": f"{n}.pdf", "nIdAnexo": n, "nTamanho": 1} for n in range(3)],
+        ]
+        client.obter_anexo.return_value = {"cArquivo": "eA=="}
+        client.incluir_anexo.side_effect = [{}, PrazoExcedido("Prazo esgotado"), {}]
+
+        log = AttachmentTransferService().transferir_anexos(1, 2)
+
+        self.assertEqual(log.status, "failed")
+        self.assertEqual(log.anexos_sucesso, 1)
+        self.assertTrue(log.detalhes["interrompido_por_prazo"])
+        self.assertIn("1 de 3", log.mensagem_erro)
+        self.assertEqual(client.incluir_anexo.call_count, 2)
+
+
+class TransferirAnexosTaskTests(TestCase):
+    @patch("attachments.services.OmieAPIClient")
+    def test_retentativas_reutilizam_o_mesmo_log(self, MockClient):
+        from attachments.models import AttachmentTransferLog
+        from attachments.tasks import transferir_anexos_task
+
+        MockClient.return_value.listar_anexos.side_effect = OmieAPIException("fora do ar")
+
+        resultado = transferir_anexos_task.apply(args=(1, 2))
 
-# Create your tests here.
+        self.assertTrue(resultado.failed())
+        log = AttachmentTransferLog.objects.get()
+        self.assertEqual(log.status, "failed")
+        self.assertEqual(log.tentativas, transferir_anexos_task.max_retries + 1)
@@ -1,6 +1,14 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from django.urls import reverse
 from rest_framework.response import Response
+from BackOffice.backpressure import resposta_sobrecarga
+from BackOffice.progress import canal, registrar_dono
+from BackOffice.async_views import AsyncAPIView, responder
+from BackOffice.idempotency import idempotente
+from BackOffice.viewsets import parametro_booleano
+from omie_api.async_client import AsyncOmieAPIClient
+from omie_api.client import OmieAPIException
 from .services import AttachmentTransferService
 from .tasks import transferir_anexos_task
 import logging
@@ -12,10 +20,11 @@ class AttachmentTransferViewSet(viewsets.ViewSet):
     """
     ViewSet para operações de transferência de anexos (RF-001).
     Usa apenas actions customizadas; não lista modelos.
-    Também oferece inclusão de anexo (upload base64) para suportar o caso de anexar PDF no pedido de compra.
+    A inclusão de anexo (upload base64) fica em AttachmentIncluirView (async).
     """
 
     @action(detail=False, methods=['post'])
+    @idempotente
     def transferir(self, request):
         """
         Endpoint para disparar manualmente uma transferência de anexos
@@ -33,7 +42,7 @@ class AttachmentTransferViewSet(viewsets.ViewSet):
         destino_id = request.data.get('destino_id')
         origem_tabela = request.data.get('origem_tabela', 'com-recebimento')
         destino_tabela = request.data.get('destino_tabela', 'conta_a_pagar')
-        assincrono = request.data.get('assincrono', False)
+        assincrono = parametro_booleano(request, 'assincrono')
 
         if not origem_id or not destino_id:
             return Response(
@@ -42,11 +51,16 @@ class AttachmentTransferViewSet(viewsets.ViewSet):
             )
 
         if assincrono:
-            # Processa de forma assíncrona
+            # Processa de forma assíncrona (recusado com 429/503 se as filas estiverem cheias)
+            sobrecarga = resposta_sobrecarga()
+            if sobrecarga is not None:
+                return sobrecarga
             task = transferir_anexos_task.delay(origem_id, destino_id)
+            registrar_dono(canal('task', task.id), request.user)
             return Response({
                 'mensagem': 'Transferência iniciada de forma assíncrona',
-                'task_id': task.id
+                'task_id': task.id,
+                'stream_url': reverse('progress-stream', args=['task', task.id]),
             }, status=status.HTTP_202_ACCEPTED)
         else:
             # Processa de forma síncrona
@@ -76,18 +90,22 @@ class AttachmentTransferViewSet(viewsets.ViewSet):
             'falhas': len([r for r in resultados if r.status == 'failed'])
         })
 
-    @action(detail=False, methods=['post'])
-    def incluir(self, request):
-        """
-        Inclui (faz upload) de um anexo em qualquer tabela suportada pela Omie.
-        POST /api/attachments/incluir/
-        {
-          "tabela": "pedido-compra",
-          "n_id": 123456,
-          "nome_arquivo": "documento.pdf",
-          "arquivo_base64": "..."
-        }
-        """
+
+class AttachmentIncluirView(AsyncAPIView):
+    """
+    Inclui (faz upload) de um anexo em qualquer tabela suportada pela Omie.
+    View async: a espera pela Omie não ocupa uma thread do servidor ASGI.
+    POST /api/attachments/incluir/
+    {
+      "tabela": "pedido-compra",
+      "n_id": 123456,
+      "nome_arquivo": "documento.pdf",
+      "arquivo_base64": "..."
+    }
+    """
+
+    @idempotente
+    async def post(self, request):
         tabela = request.data.get('tabela')
         n_id = request.data.get('n_id')
         nome_arquivo = request.data.get('nome_arquivo')
@@ -95,19 +113,21 @@ class AttachmentTransferViewSet(viewsets.ViewSet):
         descricao = request.data.get('descricao')
 
         if not all([tabela, n_id, nome_arquivo, arquivo_base64]):
-            return Response({'erro': 'tabela, n_id, nome_arquivo e arquivo_base64 são obrigatórios'}, status=status.HTTP_400_BAD_REQUEST)
+            return responder({'erro': 'tabela, n_id, nome_arquivo e arquivo_base64 são obrigatórios'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            from omie_api.client import OmieAPIClient
-            client = OmieAPIClient()
-            resp = client.incluir_anexo(
-                tabela=tabela,
+            client = AsyncOmieAPIClient()
+            resp = await client.incluir_anexo(
+                c_tabela=tabela,
                 n_id=int(n_id),
                 nome_arquivo=nome_arquivo,
                 arquivo_base64=arquivo_base64,
                 descricao=descricao
             )
-            return Response(resp)
+            return responder(resp)
+        except OmieAPIException as e:
+            logger.error("Falha ao incluir anexo: %s", e)
+            return responder({'erro': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         except Exception as e:
             logger.exception("Falha ao incluir anexo")
-            return Response({'erro': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return responder({'erro': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import OmieWebhookEvent
 
-# Register your models here.
+@admin.register(OmieWebhookEvent)
+class OmieWebhookEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "event_id", "topic", "status", "tentativas", "created_at")
+    list_filter = ("status", "topic", "created_at")
+    search_fields = ("event_id", "topic")
@@ -4,4 +4,13 @@ from django.apps import AppConfig
 class OmieApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'omie_api'
-    verbose_name = 'API Omie'
\ No newline at end of file
+    verbose_name = 'API Omie'
+
+    def ready(self):
+        from celery.signals import task_postrun, task_prerun
+
+        from .deadline import encerrar_prazo_task, iniciar_prazo_task
+
+        # Toda task com soft_time_limit propaga o prazo às chamadas Omie
+        task_prerun.connect(iniciar_prazo_task, weak=False, dispatch_uid="omie_prazo_prerun")
+        task_postrun.connect(encerrar_prazo_task, weak=False, dispatch_uid="omie_prazo_postrun")
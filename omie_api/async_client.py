@@ -0,0 +1,133 @@
+# omie_api/async_client.py
+
+import asyncio
+import base64
+import logging
+import weakref
+from typing import Any, Dict, List
+
+import httpx
+from django.conf import settings
+
+from BackOffice.tracing import span
+
+from . import deadline
+from .client import OmieAPIClient, OmieAPIException, PrazoExcedido, timeout_omie
+
+logger = logging.getLogger(__name__)
+
+# Um pool de conexões por event loop (httpx.AsyncClient não pode trocar de loop)
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _pool() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    http = _pools.get(loop)
+    if http is None or http.is_closed:
+        http = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.OMIE_ASYNC_TIMEOUT_SECONDS, connect=10),
+            limits=httpx.Limits(
+                max_connections=settings.OMIE_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OMIE_ASYNC_MAX_KEEPALIVE,
+            ),
+        )
+        _pools[loop] = http
+    return http
+
+
+class AsyncOmieAPIClient(OmieAPIClient):
+    """
+    Versão não bloqueante do OmieAPIClient para views async (ASGI).
+    As chamadas HTTP compartilham o pool do event loop, então um processo
+    mantém centenas de chamadas em voo sem ocupar uma thread por chamada.
+
+    Os métodos herdados que apenas retornam `self._call(...)` passam a
+    retornar corrotinas (`await client.incluir_anexo(...)`); os que
+    pós-processam a resposta são reescritos abaixo.
+    """
+
+    def __init__(self, http: httpx.AsyncClient | None = None):
+        super().__init__()
+        self._http = http
+
+    async def _post_raw(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        url = f"{self.base_url}{endpoint}"
+        timeout = timeout_omie(settings.OMIE_ASYNC_TIMEOUT_SECONDS)
+        try:
+            resp = await (self._http or _pool()).post(url, json=payload, timeout=timeout)
+            resp.raise_for_status()
+        except httpx.TimeoutException as exc:
+            if deadline.expirado():
+                raise PrazoExcedido(f"Prazo esgotado aguardando a Omie ({timeout:.1f}s)") from exc
+            logger.error("Erro HTTP Omie: %s", exc)
+            raise OmieAPIException(f"Erro HTTP ao chamar Omie: {exc}") from exc
+        except httpx.HTTPError as exc:
+            logger.error("Erro HTTP Omie: %s", exc)
+            raise OmieAPIException(f"Erro HTTP ao chamar Omie: {exc}") from exc
+
+        data = resp.json()
+        if isinstance(data, dict) and "faultstring" in data:
+            logger.error("Erro Omie: %s", data)
+            raise OmieAPIException(data["faultstring"])
+        return data
+
+    async def _call(self, endpoint: str, call: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        payload = {
+            "call": call,
+            "app_key": self.app_key,
+            "app_secret": self.app_secret,
+            "param": [params],
+        }
+        logger.info("Omie API (async) call=%s endpoint=%s", call, endpoint)
+        with span(f"omie {call}", tipo="CLIENT", **{"omie.call": call, "omie.endpoint": endpoint}):
+            return await self._post_raw(endpoint, payload)
+
+    async def listar_anexos(
+        self,
+        c_tabela: str,
+        n_id: int,
+        pagina: int = 1,
+        limite: int = 50,
+    ) -> List[Dict[str, Any]]:
+        params = {
+            "nPagina": pagina,
+            "nRegPorPagina": limite,
+            "cTabela": c_tabela,
+            "nId": n_id,
+        }
+        data = await self._call("geral/anexo/", "ListarAnexo", params)
+        return data.get("listaAnexos", []) or data.get("anexos", [])
+
+    async def copiar_anexo(
+        self,
+        origem_tabela: str,
+        origem_id: int,
+        destino_tabela: str,
+        destino_id: int,
+        anexo_info: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        detalhe = await self.obter_anexo(
+            c_tabela=origem_tabela,
+            n_id=origem_id,
+            n_id_anexo=anexo_info.get("nIdAnexo"),
+        )
+
+        conteudo_b64 = detalhe.get("cArquivo")
+        link = detalhe.get("cLinkDownload")
+        if not conteudo_b64 and link:
+            try:
+                resp = await (self._http or _pool()).get(link, timeout=timeout_omie(settings.OMIE_ASYNC_TIMEOUT_SECONDS))
+                resp.raise_for_status()
+            except httpx.HTTPError as exc:
+                raise OmieAPIException(f"Erro ao baixar anexo da Omie: {exc}") from exc
+            conteudo_b64 = base64.b64encode(resp.content).decode()
+
+        if not conteudo_b64:
+            raise OmieAPIException("Não foi possível obter conteúdo do anexo na Omie.")
+
+        return await self.incluir_anexo(
+            c_tabela=destino_tabela,
+            n_id=destino_id,
+            nome_arquivo=anexo_info.get("cNomeArquivo"),
+            arquivo_base64=conteudo_b64,
+        )
@@ -2,10 +2,17 @@
 
 import base64
 import logging
+import os
+import threading
 from typing import Any, Dict, List, Optional
 
 import requests
 from decouple import config
+from requests.adapters import HTTPAdapter
+
+from BackOffice.tracing import span
+
+from . import deadline
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +22,51 @@ class OmieAPIException(Exception):
     pass
 
 
+class PrazoExcedido(OmieAPIException):
+    """O prazo (deadline) do request/task acabou antes ou durante a chamada à Omie."""
+    pass
+
+
+def timeout_omie(padrao: float) -> float:
+    """
+    Timeout de uma chamada Omie: o menor entre `padrao` e o tempo que resta
+    do prazo corrente (omie_api.deadline). Sem tempo útil, nem tenta a chamada.
+    """
+    sobra = deadline.restante()
+    if sobra is None:
+        return padrao
+    if deadline.expirado():
+        raise PrazoExcedido("Prazo esgotado antes da chamada à Omie")
+    return min(padrao, sobra)
+
+
+_local = threading.local()
+
+
+def sessao_http() -> requests.Session:
+    """
+    requests.Session da thread atual: reaproveita conexões (keep-alive/TLS)
+    entre chamadas sem compartilhar a Session entre threads — o que importa
+    nos workers `-P threads`, onde dezenas de tasks chamam a Omie ao mesmo tempo.
+    """
+    sessao = getattr(_local, "sessao", None)
+    if sessao is None:
+        sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=2, pool_maxsize=config("OMIE_HTTP_POOL_MAXSIZE", default=4, cast=int))
+        sessao.mount("https://", adaptador)
+        sessao.mount("http://", adaptador)
+        _local.sessao = sessao
+    return sessao
+
+
+def _descartar_sessao():
+    # Depois do fork (prefork), o filho não pode reutilizar os sockets do pai
+    _local.__dict__.pop("sessao", None)
+
+
+os.register_at_fork(after_in_child=_descartar_sessao)
+
+
 class OmieAPIClient:
     def __init__(self):
         self.app_key = config("OMIE_APP_KEY")
@@ -40,9 +92,15 @@ class OmieAPIClient:
 
     def _post_raw(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
         url = f"{self.base_url}{endpoint}"
+        timeout = timeout_omie(60)
         try:
-            resp = requests.post(url, json=payload, timeout=60)
+            resp = sessao_http().post(url, json=payload, timeout=timeout)
             resp.raise_for_status()
+        except requests.Timeout as exc:
+            if deadline.expirado():
+                raise PrazoExcedido(f"Prazo esgotado aguardando a Omie ({timeout:.1f}s)") from exc
+            logger.error("Erro HTTP Omie: %s", exc)
+            raise OmieAPIException(f"Erro HTTP ao chamar Omie: {exc}") from exc
         except requests.RequestException as exc:
             logger.error("Erro HTTP Omie: %s", exc)
             raise OmieAPIException(f"Erro HTTP ao chamar Omie: {exc}") from exc
@@ -60,16 +118,19 @@ class OmieAPIClient:
             "app_secret": self.app_secret,
             "param": [params],
         }
-        logger.info("Omie API call=%s endpoint=%s", call, endpoint)
-        return self._post_raw(endpoint, payload)
+        logger.debug("Omie API call=%s endpoint=%s", call, endpoint)
+        with span(f"omie {call}", tipo="CLIENT", **{"omie.call": call, "omie.endpoint": endpoint}):
+            return self._post_raw(endpoint, payload)
 
     # ------------ Pedidos de Compra ------------
 
     def incluir_pedido_compra(self, pedido: Dict[str, Any]) -> Dict[str, Any]:
         return self._call("produtos/pedidocompra/", "IncluirPedCompra", pedido)
 
-    def consultar_pedido_compra(self, chave: Dict[str, Any]) -> Dict[str, Any]:
-        # chave exemplo: {"nCodPed": 123} ou {"cNumero": "..."}
+    def consultar_pedido_compra(self, chave: Dict[str, Any] | str) -> Dict[str, Any]:
+        # chave exemplo: {"nCodPed": 123} ou {"cNumero": "..."}; str é tratada como cNumero
+        if not isinstance(chave, dict):
+            chave = {"cNumero": str(chave)}
         return self._call("produtos/pedidocompra/", "ConsultarPedCompra", chave)
 
     # ------------ Recebimentos (notas de compra) ------------
@@ -175,7 +236,7 @@ class OmieAPIClient:
         link = detalhe.get("cLinkDownload")
 
         if not conteudo_b64 and link:
-            resp = requests.get(link, timeout=60)
+            resp = sessao_http().get(link, timeout=timeout_omie(60))
             resp.raise_for_status()
             conteudo_b64 = base64.b64encode(resp.content).decode()
 
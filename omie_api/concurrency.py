@@ -0,0 +1,42 @@
+# omie_api/concurrency.py
+
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def executar_em_paralelo(
+    func: Callable[[Any], Any],
+    itens: Iterable[Any],
+    max_workers: int = 8,
+) -> List[Tuple[Any, Optional[Exception]]]:
+    """
+    Executa `func` para cada item em um pool de threads limitado.
+
+    Pensado para chamadas HTTP à Omie (I/O bound). Retorna, na mesma ordem dos
+    itens, tuplas (resultado, erro) — o erro de um item não interrompe os demais.
+    As funções executadas não devem acessar o banco: gravações ficam com o chamador.
+    Cada item roda numa cópia do contexto do chamador, então o prazo
+    (omie_api.deadline) vale também dentro das threads.
+    """
+    itens = list(itens)
+    if not itens:
+        return []
+
+    def _executar(item):
+        try:
+            return func(item), None
+        except Exception as exc:
+            return None, exc
+
+    workers = max(1, min(max_workers, len(itens)))
+    if workers == 1:
+        return [_executar(item) for item in itens]
+
+    # Um contexto por item: o mesmo Context não pode ser usado por duas threads ao mesmo tempo
+    contextos = [contextvars.copy_context() for _ in itens]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="omie") as pool:
+        return list(pool.map(lambda ctx, item: ctx.run(_executar, item), contextos, itens))
@@ -0,0 +1,103 @@
+# omie_api/deadline.py
+
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Instante (time.monotonic) até o qual o trabalho atual pode chamar a Omie
+_prazo: ContextVar[float | None] = ContextVar("omie_prazo", default=None)
+
+
+@contextmanager
+def prazo(segundos: float | None):
+    """
+    Define o prazo das chamadas Omie feitas dentro do bloco.
+    Prazos aninhados só encurtam: vale o menor entre o atual e o novo.
+    """
+    if not segundos:
+        yield _prazo.get()
+        return
+    limite = time.monotonic() + segundos
+    atual = _prazo.get()
+    if atual is not None:
+        limite = min(limite, atual)
+    token = _prazo.set(limite)
+    try:
+        yield limite
+    finally:
+        _prazo.reset(token)
+
+
+def restante() -> float | None:
+    """Segundos até o prazo (negativo se já passou); None sem prazo definido."""
+    limite = _prazo.get()
+    return None if limite is None else limite - time.monotonic()
+
+
+def expirado() -> bool:
+    sobra = restante()
+    return sobra is not None and sobra <= settings.OMIE_DEADLINE_MIN_SECONDS
+
+
+class PrazoRequisicaoMiddleware:
+    """Aplica OMIE_REQUEST_DEADLINE_SECONDS às requisições da API (sync e async)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _segundos(self, request):
+        return settings.OMIE_REQUEST_DEADLINE_SECONDS if request.path.startswith("/api/") else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with prazo(self._segundos(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with prazo(self._segundos(request)):
+            return await self.get_response(request)
+
+
+# ---------- Celery: prazo = soft_time_limit da task (menos uma margem) ----------
+
+_tokens: dict[str, object] = {}
+
+
+def _segundos_da_task(task) -> float | None:
+    limites = getattr(task.request, "timelimit", None) or (None, None)
+    segundos = limites[1] or task.soft_time_limit or limites[0] or task.time_limit
+    if segundos:
+        return max(segundos - settings.OMIE_DEADLINE_MARGIN_SECONDS, 1)
+    return settings.OMIE_TASK_DEADLINE_SECONDS or None
+
+
+def iniciar_prazo_task(sender=None, task_id=None, task=None, **kwargs):
+    segundos = _segundos_da_task(task) if task is not None else None
+    if not segundos:
+        return
+    atual = _prazo.get()
+    limite = time.monotonic() + segundos
+    _tokens[task_id] = _prazo.set(limite if atual is None else min(limite, atual))
+
+
+def encerrar_prazo_task(sender=None, task_id=None, **kwargs):
+    token = _tokens.pop(task_id, None)
+    if token is None:
+        return
+    try:
+        _prazo.reset(token)
+    except ValueError:
+        # Token criado em outro contexto (pool de threads); apenas descarta o prazo
+        _prazo.set(None)
@@ -0,0 +1,140 @@
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from attachments.models import AttachmentTransferLog
+from omie_api.client import OmieAPIClient
+
+
+class _OmieFalsa(BaseHTTPRequestHandler):
+    """Responde como a Omie depois de `latencia` segundos (HTTP/1.1, keep-alive)."""
+
+    protocol_version = "HTTP/1.1"
+    latencia = 0.2
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.latencia)
+        corpo = json.dumps({"listaAnexos": []}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def _memoria_mb() -> float:
+    """
+    PSS do processo: páginas compartilhadas após o fork contam proporcionalmente,
+    então a soma dos filhos do prefork não infla. Sem /proc, cai no pico de RSS.
+    """
+    for arquivo, campo in (("/proc/self/smaps_rollup", "Pss:"), ("/proc/self/status", "VmRSS:")):
+        try:
+            with open(arquivo) as status:
+                for linha in status:
+                    if linha.startswith(campo):
+                        return int(linha.split()[1]) / 1024
+        except OSError:
+            continue
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _tarefa(base_url: str) -> tuple[int, float]:
+    """O que uma task Omie típica faz: chamada HTTP + acesso ao banco, conexão fechada no fim (como o Celery)."""
+    cliente = OmieAPIClient()
+    cliente.base_url = base_url
+    cliente.listar_anexos("pedido-compra", 1)
+    AttachmentTransferLog.objects.exists()
+    connections.close_all()
+    return os.getpid(), _memoria_mb()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a vazão e a memória de um worker de threads (-P threads) com o "
+        "prefork para tasks presas em I/O da Omie, usando uma Omie local com latência simulada."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tarefas", type=int, default=200)
+        parser.add_argument("--concorrencia", type=int, default=32, help="Threads ou processos (-c do worker)")
+        parser.add_argument("--latencia-ms", type=int, default=200, help="Latência simulada de cada chamada Omie")
+        parser.add_argument("--modo", choices=["threads", "prefork", "ambos"], default="ambos")
+        parser.add_argument("--json", action="store_true", help="Saída em JSON")
+
+    def handle(self, *args, **options):
+        # O cliente exige credenciais; aqui elas só chegam à Omie falsa
+        os.environ.setdefault("OMIE_APP_KEY", "benchmark")
+        os.environ.setdefault("OMIE_APP_SECRET", "benchmark")
+        logging.getLogger("omie_api.client").setLevel(logging.WARNING)
+
+        _OmieFalsa.latencia = options["latencia_ms"] / 1000
+        servidor = ThreadingHTTPServer(("127.0.0.1", 0), _OmieFalsa)
+        servidor.daemon_threads = True
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{servidor.server_address[1]}/"
+
+        modos = ["threads", "prefork"] if options["modo"] == "ambos" else [options["modo"]]
+        resultados = []
+        try:
+            for modo in modos:
+                if modo == "prefork" and "fork" not in multiprocessing.get_all_start_methods():
+                    self.stderr.write(self.style.WARNING("prefork indisponível nesta plataforma (sem fork)"))
+                    continue
+                resultados.append(
+                    getattr(self, f"_medir_{modo}")(base_url, options["tarefas"], options["concorrencia"])
+                )
+        finally:
+            servidor.shutdown()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(resultados, indent=2))
+            return
+        self.stdout.write(f"{'modo':<8} {'tarefas':>7} {'conc.':>5} {'seg.':>7} {'tarefas/s':>9} {'mem. MB':>8} {'MB/slot':>7}")
+        for r in resultados:
+            self.stdout.write(
+                f"{r['modo']:<8} {r['tarefas']:>7} {r['concorrencia']:>5} {r['segundos']:>7.2f} "
+                f"{r['tarefas_por_segundo']:>9.1f} {r['memoria_mb']:>8.1f} {r['memoria_mb_por_slot']:>7.2f}"
+            )
+
+    def _resultado(self, modo, tarefas, concorrencia, segundos, memoria_mb) -> dict:
+        return {
+            "modo": modo,
+            "tarefas": tarefas,
+            "concorrencia": concorrencia,
+            "segundos": round(segundos, 3),
+            "tarefas_por_segundo": round(tarefas / segundos, 1),
+            "memoria_mb": round(memoria_mb, 1),
+            "memoria_mb_por_slot": round(memoria_mb / concorrencia, 2),
+        }
+
+    def _medir_threads(self, base_url, tarefas, concorrencia) -> dict:
+        inicio = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+            list(pool.map(lambda _: _tarefa(base_url), range(tarefas)))
+        segundos = time.monotonic() - inicio
+        return self._resultado("threads", tarefas, concorrencia, segundos, _memoria_mb())
+
+    def _medir_prefork(self, base_url, tarefas, concorrencia) -> dict:
+        # Como o prefork do Celery: processos filhos criados por fork, sem conexões herdadas
+        connections.close_all()
+        inicio = time.monotonic()
+        with multiprocessing.get_context("fork").Pool(concorrencia) as pool:
+            medidas = pool.map(_tarefa, [base_url] * tarefas, chunksize=1)
+        segundos = time.monotonic() - inicio
+        por_processo: dict[int, float] = {}
+        for pid, memoria in medidas:
+            por_processo[pid] = max(memoria, por_processo.get(pid, 0))
+        return self._resultado("prefork", tarefas, concorrencia, segundos, sum(por_processo.values()) + _memoria_mb())
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OmieWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=100, unique=True)),
+                ('topic', models.CharField(blank=True, max_length=100)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('received', 'Recebido'), ('processing', 'Processando'), ('success', 'Sucesso'), ('ignored', 'Ignorado'), ('failed', 'Falhou')], default='received', max_length=20)),
+                ('tentativas', models.IntegerField(default=0)),
+                ('max_tentativas', models.IntegerField(default=3)),
+                ('mensagem_erro', models.TextField(blank=True, null=True)),
+                ('resultado', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('processado_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'omie_webhook_event',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['topic'], name='omie_webhoo_topic_07a2cd_idx'), models.Index(fields=['status', 'created_at'], name='omie_webhoo_status_34d731_idx')],
+            },
+        ),
+    ]
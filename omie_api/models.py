@@ -1,3 +1,83 @@
+# omie_api/models.py
+
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.db.models import F, Q
+from django.utils import timezone
+
+
+class OmieWebhookEvent(models.Model):
+    """
+    Evento bruto recebido pelo webhook da Omie. Persistido antes do ack e
+    processado de forma assíncrona; `event_id` (messageId) garante deduplicação.
+    """
+
+    STATUS_CHOICES = [
+        ("received", "Recebido"),
+        ("processing", "Processando"),
+        ("success", "Sucesso"),
+        ("ignored", "Ignorado"),
+        ("failed", "Falhou"),
+    ]
+
+    event_id = models.CharField(max_length=100, unique=True)
+    topic = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="received")
+    tentativas = models.IntegerField(default=0)
+    max_tentativas = models.IntegerField(default=3)
+    mensagem_erro = models.TextField(blank=True, null=True)
+    resultado = models.JSONField(default=dict, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    processado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "omie_webhook_event"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["topic"]),
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"Webhook {self.topic} {self.event_id} [{self.status}]"
+
+    def claim_for_processing(self) -> bool:
+        """
+        Passa para `processing` num único UPDATE condicional: só um worker
+        ganha o evento. Aceita received/failed e `processing` parado há mais de
+        OMIE_WEBHOOK_PROCESSING_TIMEOUT (worker que morreu no meio).
+        """
+        agora = timezone.now()
+        parado_desde = agora - timedelta(seconds=settings.OMIE_WEBHOOK_PROCESSING_TIMEOUT)
+        tomados = OmieWebhookEvent.objects.filter(
+            Q(status__in=["received", "failed"]) | Q(status="processing", updated_at__lt=parado_desde),
+            pk=self.pk,
+        ).update(status="processing", tentativas=F("tentativas") + 1, updated_at=agora)
+        self.refresh_from_db(fields=["status", "tentativas", "updated_at"])
+        return bool(tomados)
+
+    def mark_as_done(self, status: str, resultado: dict | None = None):
+        self.status = status
+        self.resultado = resultado or {}
+        self.mensagem_erro = None
+        self.processado_em = timezone.now()
+        self.save(update_fields=["status", "resultado", "mensagem_erro", "processado_em", "updated_at"])
+
+    def mark_as_failed(self, erro: str):
+        self.status = "failed"
+        self.mensagem_erro = erro
+        self.processado_em = timezone.now()
+        self.save(update_fields=["status", "mensagem_erro", "processado_em", "updated_at"])
 
-# Create your models here.
+    @property
+    def pode_retentar(self) -> bool:
+        return self.tentativas < self.max_tentativas and self.status in (
+            "received",
+            "failed",
+        )
@@ -0,0 +1,60 @@
+# omie_api/tasks.py
+
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from BackOffice.periodic import tarefa_periodica
+from BackOffice.dead_letters import TaskComDeadLetter
+
+from .models import OmieWebhookEvent
+from .webhooks import processar_evento
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, base=TaskComDeadLetter, max_retries=3)
+def processar_webhook_omie_task(self, evento_id: int):
+    """Executa a ação de um evento de webhook já persistido (ack feito pela view)."""
+    try:
+        evento = OmieWebhookEvent.objects.get(pk=evento_id)
+    except OmieWebhookEvent.DoesNotExist:
+        logger.warning("Evento de webhook %s não encontrado", evento_id)
+        return {"status": "not_found", "evento_id": evento_id}
+
+    evento = processar_evento(evento)
+    if evento.status == "failed" and evento.pode_retentar:
+        raise self.retry(exc=Exception(evento.mensagem_erro), countdown=60)
+
+    return {"status": evento.status, "evento_id": evento.id, "topic": evento.topic}
+
+
+@shared_task
+@tarefa_periodica(lock_ttl=10 * 60)
+def reprocessar_webhooks_pendentes_task(idade_minima_segundos: int = 300):
+    """
+    Task periódica: reenfileira eventos que ficaram parados (broker fora do ar
+    no momento do ack, worker reiniciado no meio do processamento) ou falharam
+    com tentativas restantes. `processing` só conta como parado depois de
+    OMIE_WEBHOOK_PROCESSING_TIMEOUT; cópias extras na fila não repetem o
+    handler (claim atômico em processar_evento).
+    """
+    agora = timezone.now()
+    limite = agora - timedelta(seconds=idade_minima_segundos)
+    parado_desde = agora - timedelta(seconds=settings.OMIE_WEBHOOK_PROCESSING_TIMEOUT)
+    ids = list(
+        OmieWebhookEvent.objects.filter(
+            Q(status__in=["received", "failed"], updated_at__lte=limite)
+            | Q(status="processing", updated_at__lt=parado_desde),
+            tentativas__lt=F("max_tentativas"),
+        ).values_list("id", flat=True)[:500]
+    )
+    for evento_id in ids:
+        processar_webhook_omie_task.delay(evento_id)
+
+    logger.info("Webhooks Omie reenfileirados: %s", len(ids))
+    return {"reenfileirados": len(ids)}
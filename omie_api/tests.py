@@ -1,3 +1,174 @@
-from django.test import TestCase
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from . import deadline
+from . import client as omie_client
+from .client import PrazoExcedido, sessao_http, timeout_omie
+from .concurrency import executar_em_paralelo
+from .models import OmieWebhookEvent
+from .webhooks import processar_evento
+
+
+@override_settings(OMIE_WEBHOOK_TOKEN="segredo", OMIE_APP_KEY="chave")
+class OmieWebhookTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse("omie-webhook") + "?token=segredo"
+
+    def _post(self, payload, url=None):
+        return self.client.post(url or self.url, data=json.dumps(payload), content_type="application/json")
+
+    @patch("omie_api.tasks.processar_webhook_omie_task.delay")
+    def test_ack_persiste_e_deduplica_por_message_id(self, mock_delay):
+        payload = {
+            "messageId": "abc-1", "appKey": "chave", "topic": "ContaPagar.Incluido",
+            "event": {"codigo_lancamento_omie": 10},
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            primeira = self._post(payload)
+        with self.captureOnCommitCallbacks(execute=True):
+            segunda = self._post(payload)
+
+        self.assertEqual(primeira.status_code, 200)
+        self.assertFalse(primeira.data["duplicado"])
+        self.assertTrue(segunda.data["duplicado"])
+        self.assertEqual(OmieWebhookEvent.objects.count(), 1)
+        mock_delay.assert_called_once_with(primeira.data["evento_id"])
+
+    def test_token_invalido_e_ping(self):
+        resp = self._post({"topic": "ContaPagar.Incluido"}, url=reverse("omie-webhook") + "?token=x")
+        self.assertEqual(resp.status_code, 403)
+
+        resp = self._post({"ping": "omie"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(OmieWebhookEvent.objects.count(), 0)
+
+    def test_app_key_ausente_ou_diferente_e_recusado(self):
+        for app_key in (None, "outra"):
+            payload = {"topic": "ContaPagar.Incluido", "event": {"codigo_lancamento_omie": 10}}
+            if app_key:
+                payload["appKey"] = app_key
+            self.assertEqual(self._post(payload).status_code, 403)
+        self.assertEqual(OmieWebhookEvent.objects.count(), 0)
+
+    @override_settings(OMIE_WEBHOOK_TOKEN="", DEBUG=False)
+    def test_sem_token_configurado_recusa_tudo(self):
+        payload = {"appKey": "chave", "topic": "PedidoCompra.Encerrado", "event": {"nCodPed": 1}}
+        for url in (reverse("omie-webhook"), reverse("omie-webhook") + "?token="):
+            self.assertEqual(self._post(payload, url=url).status_code, 403)
+        self.assertEqual(OmieWebhookEvent.objects.count(), 0)
+
+    @patch("attachments.signals.disparar_transferencia_por_integracao")
+    def test_processa_conta_pagar_mapeada(self, mock_disparar):
+        from attachments.models import AttachmentIntegrationMap
+
+        AttachmentIntegrationMap.objects.create(origem_recebimento_id=5, destino_conta_pagar_id=10)
+        mock_disparar.return_value.id = 1
+        mock_disparar.return_value.status = "success"
+        evento = OmieWebhookEvent.objects.create(
+            event_id="e1", topic="ContaPagar.Incluido",
+            payload={"event": {"codigo_lancamento_omie": 10}},
+        )
+
+        processar_evento(evento)
+
+        mock_disparar.assert_called_once_with(5, 10)
+        evento.refresh_from_db()
+        self.assertEqual(evento.status, "success")
+        self.assertEqual(evento.tentativas, 1)
+
+    def test_topico_sem_handler_ou_sem_mapeamento_fica_ignorado(self):
+        desconhecido = OmieWebhookEvent.objects.create(event_id="e2", topic="Produto.Alterado", payload={})
+        sem_mapa = OmieWebhookEvent.objects.create(
+            event_id="e3", topic="ContaPagar.Alterado",
+            payload={"event": {"codigo_lancamento_omie": 99}},
+        )
+
+        self.assertEqual(processar_evento(desconhecido).status, "ignored")
+        self.assertEqual(processar_evento(sem_mapa).status, "ignored")
+
+    @override_settings(OMIE_WEBHOOK_PROCESSING_TIMEOUT=600)
+    def test_evento_em_processamento_nao_roda_duas_vezes(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .tasks import reprocessar_webhooks_pendentes_task
+
+        evento = OmieWebhookEvent.objects.create(
+            event_id="e4", topic="ContaPagar.Incluido", payload={"event": {}},
+            status="processing", tentativas=1,
+        )
+        OmieWebhookEvent.objects.filter(pk=evento.pk).update(updated_at=timezone.now() - timedelta(seconds=400))
+        copia = OmieWebhookEvent.objects.get(pk=evento.pk)
+        mock_handler = MagicMock(return_value={})
+        self.enterContext(patch.dict("omie_api.webhooks.HANDLERS", {"ContaPagar.": mock_handler}))
+
+        with patch("omie_api.tasks.processar_webhook_omie_task.delay") as mock_delay:
+            reprocessar_webhooks_pendentes_task.run()
+        self.assertEqual(processar_evento(copia).status, "processing")
+        mock_delay.assert_not_called()
+        mock_handler.assert_not_called()
+
+        # Parado além do timeout: worker morto, o evento é retomado uma única vez
+        OmieWebhookEvent.objects.filter(pk=evento.pk).update(updated_at=timezone.now() - timedelta(seconds=700))
+        primeira, segunda = OmieWebhookEvent.objects.get(pk=evento.pk), OmieWebhookEvent.objects.get(pk=evento.pk)
+        self.assertEqual(processar_evento(primeira).status, "success")
+        self.assertEqual(processar_evento(segunda).status, "success")
+        mock_handler.assert_called_once()
+        self.assertEqual(primeira.tentativas, 2)
+
+
+class PrazoOmieTests(TestCase):
+    def test_timeout_deriva_do_prazo_e_prazo_aninhado_so_encurta(self):
+        self.assertEqual(timeout_omie(60), 60)
+        with deadline.prazo(10):
+            self.assertLessEqual(timeout_omie(60), 10)
+            with deadline.prazo(120):
+                self.assertLessEqual(timeout_omie(60), 10)
+        self.assertIsNone(deadline.restante())
+
+    def test_prazo_esgotado_nao_inicia_chamada(self):
+        with deadline.prazo(0.5):
+            with self.assertRaises(PrazoExcedido):
+                timeout_omie(60)
+
+    def test_prazo_vale_dentro_das_threads(self):
+        with deadline.prazo(30):
+            resultados = executar_em_paralelo(lambda _: deadline.restante(), range(4), max_workers=4)
+        self.assertTrue(all(0 < sobra <= 30 for sobra, erro in resultados))
+
+    @override_settings(OMIE_DEADLINE_MARGIN_SECONDS=5)
+    def test_task_usa_soft_time_limit_menos_margem(self):
+        task = SimpleNamespace(request=SimpleNamespace(timelimit=None), soft_time_limit=60, time_limit=None)
+
+        deadline.iniciar_prazo_task(task_id="t1", task=task)
+        try:
+            self.assertAlmostEqual(deadline.restante(), 55, delta=1)
+        finally:
+            deadline.encerrar_prazo_task(task_id="t1")
+        self.assertIsNone(deadline.restante())
+
+
+class WorkerThreadsTests(TestCase):
+    def test_sessao_http_por_thread(self):
+        principal = sessao_http()
+        outras = executar_em_paralelo(lambda _: id(sessao_http()), range(2), max_workers=2)
+
+        self.assertIs(sessao_http(), principal)
+        self.assertNotIn(id(principal), [sessao for sessao, erro in outras])
+        # Após um fork o filho abre a própria sessão
+        omie_client._descartar_sessao()
+        self.assertIsNot(sessao_http(), principal)
+
+    def test_tasks_omie_roteadas_para_fila_de_io(self):
+        from DjangoProject.celery import app
+
+        rotear = app.amqp.router.route
+        self.assertEqual(rotear({}, "attachments.tasks.transferir_anexos_task")["queue"].name, "omie_io")
+        self.assertEqual(rotear({}, "purchase_orders.tasks.robo_sincronizar_pedidos")["queue"].name, "omie_io")
+        self.assertEqual(rotear({}, "BackOffice.tasks.aplicar_retencao_logs_task")["queue"].name, "celery")
@@ -1,3 +1,82 @@
-from django.shortcuts import render
+# omie_api/views.py
 
-# Create your views here.
+import json
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.crypto import constant_time_compare
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import OmieWebhookEvent
+from .webhooks import identificar_evento
+
+logger = logging.getLogger(__name__)
+
+
+class OmieWebhookView(APIView):
+    """
+    Receptor de webhooks da Omie.
+    Valida, persiste o evento bruto e responde imediatamente; a ação
+    (transferência de anexos / encerramento de PC) roda na task Celery.
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        # Sem autenticação do DRF: o token é a única barreira. Fora do DEBUG,
+        # sem OMIE_WEBHOOK_TOKEN configurado tudo é recusado (falha fechada).
+        token_esperado = settings.OMIE_WEBHOOK_TOKEN
+        if not token_esperado and not settings.DEBUG:
+            logger.error("Webhook Omie recusado: OMIE_WEBHOOK_TOKEN não configurado")
+            return Response({"detail": "webhook não configurado"}, status=status.HTTP_403_FORBIDDEN)
+        if token_esperado:
+            token = request.query_params.get("token") or request.headers.get("X-Webhook-Token", "")
+            if not constant_time_compare(token, token_esperado):
+                return Response({"detail": "token inválido"}, status=status.HTTP_403_FORBIDDEN)
+
+        corpo = request.body
+        try:
+            payload = json.loads(corpo or b"{}")
+        except ValueError:
+            return Response({"detail": "JSON inválido"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(payload, dict):
+            return Response({"detail": "JSON inválido"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Ping enviado pela Omie ao cadastrar o webhook
+        if payload.get("ping"):
+            return Response({"pong": True})
+
+        # O appKey do evento precisa existir e ser o da conta configurada
+        app_key = str(payload.get("appKey") or "")
+        if settings.OMIE_APP_KEY or not settings.DEBUG:
+            if not app_key or not constant_time_compare(app_key, str(settings.OMIE_APP_KEY)):
+                return Response({"detail": "appKey ausente ou não corresponde"}, status=status.HTTP_403_FORBIDDEN)
+
+        topic = str(payload.get("topic") or "")
+        if not topic:
+            return Response({"detail": "topic é obrigatório"}, status=status.HTTP_400_BAD_REQUEST)
+
+        event_id = identificar_evento(payload, corpo)
+        try:
+            with transaction.atomic():
+                evento, criado = OmieWebhookEvent.objects.get_or_create(
+                    event_id=event_id,
+                    defaults={"topic": topic[:100], "payload": payload},
+                )
+        except IntegrityError:
+            # Entrega concorrente do mesmo evento
+            evento, criado = OmieWebhookEvent.objects.get(event_id=event_id), False
+
+        if criado:
+            from .tasks import processar_webhook_omie_task
+
+            transaction.on_commit(lambda: processar_webhook_omie_task.delay(evento.id))
+        else:
+            logger.info("Webhook Omie duplicado ignorado: %s (%s)", event_id, topic)
+
+        return Response({"evento_id": evento.id, "duplicado": not criado})
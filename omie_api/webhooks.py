@@ -0,0 +1,135 @@
+# omie_api/webhooks.py
+
+import hashlib
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from .models import OmieWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+
+class EventoIgnorado(Exception):
+    """O evento é válido, mas não há ação a executar (ex.: sem mapeamento local)."""
+    pass
+
+
+def identificar_evento(payload: Dict[str, Any], corpo: bytes) -> str:
+    """messageId da Omie; na ausência, hash do corpo (reenvios idênticos deduplicam)."""
+    event_id = payload.get("messageId") or payload.get("message_id")
+    if event_id:
+        return str(event_id)[:100]
+    return "sha256:" + hashlib.sha256(corpo).hexdigest()
+
+
+def _primeiro(evento: Dict[str, Any], *chaves: str) -> Optional[Any]:
+    for chave in chaves:
+        valor = evento.get(chave)
+        if valor not in (None, "", 0):
+            return valor
+    return None
+
+
+# ---------- handlers por tópico ----------
+
+def _conta_pagar(evento: Dict[str, Any]) -> dict:
+    """Título incluído/alterado: transfere anexos do recebimento mapeado para ele."""
+    from attachments.models import AttachmentIntegrationMap
+    from attachments.signals import disparar_transferencia_por_integracao
+
+    destino_id = _primeiro(evento, "codigo_lancamento_omie", "nCodTitulo")
+    if not destino_id:
+        raise EventoIgnorado("evento sem codigo_lancamento_omie")
+
+    origens = list(
+        AttachmentIntegrationMap.objects.filter(destino_conta_pagar_id=destino_id)
+        .values_list("origem_recebimento_id", flat=True)
+    )
+    if not origens:
+        raise EventoIgnorado(f"título {destino_id} sem recebimento mapeado")
+
+    logs = [disparar_transferencia_por_integracao(origem, int(destino_id)) for origem in origens]
+    return {"transferencias": [{"log_id": log.id, "status": log.status} for log in logs]}
+
+
+def _recebimento(evento: Dict[str, Any]) -> dict:
+    """Recebimento concluído: transfere anexos para os títulos já mapeados."""
+    from attachments.models import AttachmentIntegrationMap
+    from attachments.signals import disparar_transferencia_por_integracao
+
+    origem_id = _primeiro(evento, "nIdReceb", "idReceb")
+    if not origem_id:
+        raise EventoIgnorado("evento sem nIdReceb")
+
+    destinos = list(
+        AttachmentIntegrationMap.objects.filter(origem_recebimento_id=origem_id)
+        .values_list("destino_conta_pagar_id", flat=True)
+    )
+    if not destinos:
+        raise EventoIgnorado(f"recebimento {origem_id} sem título mapeado")
+
+    logs = [disparar_transferencia_por_integracao(int(origem_id), destino) for destino in destinos]
+    return {"transferencias": [{"log_id": log.id, "status": log.status} for log in logs]}
+
+
+def _pedido(evento: Dict[str, Any]) -> dict:
+    """NF de serviço vinculada ao pedido: dispara o encerramento (RF-002)."""
+    from purchase_orders.signals import disparar_encerramento_por_integracao
+
+    numero_pedido = _primeiro(evento, "cNumero", "numero_pedido", "cNumeroPedido")
+    numero_nf = _primeiro(evento, "cNumeroNF", "numero_nf_servico", "nNumeroNF")
+    id_nf = _primeiro(evento, "nIdNF", "id_nf_servico", "nCodNF")
+    if not all([numero_pedido, numero_nf, id_nf]):
+        raise EventoIgnorado("evento sem pedido/NF de serviço")
+
+    log = disparar_encerramento_por_integracao(
+        numero_pedido=str(numero_pedido),
+        item_pedido=_primeiro(evento, "cCodItem", "item_pedido"),
+        numero_nf_servico=str(numero_nf),
+        id_nf_servico=int(id_nf),
+    )
+    return {"encerramento": {"log_id": log.id, "status": log.status}}
+
+
+# Prefixos de tópico -> handler (ajuste conforme os tópicos habilitados na conta Omie)
+HANDLERS: Dict[str, Callable[[Dict[str, Any]], dict]] = {
+    "ContaPagar.": _conta_pagar,
+    "Financas.ContaPagar.": _conta_pagar,
+    "RecebimentoProduto.": _recebimento,
+    "Recebimento.": _recebimento,
+    "PedidoCompra.": _pedido,
+    "CompraProduto.": _pedido,
+}
+
+
+def resolver_handler(topic: str) -> Optional[Callable[[Dict[str, Any]], dict]]:
+    for prefixo, handler in HANDLERS.items():
+        if topic.startswith(prefixo):
+            return handler
+    return None
+
+
+def processar_evento(evento: OmieWebhookEvent) -> OmieWebhookEvent:
+    """
+    Executa a ação do evento e registra o resultado (usado pela task Celery).
+    Evento já concluído ou em processamento por outro worker não é repetido.
+    """
+    if not evento.claim_for_processing():
+        return evento
+
+    handler = resolver_handler(evento.topic)
+    if handler is None:
+        evento.mark_as_done("ignored", {"motivo": f"tópico não tratado: {evento.topic}"})
+        return evento
+
+    try:
+        resultado = handler(evento.payload.get("event") or {})
+    except EventoIgnorado as exc:
+        evento.mark_as_done("ignored", {"motivo": str(exc)})
+    except Exception as exc:
+        logger.exception("Erro ao processar webhook Omie %s (%s)", evento.event_id, evento.topic)
+        evento.mark_as_failed(str(exc))
+    else:
+        evento.mark_as_done("success", json.loads(json.dumps(resultado, default=str)))
+    return evento
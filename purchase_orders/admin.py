@@ -1,8 +1,40 @@
 from django.contrib import admin
-from .models import PurchaseOrderClosureLog
+from .models import (
+    PurchaseOrderClosedIndex,
+    PurchaseOrderClosureLog,
+    PurchaseOrderOutbox,
+    PurchaseOrderOutboxFile,
+    Supplier,
+)
 
 @admin.register(PurchaseOrderClosureLog)
 class PurchaseOrderClosureLogAdmin(admin.ModelAdmin):
     list_display = ("id", "numero_pedido", "item_pedido", "status", "tentativas", "created_at")
     list_filter = ("status", "created_at")
     search_fields = ("numero_pedido", "item_pedido", "numero_nf_servico", "id_nf_servico")
+
+@admin.register(PurchaseOrderClosedIndex)
+class PurchaseOrderClosedIndexAdmin(admin.ModelAdmin):
+    list_display = ("numero_pedido", "status_omie", "confirmado_em")
+    search_fields = ("numero_pedido",)
+    list_filter = ("confirmado_em",)
+
+class PurchaseOrderOutboxFileInline(admin.TabularInline):
+    model = PurchaseOrderOutboxFile
+    extra = 0
+    readonly_fields = ("nome_arquivo", "tamanho", "enviado", "enviado_em", "mensagem_erro")
+    exclude = ("caminho_spool",)
+
+@admin.register(PurchaseOrderOutbox)
+class PurchaseOrderOutboxAdmin(admin.ModelAdmin):
+    list_display = ("id", "cod_int_pedido", "purchase_order", "status", "tentativas", "created_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("cod_int_pedido",)
+    inlines = [PurchaseOrderOutboxFileInline]
+
+@admin.register(Supplier)
+class SupplierAdmin(admin.ModelAdmin):
+    list_display = ("codigo_omie", "razao_social", "nome_fantasia", "cnpj_cpf", "inativo", "alterado_omie_em")
+    list_filter = ("inativo",)
+    search_fields = ("razao_social_busca", "nome_fantasia_busca", "documento_busca")
+    readonly_fields = ("razao_social_busca", "nome_fantasia_busca", "documento_busca", "created_at", "updated_at")
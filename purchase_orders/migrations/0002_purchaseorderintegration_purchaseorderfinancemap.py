@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseOrderIntegration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cod_int_pedido', models.CharField(blank=True, max_length=50, null=True, unique=True)),
+                ('ncodped_omie', models.BigIntegerField(unique=True)),
+                ('origem', models.CharField(choices=[('backoffice', 'Criado pelo BackOffice'), ('omie', 'Criado direto no Omie')], max_length=20)),
+                ('metodo_criacao', models.CharField(choices=[('sistema', 'BackOffice - apenas pedido'), ('sistema_full_flow', 'BackOffice - pedido + financeiro'), ('robo', 'Detectado / processado pelo robô')], max_length=30)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PurchaseOrderFinanceMap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo_lancamento_omie', models.BigIntegerField(unique=True)),
+                ('metodo_criacao', models.CharField(choices=[('robo', 'Gerado pelo robô'), ('sistema_full_flow', 'Fluxo completo BackOffice')], max_length=30)),
+                ('anexos_sincronizados', models.BooleanField(default=False)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('purchase_order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='finance_map', to='purchase_orders.purchaseorderintegration')),
+            ],
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def marcar_pedidos_com_financeiro(apps, schema_editor):
+    PurchaseOrderIntegration = apps.get_model('purchase_orders', 'PurchaseOrderIntegration')
+    PurchaseOrderIntegration.objects.filter(finance_map__isnull=False).update(
+        status_fluxo='financed',
+        next_check_at=None,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_orders', '0002_purchaseorderintegration_purchaseorderfinancemap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorderintegration',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='purchaseorderintegration',
+            name='next_check_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.AddField(
+            model_name='purchaseorderintegration',
+            name='status_fluxo',
+            field=models.CharField(choices=[('awaiting_close', 'Aguardando encerramento'), ('financed', 'Financeiro gerado'), ('cancelled', 'Cancelado no Omie')], default='awaiting_close', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='purchaseorderintegration',
+            name='tentativas_verificacao',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='purchaseorderintegration',
+            name='ultima_verificacao_em',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderintegration',
+            index=models.Index(fields=['status_fluxo', 'next_check_at'], name='purchase_or_status__bab8a0_idx'),
+        ),
+        migrations.RunPython(marcar_pedidos_com_financeiro, migrations.RunPython.noop),
+    ]
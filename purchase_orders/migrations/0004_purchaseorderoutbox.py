@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_orders', '0003_purchaseorderintegration_fila_reverificacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseOrderOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cod_int_pedido', models.CharField(max_length=50, unique=True)),
+                ('pedido_data', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('processing', 'Processando'), ('success', 'Sucesso'), ('failed', 'Falhou')], default='pending', max_length=20)),
+                ('tentativas', models.IntegerField(default=0)),
+                ('max_tentativas', models.IntegerField(default=5)),
+                ('mensagem_erro', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('processado_em', models.DateTimeField(blank=True, null=True)),
+                ('purchase_order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outbox', to='purchase_orders.purchaseorderintegration')),
+            ],
+            options={
+                'db_table': 'purchase_order_outbox',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PurchaseOrderOutboxFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome_arquivo', models.CharField(max_length=255)),
+                ('caminho_spool', models.CharField(max_length=500)),
+                ('tamanho', models.BigIntegerField(default=0)),
+                ('enviado', models.BooleanField(default=False)),
+                ('enviado_em', models.DateTimeField(blank=True, null=True)),
+                ('mensagem_erro', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('outbox', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='arquivos', to='purchase_orders.purchaseorderoutbox')),
+            ],
+            options={
+                'db_table': 'purchase_order_outbox_file',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderoutbox',
+            index=models.Index(fields=['status'], name='purchase_or_status_c31faf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderoutbox',
+            index=models.Index(fields=['created_at'], name='purchase_or_created_13e573_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:50
+
+from django.db import migrations, models
+
+TRIGRAM_INDEXES = (
+    ('supplier_razao_trgm_idx', 'razao_social_busca'),
+    ('supplier_fantasia_trgm_idx', 'nome_fantasia_busca'),
+    ('supplier_documento_trgm_idx', 'documento_busca'),
+)
+
+
+def criar_indices_trigram(apps, schema_editor):
+    # Busca "contém" do autocomplete; só existe no PostgreSQL (pg_trgm)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for nome, coluna in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {nome} ON supplier USING gin ({coluna} gin_trgm_ops)'
+        )
+
+
+def remover_indices_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nome, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nome}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_orders', '0004_purchaseorderoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Supplier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo_omie', models.BigIntegerField(unique=True)),
+                ('razao_social', models.CharField(blank=True, max_length=255)),
+                ('nome_fantasia', models.CharField(blank=True, max_length=255)),
+                ('cnpj_cpf', models.CharField(blank=True, max_length=30)),
+                ('razao_social_busca', models.CharField(blank=True, max_length=255)),
+                ('nome_fantasia_busca', models.CharField(blank=True, max_length=255)),
+                ('documento_busca', models.CharField(blank=True, max_length=20)),
+                ('inativo', models.BooleanField(default=False)),
+                ('alterado_omie_em', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'supplier',
+                'ordering': ['razao_social_busca'],
+                'indexes': [models.Index(fields=['razao_social_busca'], name='supplier_razao_busca_idx', opclasses=['varchar_pattern_ops']), models.Index(fields=['nome_fantasia_busca'], name='supplier_fantasia_busca_idx', opclasses=['varchar_pattern_ops']), models.Index(fields=['documento_busca'], name='supplier_documento_busca_idx', opclasses=['varchar_pattern_ops']), models.Index(fields=['alterado_omie_em'], name='supplier_alterado_omie_idx')],
+            },
+        ),
+        migrations.RunPython(criar_indices_trigram, remover_indices_trigram),
+    ]
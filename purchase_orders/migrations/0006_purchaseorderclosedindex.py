@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:54
+
+from django.db import migrations, models
+
+
+def popular_indice_com_logs(apps, schema_editor):
+    # Encerramentos de pedido inteiro já registrados com sucesso
+    PurchaseOrderClosureLog = apps.get_model('purchase_orders', 'PurchaseOrderClosureLog')
+    PurchaseOrderClosedIndex = apps.get_model('purchase_orders', 'PurchaseOrderClosedIndex')
+
+    encerrados = {}
+    logs = (
+        PurchaseOrderClosureLog.objects.filter(status='success', item_pedido__isnull=True, processado_em__isnull=False)
+        .order_by('processado_em')
+        .values_list('numero_pedido', 'detalhes', 'processado_em')
+    )
+    for numero, detalhes, processado_em in logs.iterator():
+        status_omie = (detalhes or {}).get('status_novo') or 'Encerrado'
+        encerrados[numero] = PurchaseOrderClosedIndex(
+            numero_pedido=numero, status_omie=str(status_omie)[:30], confirmado_em=processado_em
+        )
+    PurchaseOrderClosedIndex.objects.bulk_create(encerrados.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_orders', '0005_supplier'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseOrderClosedIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero_pedido', models.CharField(max_length=50, unique=True)),
+                ('status_omie', models.CharField(max_length=30)),
+                ('confirmado_em', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'purchase_order_closed_index',
+            },
+        ),
+        migrations.RunPython(popular_indice_com_logs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_orders', '0006_purchaseorderclosedindex'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='purchaseorderintegration',
+            name='purchase_or_status__bab8a0_idx',
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderclosurelog',
+            index=models.Index(condition=models.Q(('status', 'failed'), ('tentativas__lt', models.F('max_tentativas'))), fields=['created_at'], name='pocl_retentaveis_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderclosurelog',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['numero_pedido'], name='pocl_pendentes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderintegration',
+            index=models.Index(condition=models.Q(('status_fluxo', 'awaiting_close')), fields=['next_check_at'], name='poi_aguardando_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderoutbox',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'failed']), ('tentativas__lt', models.F('max_tentativas'))), fields=['created_at'], name='pob_retentaveis_idx'),
+        ),
+    ]
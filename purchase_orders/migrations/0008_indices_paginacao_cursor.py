@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_orders', '0007_indices_parciais_pendentes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='purchaseorderclosurelog',
+            name='purchase_or_created_6b2383_idx',
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderclosurelog',
+            index=models.Index(fields=['created_at', 'id'], name='purchase_or_created_dae9d5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderfinancemap',
+            index=models.Index(fields=['created_at', 'id'], name='purchase_or_created_80beed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderintegration',
+            index=models.Index(fields=['created_at', 'id'], name='purchase_or_created_e8f08a_idx'),
+        ),
+    ]
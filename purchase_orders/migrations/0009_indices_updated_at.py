@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchase_orders', '0008_indices_paginacao_cursor'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchaseorderclosurelog',
+            index=models.Index(fields=['updated_at'], name='purchase_or_updated_5312c9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderfinancemap',
+            index=models.Index(fields=['updated_at'], name='purchase_or_updated_ff406c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderintegration',
+            index=models.Index(fields=['updated_at'], name='purchase_or_updated_a8da70_idx'),
+        ),
+    ]
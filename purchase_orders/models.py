@@ -1,12 +1,22 @@
 # purchase_orders/models.py
 
+import re
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.db.models import F, Q
 from django.utils import timezone
 
+from BackOffice.models import DashboardCounterMixin
+
 
-class PurchaseOrderClosureLog(models.Model):
+class PurchaseOrderClosureLog(DashboardCounterMixin, models.Model):
     """Log de encerramento automático de pedidos de compra (RF-002)."""
 
+    metrica_dashboard = "encerramentos_pedido"
+
     STATUS_CHOICES = [
         ("pending", "Pendente"),
         ("processing", "Processando"),
@@ -37,7 +47,17 @@ class PurchaseOrderClosureLog(models.Model):
         indexes = [
             models.Index(fields=["numero_pedido"]),
             models.Index(fields=["status"]),
-            models.Index(fields=["created_at"]),
+            # (created_at, id): paginação por cursor e varredura da retenção
+            models.Index(fields=["created_at", "id"]),
+            # MAX(updated_at) dos validadores de GET condicional
+            models.Index(fields=["updated_at"]),
+            # Índices parciais para o trabalho pendente (reprocessar_falhas / consolidação)
+            models.Index(
+                fields=["created_at"],
+                name="pocl_retentaveis_idx",
+                condition=Q(status="failed", tentativas__lt=F("max_tentativas")),
+            ),
+            models.Index(fields=["numero_pedido"], name="pocl_pendentes_idx", condition=Q(status="pending")),
         ]
 
     def __str__(self):
@@ -83,6 +103,47 @@ class PurchaseOrderClosureLog(models.Model):
         )
 
 
+class PurchaseOrderClosedIndex(models.Model):
+    """
+    Índice local de pedidos confirmados como encerrados (RF-002).
+    Alimentado junto com os logs de encerramento bem-sucedidos, permite
+    responder solicitações repetidas sem consultar a Omie.
+    """
+
+    numero_pedido = models.CharField(max_length=50, unique=True)
+    status_omie = models.CharField(max_length=30)
+    confirmado_em = models.DateTimeField()
+
+    class Meta:
+        db_table = "purchase_order_closed_index"
+
+    def __str__(self):
+        return f"PC {self.numero_pedido} [{self.status_omie} @ {self.confirmado_em:%Y-%m-%d %H:%M}]"
+
+    @classmethod
+    def validos(cls, numeros_pedido) -> dict:
+        """Entradas confirmadas dentro de PO_CLOSED_INDEX_MAX_AGE_SECONDS, por número do pedido."""
+        limite = timezone.now() - timedelta(seconds=settings.PO_CLOSED_INDEX_MAX_AGE_SECONDS)
+        entradas = cls.objects.filter(numero_pedido__in=list(numeros_pedido), confirmado_em__gte=limite)
+        return {e.numero_pedido: e for e in entradas}
+
+    @classmethod
+    def registrar(cls, encerrados: dict):
+        """Upsert de {numero_pedido: status_omie} com confirmado_em = agora."""
+        if not encerrados:
+            return
+        agora = timezone.now()
+        cls.objects.bulk_create(
+            [
+                cls(numero_pedido=numero, status_omie=(status or "")[:30], confirmado_em=agora)
+                for numero, status in encerrados.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["numero_pedido"],
+            update_fields=["status_omie", "confirmado_em"],
+        )
+
+
 class PurchaseOrderIntegration(models.Model):
     ORIGEM_CHOICES = (
         ("backoffice", "Criado pelo BackOffice"),
@@ -95,6 +156,12 @@ class PurchaseOrderIntegration(models.Model):
         ("robo", "Detectado / processado pelo robô"),
     )
 
+    STATUS_FLUXO_CHOICES = (
+        ("awaiting_close", "Aguardando encerramento"),
+        ("financed", "Financeiro gerado"),
+        ("cancelled", "Cancelado no Omie"),
+    )
+
     cod_int_pedido = models.CharField(
         max_length=50,
         null=True,
@@ -106,14 +173,90 @@ class PurchaseOrderIntegration(models.Model):
     origem = models.CharField(max_length=20, choices=ORIGEM_CHOICES)
     metodo_criacao = models.CharField(max_length=30, choices=METODO_CRIACAO_CHOICES)
 
+    # Fila de reverificação (full-flow): só pedidos vencidos são consultados na Omie
+    status_fluxo = models.CharField(
+        max_length=20,
+        choices=STATUS_FLUXO_CHOICES,
+        default="awaiting_close",
+    )
+    tentativas_verificacao = models.IntegerField(default=0)
+    next_check_at = models.DateTimeField(null=True, blank=True, default=timezone.now)
+    ultima_verificacao_em = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["updated_at"]),
+            # Parcial: a fila de reverificação é uma fração pequena dos pedidos
+            models.Index(
+                fields=["next_check_at"],
+                name="poi_aguardando_idx",
+                condition=Q(status_fluxo="awaiting_close"),
+            ),
+        ]
+
     def __str__(self) -> str:
         return f"PO {self.ncodped_omie} [{self.origem}/{self.metodo_criacao}]"
 
+    def agendar_proxima_verificacao(self, erro: str = ""):
+        """Reagenda a consulta com backoff exponencial (base * 2^tentativas, limitado)."""
+        base = settings.FULL_FLOW_RECHECK_BASE_SECONDS
+        maximo = settings.FULL_FLOW_RECHECK_MAX_SECONDS
+        atraso = min(base * (2 ** min(self.tentativas_verificacao, 32)), maximo)
+
+        agora = timezone.now()
+        self.tentativas_verificacao += 1
+        self.ultima_verificacao_em = agora
+        self.next_check_at = agora + timedelta(seconds=atraso)
+        self.last_error = erro
+        self.save(
+            update_fields=[
+                "tentativas_verificacao",
+                "ultima_verificacao_em",
+                "next_check_at",
+                "last_error",
+                "updated_at",
+            ]
+        )
+
+    def mark_as_financed(self):
+        self.status_fluxo = "financed"
+        self.ultima_verificacao_em = timezone.now()
+        self.next_check_at = None
+        self.last_error = ""
+        self.save(
+            update_fields=[
+                "status_fluxo",
+                "ultima_verificacao_em",
+                "next_check_at",
+                "last_error",
+                "updated_at",
+            ]
+        )
+
+    def mark_as_cancelled(self):
+        self.status_fluxo = "cancelled"
+        self.ultima_verificacao_em = timezone.now()
+        self.next_check_at = None
+        self.save(
+            update_fields=[
+                "status_fluxo",
+                "ultima_verificacao_em",
+                "next_check_at",
+                "updated_at",
+            ]
+        )
+
+
+class PurchaseOrderFinanceMap(DashboardCounterMixin, models.Model):
+    # Sem status: a contagem é por método de criação (robô x full-flow)
+    metrica_dashboard = "mapas_financeiro"
+    campo_status_dashboard = "metodo_criacao"
 
-class PurchaseOrderFinanceMap(models.Model):
     METODO_CHOICES = (
         ("robo", "Gerado pelo robô"),
         ("sistema_full_flow", "Fluxo completo BackOffice"),
@@ -134,8 +277,192 @@ class PurchaseOrderFinanceMap(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["updated_at"]),
+        ]
+
     def __str__(self) -> str:
         return (
             f"PO {self.purchase_order.ncodped_omie} -> "
             f"FIN {self.codigo_lancamento_omie} ({self.metodo_criacao})"
         )
+
+
+class PurchaseOrderOutbox(models.Model):
+    """
+    Intenção de criação de pedido via full-flow, registrada pelo endpoint e
+    processada de forma assíncrona (pedido na Omie + upload dos anexos em spool).
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Pendente"),
+        ("processing", "Processando"),
+        ("success", "Sucesso"),
+        ("failed", "Falhou"),
+    ]
+
+    cod_int_pedido = models.CharField(max_length=50, unique=True)
+    pedido_data = models.JSONField(default=dict, blank=True)
+
+    purchase_order = models.OneToOneField(
+        PurchaseOrderIntegration,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="outbox",
+    )
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    tentativas = models.IntegerField(default=0)
+    max_tentativas = models.IntegerField(default=5)
+    mensagem_erro = models.TextField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    processado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "purchase_order_outbox"
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status"]),
+            models.Index(fields=["created_at"]),
+            models.Index(
+                fields=["created_at"],
+                name="pob_retentaveis_idx",
+                condition=Q(status__in=["pending", "failed"], tentativas__lt=F("max_tentativas")),
+            ),
+        ]
+
+    def __str__(self):
+        return f"Outbox PC {self.cod_int_pedido} [{self.status}]"
+
+    def claim_for_processing(self) -> bool:
+        """
+        Passa para `processing` num único UPDATE condicional: só um worker
+        ganha a linha. Aceita pending/failed e `processing` parado há mais de
+        FULL_FLOW_OUTBOX_PROCESSING_TIMEOUT (worker que morreu no meio).
+        """
+        agora = timezone.now()
+        parado_desde = agora - timedelta(seconds=settings.FULL_FLOW_OUTBOX_PROCESSING_TIMEOUT)
+        tomadas = PurchaseOrderOutbox.objects.filter(
+            Q(status__in=["pending", "failed"]) | Q(status="processing", updated_at__lt=parado_desde),
+            pk=self.pk,
+        ).update(status="processing", tentativas=F("tentativas") + 1, updated_at=agora)
+        if tomadas:
+            self.refresh_from_db(fields=["status", "tentativas", "updated_at"])
+        return bool(tomadas)
+
+    def mark_as_success(self):
+        self.status = "success"
+        self.mensagem_erro = None
+        self.processado_em = timezone.now()
+        self.save(update_fields=["status", "mensagem_erro", "processado_em", "updated_at"])
+
+    def mark_as_failed(self, erro: str):
+        self.status = "failed"
+        self.mensagem_erro = erro
+        self.processado_em = timezone.now()
+        self.save(update_fields=["status", "mensagem_erro", "processado_em", "updated_at"])
+
+    @property
+    def pode_retentar(self) -> bool:
+        return self.tentativas < self.max_tentativas and self.status in (
+            "pending",
+            "failed",
+        )
+
+
+class PurchaseOrderOutboxFile(models.Model):
+    """Anexo recebido pelo full-flow, guardado em spool local até o upload na Omie."""
+
+    outbox = models.ForeignKey(
+        PurchaseOrderOutbox,
+        on_delete=models.CASCADE,
+        related_name="arquivos",
+    )
+    nome_arquivo = models.CharField(max_length=255)
+    caminho_spool = models.CharField(max_length=500)
+    tamanho = models.BigIntegerField(default=0)
+
+    enviado = models.BooleanField(default=False)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+    mensagem_erro = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "purchase_order_outbox_file"
+
+    def __str__(self):
+        return f"{self.nome_arquivo} ({'enviado' if self.enviado else 'pendente'})"
+
+
+def normalizar_busca(valor: str | None) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados (chave de busca de fornecedores)."""
+    texto = unicodedata.normalize("NFKD", valor or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.lower().split())
+
+
+def somente_digitos(valor: str | None) -> str:
+    return re.sub(r"\D", "", valor or "")
+
+
+class Supplier(models.Model):
+    """
+    Espelho local dos fornecedores do Omie (ListarClientes), sincronizado
+    incrementalmente por task Celery e usado pelo autocomplete.
+    """
+
+    codigo_omie = models.BigIntegerField(unique=True)
+    razao_social = models.CharField(max_length=255, blank=True)
+    nome_fantasia = models.CharField(max_length=255, blank=True)
+    cnpj_cpf = models.CharField(max_length=30, blank=True)
+
+    # Colunas normalizadas para busca por prefixo (índices varchar_pattern_ops/trigram)
+    razao_social_busca = models.CharField(max_length=255, blank=True)
+    nome_fantasia_busca = models.CharField(max_length=255, blank=True)
+    documento_busca = models.CharField(max_length=20, blank=True)
+
+    inativo = models.BooleanField(default=False)
+    alterado_omie_em = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "supplier"
+        ordering = ["razao_social_busca"]
+        indexes = [
+            models.Index(
+                fields=["razao_social_busca"],
+                name="supplier_razao_busca_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+            models.Index(
+                fields=["nome_fantasia_busca"],
+                name="supplier_fantasia_busca_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+            models.Index(
+                fields=["documento_busca"],
+                name="supplier_documento_busca_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+            models.Index(fields=["alterado_omie_em"], name="supplier_alterado_omie_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.codigo_omie} - {self.razao_social or self.nome_fantasia}"
+
+    def save(self, *args, **kwargs):
+        self.preencher_campos_busca()
+        super().save(*args, **kwargs)
+
+    def preencher_campos_busca(self):
+        self.razao_social_busca = normalizar_busca(self.razao_social)[:255]
+        self.nome_fantasia_busca = normalizar_busca(self.nome_fantasia)[:255]
+        self.documento_busca = somente_digitos(self.cnpj_cpf)[:20]
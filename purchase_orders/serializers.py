@@ -14,6 +14,12 @@ class PurchaseOrderClosureLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = PurchaseOrderClosureLog
         fields = "__all__"
+        # Listagem (LeanListMixin): colunas leves por padrão; pesadas via ?expand=
+        list_fields = (
+            "id", "numero_pedido", "item_pedido", "numero_nf_servico", "id_nf_servico",
+            "status", "tentativas", "created_at", "processado_em",
+        )
+        expandable_fields = ("mensagem_erro", "detalhes", "max_tentativas", "updated_at")
 
 
 class PurchaseOrderIntegrationSerializer(serializers.ModelSerializer):
@@ -23,6 +29,13 @@ class PurchaseOrderIntegrationSerializer(serializers.ModelSerializer):
     class Meta:
         model = PurchaseOrderIntegration
         fields = "__all__"
+        list_fields = (
+            "id", "cod_int_pedido", "ncodped_omie", "origem", "metodo_criacao",
+            "status_fluxo", "created_at",
+        )
+        expandable_fields = (
+            "tentativas_verificacao", "next_check_at", "ultima_verificacao_em", "last_error", "updated_at",
+        )
 
 
 class PurchaseOrderFinanceMapSerializer(serializers.ModelSerializer):
@@ -32,3 +45,8 @@ class PurchaseOrderFinanceMapSerializer(serializers.ModelSerializer):
     class Meta:
         model = PurchaseOrderFinanceMap
         fields = "__all__"
+        list_fields = (
+            "id", "purchase_order", "codigo_lancamento_omie", "metodo_criacao",
+            "anexos_sincronizados", "created_at",
+        )
+        expandable_fields = ("last_error", "updated_at")
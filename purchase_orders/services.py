@@ -1,16 +1,31 @@
 import base64
 import logging
-import requests
-from django.conf import settings
+import time
+import uuid
+from datetime import datetime, timedelta
 
-from django.db import transaction
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, models, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
 
-from omie_api.client import OmieAPIClient, OmieAPIException
+from omie_api.client import OmieAPIClient, OmieAPIException, sessao_http, timeout_omie
+from omie_api.concurrency import executar_em_paralelo
 from attachments.models import AttachmentSyncLog
+from BackOffice.models import DashboardCounter
+from BackOffice.progress import Progresso, canal
+from BackOffice.tracing import anotar, span
 from .models import (
+    PurchaseOrderClosedIndex,
     PurchaseOrderClosureLog,
     PurchaseOrderIntegration,
     PurchaseOrderFinanceMap,
+    PurchaseOrderOutbox,
+    PurchaseOrderOutboxFile,
+    Supplier,
+    normalizar_busca,
+    somente_digitos,
 )
 
 logger = logging.getLogger(__name__)
@@ -27,59 +42,612 @@ class OmieClient:
             "param": [body],
         }
         url = f"{cls.BASE_URL}{endpoint}"
-        resp = requests.post(url, json=payload, timeout=30)
-        resp.raise_for_status()
-        return resp.json()
+        with span(f"omie {method}", tipo="CLIENT", **{"omie.call": method, "omie.endpoint": endpoint}):
+            resp = sessao_http().post(url, json=payload, timeout=timeout_omie(30))
+            resp.raise_for_status()
+            return resp.json()
+
+
+class PurchaseOrderClosureService:
+    """
+    RF-002: encerra o pedido de compra na Omie quando a NF de serviço é lançada.
+    - confere o índice local de pedidos já encerrados (sem ir à Omie)
+    - consulta o status atual do pedido
+    - se já estiver encerrado, registra sucesso sem ação
+    - caso contrário, chama a API de encerramento (configurável via .env)
+    """
+
+    def __init__(self):
+        self.client = OmieAPIClient()
+
+    def _status_encerramento(self) -> str:
+        return str(getattr(self.client, "po_close_status", "") or "Encerrado").strip()
+
+    def _pedido_encerrado(self, dados_pedido: dict) -> bool:
+        status = str((dados_pedido or {}).get("cStatus") or "").strip().lower()
+        return status in ("encerrado", "fechado", self._status_encerramento().lower())
+
+    def _detalhes_indice(self, entrada: PurchaseOrderClosedIndex) -> dict:
+        return {
+            "status_anterior": entrada.status_omie,
+            "status_novo": entrada.status_omie,
+            "acao": "nenhuma (pedido encerrado segundo índice local)",
+            "confirmado_em": entrada.confirmado_em.isoformat(),
+        }
+
+    @span("purchase_orders.encerrar_pedido")
+    def encerrar_pedido_automaticamente(
+        self,
+        numero_pedido: str,
+        item_pedido: str | None,
+        numero_nf_servico: str,
+        id_nf_servico: int,
+        log: PurchaseOrderClosureLog | None = None,
+        forcar_consulta: bool = False,
+    ) -> PurchaseOrderClosureLog:
+        inicio = time.monotonic()
+        if log is None:
+            log = PurchaseOrderClosureLog.objects.create(
+                numero_pedido=numero_pedido,
+                item_pedido=item_pedido,
+                numero_nf_servico=numero_nf_servico,
+                id_nf_servico=id_nf_servico,
+                status="pending",
+            )
+        extra = {"numero_pedido": numero_pedido, "log_id": log.id}
+        anotar(**extra)
+        try:
+            log.mark_as_processing()
+            logger.info("[RF-002] Iniciando encerramento do pedido %s", numero_pedido, extra=extra)
+
+            if not forcar_consulta:
+                entrada = PurchaseOrderClosedIndex.validos([numero_pedido]).get(numero_pedido)
+                if entrada:
+                    log.mark_as_success(self._detalhes_indice(entrada))
+                    return log
+
+            pedido = self.client.consultar_pedido_compra(numero_pedido)
+            status_anterior = (pedido or {}).get("cStatus")
+
+            if self._pedido_encerrado(pedido):
+                with transaction.atomic():
+                    log.mark_as_success({
+                        "status_anterior": status_anterior,
+                        "status_novo": status_anterior,
+                        "acao": "nenhuma (pedido já encerrado)",
+                        "elapsed_ms": int((time.monotonic() - inicio) * 1000),
+                    })
+                    PurchaseOrderClosedIndex.registrar({numero_pedido: status_anterior})
+                return log
+
+            resp = self.client.encerrar_pedido_compra(
+                numero_pedido=numero_pedido,
+                codigo_item=item_pedido,
+            )
+            elapsed_ms = int((time.monotonic() - inicio) * 1000)
+            with transaction.atomic():
+                log.mark_as_success({
+                    "status_anterior": status_anterior,
+                    "status_novo": self._status_encerramento(),
+                    "resposta_omie": resp,
+                    "elapsed_ms": elapsed_ms,
+                })
+                if not item_pedido:
+                    PurchaseOrderClosedIndex.registrar({numero_pedido: self._status_encerramento()})
+            logger.info("[RF-002] Pedido %s encerrado (%sms)", numero_pedido, elapsed_ms, extra=extra)
+            return log
+        except OmieAPIException as e:
+            logger.error("[RF-002] Erro Omie ao encerrar pedido %s: %s", numero_pedido, e, extra=extra)
+            log.mark_as_failed(str(e))
+            return log
+        except Exception as e:
+            logger.exception("[RF-002] Erro inesperado ao encerrar pedido %s", numero_pedido, extra=extra)
+            log.mark_as_failed(f"Erro inesperado: {e}")
+            return log
+
+    @span("purchase_orders.encerrar_pedidos_em_lote")
+    def encerrar_pedidos_em_lote(
+        self,
+        solicitacoes: list[dict],
+        max_workers: int | None = None,
+        forcar_consulta: bool = False,
+        progresso: Progresso | None = None,
+    ) -> list[PurchaseOrderClosureLog]:
+        """
+        Encerra muitos pedidos de uma vez. Solicitações repetidas são descartadas,
+        o status é consultado uma vez por pedido (em paralelo), pedidos já
+        encerrados são pulados e os demais encerrados com paralelismo limitado.
+        Os logs são gravados num único bulk_create ao final.
+        `progresso` recebe um evento por pedido/item assim que o resultado é conhecido.
+        """
+        max_workers = max_workers or settings.PO_CLOSURE_BULK_MAX_WORKERS
+        progresso = progresso or Progresso()
+        inicio = time.monotonic()
+
+        unicas: dict[tuple, dict] = {}
+        for sol in solicitacoes:
+            item = sol.get("item_pedido")
+            chave = (
+                str(sol["numero_pedido"]),
+                (str(item).strip() or None) if item is not None else None,
+                str(sol["numero_nf_servico"]),
+                int(sol["id_nf_servico"]),
+            )
+            unicas.setdefault(chave, sol)
+
+        itens_por_pedido: dict[str, set] = {}
+        for numero, item, _, _ in unicas:
+            itens_por_pedido.setdefault(numero, set()).add(item)
+
+        progresso.publicar("inicio", solicitacoes=len(unicas), pedidos=len(itens_por_pedido))
+        resultados = self._encerrar_agrupado(itens_por_pedido, max_workers, forcar_consulta, progresso)
+        elapsed_ms = int((time.monotonic() - inicio) * 1000)
+
+        agora = timezone.now()
+        logs = []
+        for numero, item, numero_nf, id_nf in unicas:
+            resultado = resultados[(numero, item)]
+            logs.append(
+                PurchaseOrderClosureLog(
+                    numero_pedido=numero,
+                    item_pedido=item,
+                    numero_nf_servico=numero_nf,
+                    id_nf_servico=id_nf,
+                    status=resultado["status"],
+                    tentativas=1,
+                    mensagem_erro=resultado["mensagem_erro"],
+                    detalhes={**resultado["detalhes"], "lote": True, "elapsed_ms_lote": elapsed_ms},
+                    processado_em=agora,
+                )
+            )
+        with transaction.atomic():
+            logs = PurchaseOrderClosureLog.objects.bulk_create(logs)
+            DashboardCounter.registrar_lote(PurchaseOrderClosureLog.metrica_dashboard, logs)
+            PurchaseOrderClosedIndex.registrar(self._encerrados_confirmados(resultados))
+
+        progresso.finalizar(
+            "success" if all(log.status == "success" for log in logs) else "failed",
+            total=len(logs),
+            sucessos=sum(1 for log in logs if log.status == "success"),
+            elapsed_ms=elapsed_ms,
+        )
+        logger.info(
+            "[RF-002] Encerramento em lote: %s solicitações, %s pedidos, %sms",
+            len(unicas), len(itens_por_pedido), elapsed_ms,
+        )
+        return logs
+
+    def _encerrar_agrupado(
+        self,
+        itens_por_pedido: dict[str, set],
+        max_workers: int,
+        forcar_consulta: bool = False,
+        progresso: Progresso | None = None,
+    ) -> dict[tuple, dict]:
+        """
+        Núcleo compartilhado do encerramento agrupado. Recebe {numero_pedido: {itens}}
+        (item None = pedido inteiro) e devolve o resultado por (numero_pedido, item),
+        sem gravar nada no banco. Pedidos presentes no índice local de encerrados
+        não são consultados, a menos que `forcar_consulta` seja verdadeiro.
+        """
+        progresso = progresso or Progresso()
+        resultados: dict[tuple, dict] = {}
+
+        def _registrar(numero: str, item, resultado: dict):
+            resultados[(numero, item)] = resultado
+            progresso.publicar(
+                "pedido", numero_pedido=numero, item_pedido=item,
+                status=resultado["status"], mensagem_erro=resultado["mensagem_erro"],
+            )
+
+        indice = {} if forcar_consulta else PurchaseOrderClosedIndex.validos(itens_por_pedido)
+        for numero, entrada in indice.items():
+            for item in itens_por_pedido[numero]:
+                _registrar(numero, item, {
+                    "status": "success",
+                    "mensagem_erro": None,
+                    "detalhes": self._detalhes_indice(entrada),
+                })
+
+        pedidos = [numero for numero in itens_por_pedido if numero not in indice]
+        consultas = executar_em_paralelo(
+            self.client.consultar_pedido_compra, pedidos, max_workers=max_workers
+        )
+
+        chamadas = []
+        for numero, (dados, erro) in zip(pedidos, consultas):
+            itens = itens_por_pedido[numero]
+            if erro is not None:
+                for item in itens:
+                    _registrar(numero, item, self._resultado_falha(erro))
+                continue
+
+            status_anterior = (dados or {}).get("cStatus")
+            if self._pedido_encerrado(dados):
+                for item in itens:
+                    _registrar(numero, item, {
+                        "status": "success",
+                        "mensagem_erro": None,
+                        "detalhes": {
+                            "status_anterior": status_anterior,
+                            "status_novo": status_anterior,
+                            "acao": "nenhuma (pedido já encerrado)",
+                        },
+                        "encerrado_omie": status_anterior,
+                    })
+                continue
+
+            # Um encerramento do pedido inteiro cobre todos os itens solicitados
+            alvos = [None] if None in itens else sorted(itens)
+            chamadas.extend((numero, item, status_anterior) for item in alvos)
+
+        respostas = executar_em_paralelo(
+            lambda c: self.client.encerrar_pedido_compra(numero_pedido=c[0], codigo_item=c[1]),
+            chamadas,
+            max_workers=max_workers,
+        )
+        for (numero, item, status_anterior), (resp, erro) in zip(chamadas, respostas):
+            if erro is not None:
+                resultado = self._resultado_falha(erro)
+            else:
+                resultado = {
+                    "status": "success",
+                    "mensagem_erro": None,
+                    "detalhes": {
+                        "status_anterior": status_anterior,
+                        "status_novo": self._status_encerramento(),
+                        "resposta_omie": resp,
+                    },
+                }
+                if item is None:
+                    resultado["encerrado_omie"] = self._status_encerramento()
+            afetados = itens_por_pedido[numero] if item is None else [item]
+            for afetado in afetados:
+                _registrar(numero, afetado, resultado)
+
+        return resultados
+
+    def _encerrados_confirmados(self, resultados: dict[tuple, dict]) -> dict:
+        """{numero_pedido: status} dos pedidos que a Omie confirmou como encerrados."""
+        return {
+            numero: resultado["encerrado_omie"]
+            for (numero, _), resultado in resultados.items()
+            if resultado.get("encerrado_omie")
+        }
+
+    def agendar_encerramento_coalescido(
+        self,
+        numero_pedido: str,
+        item_pedido: str | None,
+        numero_nf_servico: str,
+        id_nf_servico: int,
+    ) -> PurchaseOrderClosureLog:
+        """
+        Registra a solicitação como pendente e agenda, uma vez por janela, a
+        consolidação do pedido: todas as solicitações que chegarem dentro de
+        PO_CLOSURE_COALESCE_WINDOW_SECONDS viram uma única atualização na Omie.
+        Se o agendamento se perder, recuperar_encerramentos_coalescidos (beat)
+        reagenda o pedido.
+        """
+        janela = settings.PO_CLOSURE_COALESCE_WINDOW_SECONDS
+        entrada = PurchaseOrderClosedIndex.validos([numero_pedido]).get(numero_pedido)
+        if entrada:
+            return PurchaseOrderClosureLog.objects.create(
+                numero_pedido=numero_pedido,
+                item_pedido=item_pedido or None,
+                numero_nf_servico=numero_nf_servico,
+                id_nf_servico=id_nf_servico,
+                status="success",
+                tentativas=1,
+                detalhes=self._detalhes_indice(entrada),
+                processado_em=timezone.now(),
+            )
+
+        log = PurchaseOrderClosureLog.objects.create(
+            numero_pedido=numero_pedido,
+            item_pedido=item_pedido or None,
+            numero_nf_servico=numero_nf_servico,
+            id_nf_servico=id_nf_servico,
+            status="pending",
+            detalhes={"coalescido": True},
+        )
+        janela_aberta = (
+            PurchaseOrderClosureLog.objects.filter(
+                numero_pedido=numero_pedido,
+                status="pending",
+                detalhes__coalescido=True,
+            )
+            .exclude(pk=log.pk)
+            .exists()
+        )
+        if not janela_aberta:
+            transaction.on_commit(lambda: self._agendar_consolidacao(numero_pedido, janela))
+        return log
+
+    def consolidar_encerramentos(self, numero_pedido: str) -> list[PurchaseOrderClosureLog]:
+        """
+        Encerra de uma vez as solicitações pendentes (coalescidas) do pedido.
+        Todas recebem o mesmo resultado; a gravação é um único bulk_update.
+        """
+        with transaction.atomic():
+            reservados = list(
+                PurchaseOrderClosureLog.objects.select_for_update(skip_locked=True)
+                .filter(numero_pedido=numero_pedido, status="pending", detalhes__coalescido=True)
+                .only("id", "created_at", "status")
+            )
+            ids = [log.id for log in reservados]
+            PurchaseOrderClosureLog.objects.filter(id__in=ids).update(
+                status="processing",
+                tentativas=models.F("tentativas") + 1,
+                updated_at=timezone.now(),
+            )
+            for log in reservados:
+                log.status = "processing"
+            DashboardCounter.registrar_lote(
+                PurchaseOrderClosureLog.metrica_dashboard, reservados, de="pending"
+            )
+        if not ids:
+            return []
+
+        logs = list(PurchaseOrderClosureLog.objects.filter(id__in=ids))
+        itens = {log.item_pedido or None for log in logs}
+        resultados = self._encerrar_agrupado(
+            {numero_pedido: itens}, max_workers=settings.PO_CLOSURE_BULK_MAX_WORKERS
+        )
+
+        agora = timezone.now()
+        for log in logs:
+            resultado = resultados[(numero_pedido, log.item_pedido or None)]
+            log.status = resultado["status"]
+            log.mensagem_erro = resultado["mensagem_erro"]
+            log.detalhes = {
+                **resultado["detalhes"],
+                "coalescido": True,
+                "solicitacoes_agrupadas": len(logs),
+                "logs_agrupados": ids,
+            }
+            log.processado_em = agora
+            log.updated_at = agora
+        with transaction.atomic():
+            PurchaseOrderClosureLog.objects.bulk_update(
+                logs, ["status", "mensagem_erro", "detalhes", "processado_em", "updated_at"]
+            )
+            DashboardCounter.registrar_lote(PurchaseOrderClosureLog.metrica_dashboard, logs, de="processing")
+            PurchaseOrderClosedIndex.registrar(self._encerrados_confirmados(resultados))
+
+        logger.info(
+            "[RF-002] Pedido %s: %s solicitações consolidadas em %s chamada(s) de encerramento",
+            numero_pedido, len(logs), 1 if None in itens else len(itens),
+        )
+        return logs
+
+    def recuperar_encerramentos_coalescidos(self) -> list[str]:
+        """
+        Pedidos com solicitações coalescidas esquecidas: `pending` há mais de
+        duas janelas (agendamento perdido: broker fora no commit, mensagem
+        perdida) ou `processing` há mais de PO_CLOSURE_COALESCE_STALE_SECONDS
+        (worker morto no meio). As presas em processing voltam para pending;
+        devolve os pedidos que precisam de uma nova consolidação.
+        """
+        agora = timezone.now()
+        coalescidos = PurchaseOrderClosureLog.objects.filter(detalhes__coalescido=True)
+        with transaction.atomic():
+            presos = list(
+                coalescidos.select_for_update(skip_locked=True)
+                .filter(
+                    status="processing",
+                    updated_at__lt=agora - timedelta(seconds=settings.PO_CLOSURE_COALESCE_STALE_SECONDS),
+                )
+                .only("id", "numero_pedido", "created_at", "status")
+            )
+            if presos:
+                PurchaseOrderClosureLog.objects.filter(id__in=[log.id for log in presos]).update(
+                    status="pending", updated_at=agora
+                )
+                for log in presos:
+                    log.status = "pending"
+                DashboardCounter.registrar_lote(
+                    PurchaseOrderClosureLog.metrica_dashboard, presos, de="processing"
+                )
+
+        limite = agora - timedelta(seconds=2 * settings.PO_CLOSURE_COALESCE_WINDOW_SECONDS)
+        atrasados = set(
+            coalescidos.filter(status="pending", created_at__lt=limite)
+            .order_by()
+            .values_list("numero_pedido", flat=True)
+            .distinct()
+        )
+        pedidos = sorted(atrasados | {log.numero_pedido for log in presos})
+        if pedidos:
+            logger.warning("[RF-002] Encerramentos coalescidos esquecidos em %s pedido(s): %s", len(pedidos), pedidos)
+        return pedidos
+
+    def _agendar_consolidacao(self, numero_pedido: str, janela: int):
+        # Import tardio para evitar import circular
+        try:
+            from .tasks import consolidar_encerramentos_task
+            consolidar_encerramentos_task.apply_async(args=[numero_pedido], countdown=janela)
+        except Exception:
+            logger.exception("Falha ao agendar consolidação de encerramento do pedido %s", numero_pedido)
+
+    def _resultado_falha(self, erro: Exception) -> dict:
+        if isinstance(erro, OmieAPIException):
+            mensagem = str(erro)
+        else:
+            mensagem = f"Erro inesperado: {erro}"
+        return {"status": "failed", "mensagem_erro": mensagem, "detalhes": {}}
+
+    def reprocessar_falhas(self):
+        falhas = PurchaseOrderClosureLog.objects.filter(
+            status="failed", tentativas__lt=models.F("max_tentativas")
+        )
+        resultados = []
+        for log in falhas:
+            if not log.pode_retentar:
+                continue
+            resultados.append(
+                self.encerrar_pedido_automaticamente(
+                    numero_pedido=log.numero_pedido,
+                    item_pedido=log.item_pedido,
+                    numero_nf_servico=log.numero_nf_servico,
+                    id_nf_servico=log.id_nf_servico,
+                    log=log,
+                )
+            )
+        return resultados
 
 
 class SupplierService:
     """
-    Consulta fornecedores no Omie usando ListarClientes,
-    filtrando apenas quem é fornecedor.
+    Busca fornecedores no espelho local (Supplier), sem consumir a cota da Omie.
+    Prefixo em razão social / nome fantasia / CNPJ-CPF primeiro; se faltar
+    resultado, completa com "contém" (servido por índice trigram no PostgreSQL).
     """
 
+    MIN_CONTEM = 3
+
     @classmethod
     def list_suppliers(cls, search: str | None = None, page: int = 1, per_page: int = 50):
+        campos = ("codigo_omie", "razao_social", "nome_fantasia", "cnpj_cpf")
+        base = Supplier.objects.filter(inativo=False)
+        inicio = (max(page, 1) - 1) * per_page
+
+        termo = normalizar_busca(search)
+        if not termo:
+            linhas = list(base.values(*campos)[inicio:inicio + per_page])
+            return [cls._formatar(linha) for linha in linhas]
+
+        digitos = somente_digitos(search)
+        prefixo = Q(razao_social_busca__startswith=termo) | Q(nome_fantasia_busca__startswith=termo)
+        if digitos:
+            prefixo |= Q(documento_busca__startswith=digitos)
+            if digitos == termo:
+                prefixo |= Q(codigo_omie=int(digitos))
+
+        linhas = list(base.filter(prefixo).values(*campos)[:inicio + per_page])
+        if len(linhas) < inicio + per_page and len(termo) >= cls.MIN_CONTEM:
+            contem = Q(razao_social_busca__contains=termo) | Q(nome_fantasia_busca__contains=termo)
+            if digitos:
+                contem |= Q(documento_busca__contains=digitos)
+            ja = [linha["codigo_omie"] for linha in linhas]
+            faltam = inicio + per_page - len(linhas)
+            linhas += list(
+                base.filter(contem).exclude(codigo_omie__in=ja).values(*campos)[:faltam]
+            )
+
+        return [cls._formatar(linha) for linha in linhas[inicio:inicio + per_page]]
+
+    @staticmethod
+    def _formatar(linha: dict) -> dict:
+        return {
+            "id": linha["codigo_omie"],
+            "nome": linha["razao_social"] or linha["nome_fantasia"],
+            "cnpj_cpf": linha["cnpj_cpf"],
+        }
+
+
+class SupplierSyncService:
+    """
+    Sincroniza o espelho local de fornecedores com o Omie (ListarClientes).
+    Incremental: usa a maior data de alteração já espelhada como marca d'água.
+    """
+
+    CAMPOS_ATUALIZADOS = [
+        "razao_social",
+        "nome_fantasia",
+        "cnpj_cpf",
+        "razao_social_busca",
+        "nome_fantasia_busca",
+        "documento_busca",
+        "inativo",
+        "alterado_omie_em",
+        "updated_at",
+    ]
+
+    def sincronizar(self, completo: bool = False, per_page: int = 500) -> dict:
+        marca = None
+        if not completo:
+            marca = Supplier.objects.aggregate(m=Max("alterado_omie_em"))["m"]
+
         body = {
-            "pagina": page,
             "registros_por_pagina": per_page,
             "apenas_importado_api": "N",
         }
+        if marca:
+            body["filtrar_por_data_de"] = timezone.localtime(marca).strftime("%d/%m/%Y")
 
-        # filtro básico por nome/razão/CPFCNPJ
-        if search:
-            body["pesquisa"] = {
-                "campo": "RAZAO_SOCIAL",
-                "valor": search,
-            }
+        resumo = {"paginas": 0, "recebidos": 0, "gravados": 0, "incremental": bool(marca)}
+        pagina = 1
+        while True:
+            data = OmieClient.call(
+                endpoint="/geral/clientes/",
+                method="ListarClientes",
+                body={**body, "pagina": pagina},
+            )
+            itens = data.get("clientes_cadastro", []) or []
+            resumo["paginas"] += 1
+            resumo["recebidos"] += len(itens)
 
-        data = OmieClient.call(
-            endpoint="/geral/clientes/",
-            method="ListarClientes",
-            body=body,
-        )
+            fornecedores = [self._de_omie(item) for item in itens if self._eh_fornecedor(item)]
+            fornecedores = [f for f in fornecedores if f is not None]
+            if fornecedores:
+                Supplier.objects.bulk_create(
+                    fornecedores,
+                    update_conflicts=True,
+                    unique_fields=["codigo_omie"],
+                    update_fields=self.CAMPOS_ATUALIZADOS,
+                )
+                resumo["gravados"] += len(fornecedores)
+
+            total_paginas = int(data.get("total_de_paginas") or 1)
+            if not itens or pagina >= total_paginas:
+                break
+            pagina += 1
+
+        logger.info("Sincronização de fornecedores concluída: %s", resumo)
+        return resumo
+
+    @staticmethod
+    def _eh_fornecedor(item: dict) -> bool:
+        # ajuste essa condição conforme o que o Omie retornar no seu ambiente
+        tipo = (item.get("cTipo") or "").upper()
+        return tipo in ("F", "FORN", "FORNECEDOR", "")
 
-        results = []
-        for item in data.get("clientes_cadastro", []):
-            # ajuste essa condição conforme o que o Omie retornar no seu ambiente
-            tipo = (item.get("cTipo") or "").upper()
-            if tipo in ("F", "FORN", "FORNECEDOR", ""):
-                results.append(
-                    {
-                        "id": item.get("codigo_cliente_omie"),
-                        "nome": item.get("razao_social") or item.get("nome_fantasia"),
-                        "cnpj_cpf": item.get("cnpj_cpf"),
-                    }
+    @staticmethod
+    def _de_omie(item: dict) -> Supplier | None:
+        codigo = item.get("codigo_cliente_omie")
+        if not codigo:
+            return None
+
+        alterado_em = None
+        info = item.get("info") or {}
+        data_alt = info.get("dAlt") or info.get("dInc")
+        hora_alt = info.get("hAlt") or info.get("hInc") or "00:00:00"
+        if data_alt:
+            try:
+                alterado_em = timezone.make_aware(
+                    datetime.strptime(f"{data_alt} {hora_alt}", "%d/%m/%Y %H:%M:%S")
                 )
+            except ValueError:
+                alterado_em = None
 
-        return results
+        fornecedor = Supplier(
+            codigo_omie=codigo,
+            razao_social=(item.get("razao_social") or "")[:255],
+            nome_fantasia=(item.get("nome_fantasia") or "")[:255],
+            cnpj_cpf=(item.get("cnpj_cpf") or "")[:30],
+            inativo=(item.get("inativo") or "N").upper() == "S",
+            alterado_omie_em=alterado_em,
+        )
+        fornecedor.preencher_campos_busca()
+        return fornecedor
 
 
 class FullFlowPurchaseOrderService:
     """
     Fluxo completo via BackOffice:
-    - cria pedido de compra na Omie
-    - envia anexos
+    - registra a intenção na outbox (anexos em spool local)
+    - cria pedido de compra na Omie e envia anexos (assíncrono)
     - quando finalizado, cria conta a pagar
     - copia anexos do pedido para o contas a pagar
     """
@@ -87,52 +655,122 @@ class FullFlowPurchaseOrderService:
     def __init__(self, omie_client: OmieAPIClient | None = None):
         self.omie = omie_client or OmieAPIClient.from_settings()
 
-    @transaction.atomic
-    def criar_pedido_com_anexos(self, pedido_data: dict, arquivos) -> PurchaseOrderIntegration:
-        resp = self.omie.incluir_pedido_compra(pedido_data)
-        ncodped = resp.get("nCodPed")
-        if not ncodped:
-            raise OmieAPIException(f"Resposta Omie sem nCodPed: {resp}")
+    def enfileirar_pedido_com_anexos(self, pedido_data: dict, arquivos) -> PurchaseOrderOutbox:
+        """
+        Grava os anexos em spool local e registra a intenção na outbox.
+        Nenhuma chamada à Omie acontece aqui: o processamento roda em
+        `processar_outbox` (Celery), após o commit.
+        """
+        pedido_data = dict(pedido_data or {})
+        cod_int = pedido_data.get("cCodIntPed") or f"BO-{uuid.uuid4().hex[:12].upper()}"
+        pedido_data["cCodIntPed"] = cod_int
 
-        po = PurchaseOrderIntegration.objects.create(
-            cod_int_pedido=pedido_data.get("cCodIntPed"),
-            ncodped_omie=ncodped,
-            origem="backoffice",
-            metodo_criacao="sistema",
-        )
+        existente = PurchaseOrderOutbox.objects.filter(cod_int_pedido=cod_int).first()
+        if existente:
+            logger.info("Pedido %s já registrado na outbox (id=%s).", cod_int, existente.id)
+            return existente
 
+        storage = self._spool_storage()
+        spool = []
         for arquivo in arquivos:
-            conteudo = arquivo.read()
-            b64 = base64.b64encode(conteudo).decode()
-            self.omie.incluir_anexo(
-                c_tabela="pedido-compra",
-                n_id=ncodped,
-                nome_arquivo=arquivo.name,
-                arquivo_base64=b64,
-            )
-            AttachmentSyncLog.objects.create(
-                origem_tabela="pedido-compra",
-                origem_id=ncodped,
-                destino_tabela="pedido-compra",
-                destino_id=ncodped,
-                metodo="sistema_full_flow",
-                nome_arquivo=arquivo.name,
-                status="success",
-            )
+            nome_spool = f"{cod_int}/{uuid.uuid4().hex}_{storage.get_valid_name(arquivo.name)}"
+            caminho = storage.save(nome_spool, arquivo)
+            spool.append((arquivo.name, caminho, storage.size(caminho)))
 
-        return po
+        try:
+            with transaction.atomic():
+                outbox = PurchaseOrderOutbox.objects.create(
+                    cod_int_pedido=cod_int,
+                    pedido_data=pedido_data,
+                )
+                PurchaseOrderOutboxFile.objects.bulk_create(
+                    PurchaseOrderOutboxFile(
+                        outbox=outbox,
+                        nome_arquivo=nome,
+                        caminho_spool=caminho,
+                        tamanho=tamanho,
+                    )
+                    for nome, caminho, tamanho in spool
+                )
+                transaction.on_commit(lambda: self._agendar_outbox(outbox.id))
+        except IntegrityError:
+            # Envio concorrente do mesmo pedido ganhou a corrida (cod_int_pedido é único):
+            # descarta o spool desta tentativa e devolve a outbox registrada
+            for _, caminho, _ in spool:
+                storage.delete(caminho)
+            existente = PurchaseOrderOutbox.objects.filter(cod_int_pedido=cod_int).first()
+            if existente is None:
+                raise
+            logger.info("Pedido %s registrado na outbox por envio concorrente (id=%s).", cod_int, existente.id)
+            return existente
 
-    def processar_pedido_para_financeiro(self, po: PurchaseOrderIntegration) -> PurchaseOrderFinanceMap | None:
-        dados = self.omie.consultar_pedido_compra({"nCodPed": po.ncodped_omie})
+        return outbox
 
-        if not self._pedido_finalizado(dados):
-            logger.info("Pedido %s ainda não finalizado.", po.ncodped_omie)
-            return None
+    @span("purchase_orders.processar_outbox")
+    def processar_outbox(self, outbox_id: int) -> PurchaseOrderOutbox:
+        """
+        Executa a intenção registrada: cria o pedido na Omie (uma única vez) e
+        envia em paralelo os anexos ainda não enviados. Cada etapa é idempotente,
+        então a task pode ser reexecutada após falhas parciais. Se outra execução
+        já tomou a outbox (delay, retry e varredura podem coincidir), sai sem
+        chamar a Omie.
+        """
+        anotar(outbox_id=outbox_id)
+        outbox = PurchaseOrderOutbox.objects.select_related("purchase_order").get(pk=outbox_id)
+        if outbox.status == "success":
+            return outbox
+        if not outbox.claim_for_processing():
+            logger.info("Outbox %s já está em processamento em outro worker; ignorando.", outbox.id)
+            outbox.refresh_from_db()
+            return outbox
+
+        progresso = Progresso(canal("outbox", outbox.id))
+        progresso.publicar("inicio", tentativa=outbox.tentativas, cod_int_pedido=outbox.cod_int_pedido)
+        try:
+            po = outbox.purchase_order or self._criar_pedido_da_outbox(outbox)
+            progresso.publicar("pedido", ncodped_omie=po.ncodped_omie, cod_int_pedido=outbox.cod_int_pedido)
+            falhas = self._enviar_anexos_da_outbox(outbox, po, progresso)
+        except Exception as exc:
+            logger.exception("Erro ao processar outbox %s (%s)", outbox.id, outbox.cod_int_pedido)
+            outbox.mark_as_failed(str(exc))
+            progresso.finalizar(outbox.status, erro=str(exc))
+            return outbox
+
+        if falhas:
+            outbox.mark_as_failed(f"{falhas} anexo(s) não enviados para a Omie")
+        else:
+            outbox.mark_as_success()
+        progresso.finalizar(outbox.status, falhas=falhas)
+        return outbox
+
+    def processar_pedido_para_financeiro(
+        self,
+        po: PurchaseOrderIntegration,
+        dados: dict | None = None,
+    ) -> PurchaseOrderFinanceMap | None:
+        """
+        Gera o contas a pagar de um pedido finalizado.
+        `dados` permite reaproveitar um ConsultarPedCompra já feito (lote paralelo).
+        """
+        if dados is None:
+            dados = self.omie.consultar_pedido_compra({"nCodPed": po.ncodped_omie})
 
         if hasattr(po, "finance_map"):
             logger.info("Financeiro já existe para pedido %s.", po.ncodped_omie)
+            if po.status_fluxo != "financed":
+                po.mark_as_financed()
             return po.finance_map
 
+        if self._pedido_cancelado(dados):
+            logger.info("Pedido %s cancelado no Omie; removido da fila.", po.ncodped_omie)
+            po.mark_as_cancelled()
+            return None
+
+        if not self._pedido_finalizado(dados):
+            logger.info("Pedido %s ainda não finalizado.", po.ncodped_omie)
+            po.agendar_proxima_verificacao()
+            return None
+
         conta_payload = self._montar_conta_pagar(dados, po.cod_int_pedido)
         resp = self.omie.incluir_conta_pagar(conta_payload)
         cod_lanc = resp.get("codigo_lancamento_omie")
@@ -146,16 +784,204 @@ class FullFlowPurchaseOrderService:
             anexos_sincronizados=False,
         )
 
+        po.mark_as_financed()
+
         self._replicar_anexos_pedido_para_financeiro(po, fmap)
 
         return fmap
 
+    @span("purchase_orders.processar_pedidos_pendentes")
+    def processar_pedidos_pendentes(
+        self,
+        max_por_execucao: int | None = None,
+        tamanho_lote: int | None = None,
+        max_workers: int | None = None,
+    ) -> dict:
+        """
+        Consulta na Omie apenas os pedidos com verificação vencida (next_check_at <= agora),
+        em lotes cujas consultas rodam em paralelo. Gravações ficam na thread principal.
+        """
+        max_por_execucao = max_por_execucao or settings.FULL_FLOW_RECHECK_MAX_PER_RUN
+        tamanho_lote = tamanho_lote or settings.FULL_FLOW_RECHECK_BATCH_SIZE
+        max_workers = max_workers or settings.FULL_FLOW_RECHECK_MAX_WORKERS
+
+        resumo = {"consultados": 0, "financeiros_gerados": 0, "reagendados": 0, "falhas": 0}
+        vistos: set[int] = set()
+
+        while resumo["consultados"] < max_por_execucao:
+            limite = min(tamanho_lote, max_por_execucao - resumo["consultados"])
+            lote = list(
+                PurchaseOrderIntegration.objects.filter(
+                    origem="backoffice",
+                    metodo_criacao__in=["sistema", "sistema_full_flow"],
+                    status_fluxo="awaiting_close",
+                    next_check_at__lte=timezone.now(),
+                )
+                .exclude(pk__in=vistos)
+                .select_related("finance_map")
+                .order_by("next_check_at")[:limite]
+            )
+            if not lote:
+                break
+            vistos.update(po.pk for po in lote)
+
+            consultas = executar_em_paralelo(
+                lambda po: self.omie.consultar_pedido_compra({"nCodPed": po.ncodped_omie}),
+                lote,
+                max_workers=max_workers,
+            )
+            resumo["consultados"] += len(lote)
+
+            for po, (dados, erro) in zip(lote, consultas):
+                if erro is not None:
+                    logger.error("Erro ao consultar pedido %s: %s", po.ncodped_omie, erro)
+                    po.agendar_proxima_verificacao(erro=str(erro))
+                    resumo["falhas"] += 1
+                    continue
+                try:
+                    fmap = self.processar_pedido_para_financeiro(po, dados=dados)
+                except Exception as exc:
+                    logger.exception("Erro ao gerar financeiro do pedido %s", po.ncodped_omie)
+                    po.agendar_proxima_verificacao(erro=str(exc))
+                    resumo["falhas"] += 1
+                    continue
+                if fmap is not None:
+                    resumo["financeiros_gerados"] += 1
+                elif po.status_fluxo == "awaiting_close":
+                    resumo["reagendados"] += 1
+
+        return resumo
+
     # ---------- helpers internos ----------
 
+    def _spool_storage(self) -> FileSystemStorage:
+        return FileSystemStorage(location=settings.FULL_FLOW_SPOOL_DIR)
+
+    def _agendar_outbox(self, outbox_id: int):
+        # Import tardio para evitar import circular
+        try:
+            from .tasks import processar_outbox_pedido_task
+            processar_outbox_pedido_task.delay(outbox_id)
+        except Exception:
+            logger.exception("Falha ao enfileirar processamento da outbox %s", outbox_id)
+
+    def _criar_pedido_da_outbox(self, outbox: PurchaseOrderOutbox) -> PurchaseOrderIntegration:
+        try:
+            resp = self.omie.incluir_pedido_compra(outbox.pedido_data)
+        except OmieAPIException:
+            # Reexecução após um timeout: o pedido pode já existir com o mesmo cCodIntPed
+            resp = self.omie.consultar_pedido_compra({"cCodIntPed": outbox.cod_int_pedido})
+            if not resp.get("nCodPed"):
+                raise
+        ncodped = resp.get("nCodPed")
+        if not ncodped:
+            raise OmieAPIException(f"Resposta Omie sem nCodPed: {resp}")
+
+        with transaction.atomic():
+            po, _ = PurchaseOrderIntegration.objects.get_or_create(
+                ncodped_omie=ncodped,
+                defaults={
+                    "cod_int_pedido": outbox.cod_int_pedido,
+                    "origem": "backoffice",
+                    "metodo_criacao": "sistema",
+                },
+            )
+            outbox.purchase_order = po
+            outbox.save(update_fields=["purchase_order", "updated_at"])
+        return po
+
+    def _enviar_anexos_da_outbox(
+        self,
+        outbox: PurchaseOrderOutbox,
+        po: PurchaseOrderIntegration,
+        progresso: Progresso | None = None,
+    ) -> int:
+        progresso = progresso or Progresso()
+        pendentes = list(outbox.arquivos.filter(enviado=False))
+        progresso.publicar("total", total_anexos=len(pendentes))
+        if not pendentes:
+            return 0
+
+        if outbox.tentativas > 1:
+            # Um upload pode ter chegado à Omie sem ter sido marcado como enviado
+            existentes = {
+                a.get("cNomeArquivo")
+                for a in self.omie.listar_anexos("pedido-compra", po.ncodped_omie) or []
+            }
+        else:
+            existentes = set()
+
+        storage = self._spool_storage()
+
+        def _enviar(arquivo: PurchaseOrderOutboxFile):
+            if arquivo.nome_arquivo in existentes:
+                return "existente"
+            with storage.open(arquivo.caminho_spool, "rb") as fh:
+                b64 = base64.b64encode(fh.read()).decode()
+            self.omie.incluir_anexo(
+                c_tabela="pedido-compra",
+                n_id=po.ncodped_omie,
+                nome_arquivo=arquivo.nome_arquivo,
+                arquivo_base64=b64,
+            )
+            # Publicado da thread de upload: o cliente vê cada arquivo ao concluir
+            progresso.publicar("arquivo", nome=arquivo.nome_arquivo, status="done", bytes=arquivo.tamanho)
+            return "enviado"
+
+        resultados = executar_em_paralelo(
+            _enviar, pendentes, max_workers=settings.FULL_FLOW_UPLOAD_MAX_WORKERS
+        )
+
+        agora = timezone.now()
+        sync_logs = []
+        falhas = 0
+        for arquivo, (_, erro) in zip(pendentes, resultados):
+            if erro is None:
+                arquivo.enviado = True
+                arquivo.enviado_em = agora
+                arquivo.mensagem_erro = ""
+            else:
+                falhas += 1
+                arquivo.mensagem_erro = str(erro)
+                progresso.publicar("arquivo", nome=arquivo.nome_arquivo, status="failed", bytes=0, erro=str(erro))
+                logger.error(
+                    "Falha ao enviar anexo '%s' do pedido %s: %s",
+                    arquivo.nome_arquivo, po.ncodped_omie, erro,
+                )
+            sync_logs.append(
+                AttachmentSyncLog(
+                    origem_tabela="pedido-compra",
+                    origem_id=po.ncodped_omie,
+                    destino_tabela="pedido-compra",
+                    destino_id=po.ncodped_omie,
+                    metodo="sistema_full_flow",
+                    nome_arquivo=arquivo.nome_arquivo,
+                    status="success" if erro is None else "failed",
+                    mensagem_erro="" if erro is None else str(erro),
+                )
+            )
+
+        with transaction.atomic():
+            PurchaseOrderOutboxFile.objects.bulk_update(
+                pendentes, ["enviado", "enviado_em", "mensagem_erro"]
+            )
+            AttachmentSyncLog.objects.bulk_create(sync_logs)
+            DashboardCounter.registrar_lote(AttachmentSyncLog.metrica_dashboard, sync_logs)
+
+        for arquivo in pendentes:
+            if arquivo.enviado:
+                storage.delete(arquivo.caminho_spool)
+
+        return falhas
+
     def _pedido_finalizado(self, dados_pedido: dict) -> bool:
         status = (dados_pedido or {}).get("cStatus", "").lower()
         return status in ("fechado", "encerrado")  # ajuste se precisar
 
+    def _pedido_cancelado(self, dados_pedido: dict) -> bool:
+        status = (dados_pedido or {}).get("cStatus", "").lower()
+        return status in ("cancelado",)
+
     def _montar_conta_pagar(self, dados_pedido: dict, cod_int_pedido: str | None) -> dict:
         total = dados_pedido.get("nValorTotal", 0)
         fornecedor = dados_pedido.get("codigo_cliente_fornecedor")
@@ -221,6 +1047,7 @@ class PurchaseOrderRobotService:
     def __init__(self, omie_client: OmieAPIClient | None = None):
         self.omie = omie_client or OmieAPIClient.from_settings()
 
+    @span("purchase_orders.robo.processar")
     def processar(self):
         pagina = 1
 
@@ -269,6 +1096,8 @@ class PurchaseOrderRobotService:
                         anexos_sincronizados=False,
                     )
 
+                    po.mark_as_financed()
+
                     self._copiar_anexos_recebimento_para_financeiro(n_id_receb, fmap)
 
                 except Exception as exc:
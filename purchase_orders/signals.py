@@ -29,14 +29,23 @@ def disparar_encerramento_por_integracao(
     numero_nf_servico: str,
     id_nf_servico: int,
 ):
-    """Utilitário para ser chamado pela integração após criar a NF de Serviço no Omie."""
+    """
+    Utilitário para ser chamado pela integração após criar a NF de Serviço no Omie.
+    Com PO_CLOSURE_COALESCE_WINDOW_SECONDS > 0, a solicitação é agrupada com as
+    demais do mesmo pedido e o log retornado fica pendente até o fim da janela.
+    """
+    from django.conf import settings
     from .services import PurchaseOrderClosureService
 
     logger.info(
-        "Disparo explícito de encerramento de PC por integração: "
-        f"PC={numero_pedido} item={item_pedido} NF={numero_nf_servico} id={id_nf_servico}"
+        "Disparo explícito de encerramento de PC por integração: PC=%s item=%s NF=%s id=%s",
+        numero_pedido, item_pedido, numero_nf_servico, id_nf_servico,
     )
     service = PurchaseOrderClosureService()
+    if settings.PO_CLOSURE_COALESCE_WINDOW_SECONDS > 0:
+        return service.agendar_encerramento_coalescido(
+            numero_pedido, item_pedido, numero_nf_servico, id_nf_servico
+        )
     return service.encerrar_pedido_automaticamente(
         numero_pedido=numero_pedido,
         item_pedido=item_pedido,
@@ -0,0 +1,262 @@
+# purchase_orders/supplier_index.py
+
+import heapq
+import logging
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max
+
+from .models import Supplier, normalizar_busca, somente_digitos
+
+logger = logging.getLogger(__name__)
+
+# Tipos de chave (menor = melhor qualidade de match)
+CHAVE_NOME = 0
+CHAVE_PALAVRA = 1
+CHAVE_DOCUMENTO = 2
+
+# Fim de faixa para bisect: qualquer chave com o prefixo é menor que prefixo + SENTINELA
+SENTINELA = "\U0010ffff"
+
+# (codigo_omie, nome, cnpj_cpf, razao_busca, fantasia_busca, documento_busca)
+Registro = Tuple[int, str, str, str, str, str]
+
+
+class SupplierIndexOverBudget(Exception):
+    """O índice excederia SUPPLIER_INDEX_MAX_BYTES; o autocomplete usa o banco."""
+    pass
+
+
+class SupplierPrefixIndex:
+    """
+    Índice de prefixo imutável sobre fornecedores ativos.
+    Um array ordenado de chaves normalizadas por tipo de chave (busca por
+    bisect), com a posição do fornecedor num array paralelo. A busca percorre
+    os tipos do melhor para o pior e, dentro de cada faixa, as chaves já saem
+    na ordem do ranking (match exato primeiro, depois alfabética): basta ler
+    até completar `limite` fornecedores distintos.
+    """
+
+    def __init__(self, registros: List[Registro]):
+        self.registros = sorted(registros, key=lambda r: (r[3] or r[4], r[0]))
+
+        entradas: Dict[int, List[Tuple[str, int]]] = {
+            CHAVE_NOME: [], CHAVE_PALAVRA: [], CHAVE_DOCUMENTO: [],
+        }
+        for pos, (_, _, _, razao, fantasia, documento) in enumerate(self.registros):
+            vistas = set()
+            for nome in (razao, fantasia):
+                if not nome or nome in vistas:
+                    continue
+                vistas.add(nome)
+                entradas[CHAVE_NOME].append((nome, pos))
+                for palavra in nome.split()[1:]:
+                    if palavra not in vistas:
+                        vistas.add(palavra)
+                        entradas[CHAVE_PALAVRA].append((palavra, pos))
+            if documento:
+                entradas[CHAVE_DOCUMENTO].append((documento, pos))
+
+        self._faixas: Dict[int, Tuple[List[str], array]] = {}
+        for tipo, lista in entradas.items():
+            lista.sort()
+            self._faixas[tipo] = ([chave for chave, _ in lista], array("q", (pos for _, pos in lista)))
+
+    def __len__(self) -> int:
+        return len(self.registros)
+
+    def estimar_bytes(self) -> int:
+        total = 0
+        for chaves, posicoes in self._faixas.values():
+            total += sum(sys.getsizeof(c) for c in chaves) + sys.getsizeof(chaves)
+            total += posicoes.itemsize * len(posicoes)
+        registros = sum(
+            sys.getsizeof(r) + sum(sys.getsizeof(c) for c in r) for r in self.registros
+        )
+        return total + registros
+
+    def buscar(self, termo: str | None, limite: int = 50) -> List[dict]:
+        texto = normalizar_busca(termo)
+        if not texto:
+            return [self._formatar(r) for r in self.registros[:limite]]
+
+        prefixos = [texto]
+        digitos = somente_digitos(termo)
+        if digitos and digitos != texto:
+            prefixos.append(digitos)
+
+        # dict como conjunto ordenado: mantém a ordem do primeiro (melhor) match
+        escolhidos: Dict[int, None] = {}
+        for tipo in (CHAVE_NOME, CHAVE_PALAVRA, CHAVE_DOCUMENTO):
+            for _, _, pos in heapq.merge(*(self._faixa(tipo, p) for p in prefixos)):
+                escolhidos.setdefault(pos)
+                if len(escolhidos) >= limite:
+                    break
+            if len(escolhidos) >= limite:
+                break
+        return [self._formatar(self.registros[pos]) for pos in escolhidos]
+
+    def _faixa(self, tipo: int, prefixo: str) -> Iterator[Tuple[int, str, int]]:
+        """(0 se exato senão 1, chave, posição) das chaves com o prefixo, já ordenados."""
+        chaves, posicoes = self._faixas[tipo]
+        inicio = bisect_left(chaves, prefixo)
+        fim = bisect_left(chaves, prefixo + SENTINELA, lo=inicio)
+        for i in range(inicio, fim):
+            yield (0 if chaves[i] == prefixo else 1, chaves[i], posicoes[i])
+
+    @staticmethod
+    def _formatar(registro: Registro) -> dict:
+        return {"id": registro[0], "nome": registro[1], "cnpj_cpf": registro[2]}
+
+
+def _em_thread(alvo: Callable[[], None]):
+    def _rodar():
+        try:
+            alvo()
+        finally:
+            # Conexão própria da thread; não fica aberta até o fim do processo
+            connection.close()
+
+    threading.Thread(target=_rodar, name="supplier-index", daemon=True).start()
+
+
+class SupplierIndexHolder:
+    """
+    Mantém o índice do processo atualizado em relação à versão dos dados
+    (contagem + max(updated_at) da tabela Supplier), verificada no máximo a cada
+    SUPPLIER_INDEX_CHECK_SECONDS. A atualização (delta ou recarga completa) roda
+    fora da requisição, em `executar` (uma thread por padrão); leitores seguem
+    com o índice anterior, ou com o banco enquanto o primeiro não fica pronto.
+    Erros na atualização são logados e mantêm o índice anterior.
+    """
+
+    CAMPOS = (
+        "codigo_omie",
+        "razao_social",
+        "nome_fantasia",
+        "cnpj_cpf",
+        "razao_social_busca",
+        "nome_fantasia_busca",
+        "documento_busca",
+        "inativo",
+        "created_at",
+    )
+
+    def __init__(self, executar: Callable[[Callable[[], None]], None] = _em_thread):
+        self._executar = executar
+        self._lock = threading.Lock()
+        self._indice: Optional[SupplierPrefixIndex] = None
+        self._registros: Dict[int, Registro] = {}
+        self._versao: Optional[Tuple[int, object]] = None
+        self._verificado_em = 0.0
+        self._desativado_ate = 0.0
+
+    def obter(self) -> Optional[SupplierPrefixIndex]:
+        agora = time.monotonic()
+        if agora < self._desativado_ate:
+            return None
+        if self._indice is None or agora - self._verificado_em >= settings.SUPPLIER_INDEX_CHECK_SECONDS:
+            # Só uma atualização por vez; quem não pega o lock segue com o índice atual
+            if self._lock.acquire(blocking=False):
+                try:
+                    self._executar(self._atualizar_protegido)
+                except Exception:
+                    self._lock.release()
+                    logger.exception("Falha ao agendar a atualização do índice de fornecedores")
+        return self._indice
+
+    def invalidar(self):
+        with self._lock:
+            self._indice = None
+            self._registros = {}
+            self._versao = None
+            self._verificado_em = 0.0
+            self._desativado_ate = 0.0
+
+    def _atualizar_protegido(self):
+        # Roda com self._lock tomado por obter()
+        try:
+            self._atualizar()
+        except SupplierIndexOverBudget as exc:
+            logger.warning("Índice de fornecedores desativado: %s", exc)
+            self._indice = None
+            self._registros = {}
+            self._versao = None
+            self._desativado_ate = time.monotonic() + settings.SUPPLIER_INDEX_CHECK_SECONDS
+        except Exception:
+            # Ex.: banco indisponível. O autocomplete segue com o índice anterior (ou o banco)
+            logger.exception("Falha ao atualizar o índice de fornecedores")
+            self._versao = None  # força recarga completa na próxima verificação
+        finally:
+            self._verificado_em = time.monotonic()
+            self._lock.release()
+
+    def _atualizar(self):
+        agg = Supplier.objects.aggregate(total=Count("id"), ultimo=Max("updated_at"))
+        versao = (agg["total"], agg["ultimo"])
+        if versao == self._versao and self._indice is not None:
+            return
+
+        anterior = self._versao
+        if anterior is None or anterior[1] is None or versao[0] < anterior[0]:
+            self._recarregar_tudo()
+        else:
+            alterados = list(
+                Supplier.objects.filter(updated_at__gt=anterior[1]).values_list(*self.CAMPOS)
+            )
+            criados = sum(1 for linha in alterados if linha[-1] > anterior[1])
+            if (
+                anterior[0] + criados != versao[0]
+                or len(alterados) > max(100, len(self._registros) // 5)
+            ):
+                self._recarregar_tudo()
+            else:
+                for linha in alterados:
+                    self._aplicar(linha)
+        self._versao = versao
+        self._publicar()
+
+    def _recarregar_tudo(self):
+        self._registros = {}
+        for linha in Supplier.objects.values_list(*self.CAMPOS).iterator(chunk_size=2000):
+            self._aplicar(linha)
+
+    def _aplicar(self, linha):
+        codigo, razao, fantasia, cnpj, razao_busca, fantasia_busca, documento, inativo, _ = linha
+        if inativo:
+            self._registros.pop(codigo, None)
+            return
+        self._registros[codigo] = (
+            codigo, razao or fantasia, cnpj, razao_busca, fantasia_busca, documento
+        )
+
+    def _publicar(self):
+        indice = SupplierPrefixIndex(list(self._registros.values()))
+        tamanho = indice.estimar_bytes()
+        if tamanho > settings.SUPPLIER_INDEX_MAX_BYTES:
+            raise SupplierIndexOverBudget(
+                f"{tamanho} bytes > SUPPLIER_INDEX_MAX_BYTES={settings.SUPPLIER_INDEX_MAX_BYTES}"
+            )
+        self._indice = indice
+        logger.info("Índice de fornecedores atualizado: %s fornecedores, ~%s bytes", len(indice), tamanho)
+
+
+_holder = SupplierIndexHolder()
+
+
+def obter_indice() -> Optional[SupplierPrefixIndex]:
+    """Índice do processo, ou None se desativado/acima do orçamento de memória."""
+    if not settings.SUPPLIER_INDEX_ENABLED:
+        return None
+    return _holder.obter()
+
+
+def invalidar_indice():
+    _holder.invalidar()
@@ -3,13 +3,25 @@ import logging
 from .services import PurchaseOrderClosureService
 from celery import shared_task
 
-from .services import PurchaseOrderRobotService, FullFlowPurchaseOrderService
-from .models import PurchaseOrderIntegration
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from BackOffice.periodic import tarefa_periodica
+from BackOffice.dead_letters import TaskComDeadLetter
+from omie_api.client import OmieAPIException
+from BackOffice.progress import Progresso, canal
+from .services import PurchaseOrderRobotService, FullFlowPurchaseOrderService, SupplierSyncService
+from .models import PurchaseOrderClosureLog, PurchaseOrderOutbox
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task
+@tarefa_periodica(lock_ttl=15 * 60)
 def robo_sincronizar_pedidos():
     service = PurchaseOrderRobotService()
     service.processar()
@@ -17,48 +29,159 @@ def robo_sincronizar_pedidos():
 
 
 @shared_task
+@tarefa_periodica(lock_ttl=60 * 60)
+def sincronizar_fornecedores_task(completo: bool = False):
+    """
+    Task periódica: atualiza o espelho local de fornecedores (Supplier)
+    a partir do ListarClientes. Incremental por padrão.
+    """
+    return SupplierSyncService().sincronizar(completo=completo)
+
+
+@shared_task
+@tarefa_periodica(lock_ttl=10 * 60)
 def full_flow_processar_pedidos_pendentes():
     """
-    Procura pedidos criados pelo BackOffice que ainda não geraram financeiro
-    e tenta processar.
+    Consulta os pedidos criados pelo BackOffice cuja reverificação venceu
+    (status_fluxo=awaiting_close, next_check_at <= agora) e gera o financeiro
+    dos que já foram finalizados. Os demais são reagendados com backoff.
     """
     service = FullFlowPurchaseOrderService()
-    pendentes = PurchaseOrderIntegration.objects.filter(
-        origem="backoffice",
-        metodo_criacao__in=["sistema", "sistema_full_flow"],
-    )
+    resumo = service.processar_pedidos_pendentes()
+    logger.info("Full-flow: reverificação de pedidos pendentes concluída: %s", resumo)
+    return resumo
 
-    for po in pendentes:
-        service.processar_pedido_para_financeiro(po)
 
+@shared_task(bind=True, base=TaskComDeadLetter, max_retries=3, soft_time_limit=600)
+def processar_outbox_pedido_task(self, outbox_id: int):
+    """
+    Processa uma intenção de full-flow registrada na outbox:
+    cria o pedido na Omie e envia os anexos em spool.
+    """
+    service = FullFlowPurchaseOrderService()
+    outbox = service.processar_outbox(outbox_id)
+    if outbox.status == "failed" and outbox.pode_retentar:
+        raise self.retry(exc=Exception(outbox.mensagem_erro), countdown=60)
 
-@shared_task(bind=True, max_retries=3)
+    return {
+        'status': outbox.status,
+        'outbox_id': outbox.id,
+        'cod_int_pedido': outbox.cod_int_pedido,
+        'mensagem_erro': outbox.mensagem_erro,
+    }
+
+
+@shared_task
+@tarefa_periodica(lock_ttl=10 * 60)
+def reprocessar_outbox_pendentes_task():
+    """
+    Task periódica: reenfileira intenções da outbox que ficaram pendentes
+    (ex.: broker indisponível no commit), falharam com tentativas restantes ou
+    ficaram presas em `processing` (worker morto). Reenfileirar uma outbox que
+    outro worker ainda processa é inofensivo: processar_outbox só roda quem a tomar.
+    """
+    parado_desde = timezone.now() - timedelta(seconds=settings.FULL_FLOW_OUTBOX_PROCESSING_TIMEOUT)
+    pendentes = PurchaseOrderOutbox.objects.filter(
+        Q(status__in=['pending', 'failed']) | Q(status='processing', updated_at__lt=parado_desde),
+        tentativas__lt=models.F('max_tentativas'),
+    ).values_list('id', flat=True)
+
+    total = 0
+    for outbox_id in pendentes:
+        processar_outbox_pedido_task.delay(outbox_id)
+        total += 1
+    return {'total_reenfileirados': total}
+
+
+@shared_task(bind=True, base=TaskComDeadLetter, max_retries=3, soft_time_limit=120)
 def encerrar_pedido_task(self, numero_pedido: str, item_pedido: str,
-                         numero_nf_servico: str, id_nf_servico: int):
+                         numero_nf_servico: str, id_nf_servico: int,
+                         forcar_consulta: bool = False, log_id: int | None = None):
     """
-    Task assíncrona para encerrar pedido de compra
+    Task assíncrona para encerrar pedido de compra.
+    As retentativas reutilizam o mesmo log (log_id); esgotadas, a task vai
+    para a dead-letter (BackOffice.DeadLetterTask).
     """
     try:
-        logger.info(f"Encerrando pedido assincronamente: {numero_pedido}")
+        logger.info("Encerrando pedido assincronamente: %s", numero_pedido)
         service = PurchaseOrderClosureService()
+        log = PurchaseOrderClosureLog.objects.filter(pk=log_id).first() if log_id else None
         resultado = service.encerrar_pedido_automaticamente(
             numero_pedido=numero_pedido,
             item_pedido=item_pedido,
             numero_nf_servico=numero_nf_servico,
-            id_nf_servico=id_nf_servico
+            id_nf_servico=id_nf_servico,
+            log=log,
+            forcar_consulta=forcar_consulta,
         )
-
-        return {
-            'status': resultado.status,
-            'numero_pedido': numero_pedido,
-            'mensagem': resultado.mensagem_erro if resultado.status == 'failed' else 'Sucesso'
-        }
     except Exception as exc:
-        logger.error(f"Erro ao encerrar pedido: {str(exc)}")
+        logger.error("Erro ao encerrar pedido: %s", exc)
         raise self.retry(exc=exc, countdown=60)
 
+    if resultado.status == 'failed':
+        raise self.retry(
+            exc=OmieAPIException(resultado.mensagem_erro or 'Encerramento falhou'),
+            countdown=60,
+            kwargs={**self.request.kwargs, 'log_id': resultado.id},
+        )
+
+    return {
+        'status': resultado.status,
+        'numero_pedido': numero_pedido,
+        'mensagem': 'Sucesso'
+    }
+
+
+@shared_task
+@tarefa_periodica(lock_ttl=5 * 60)
+def recuperar_encerramentos_coalescidos_task():
+    """
+    Task periódica: reagenda a consolidação dos pedidos cujas solicitações
+    coalescidas ficaram pendentes (agendamento perdido) ou presas em processing.
+    """
+    pedidos = PurchaseOrderClosureService().recuperar_encerramentos_coalescidos()
+    for numero_pedido in pedidos:
+        consolidar_encerramentos_task.delay(numero_pedido)
+    return {'pedidos_reenfileirados': len(pedidos)}
+
+
+@shared_task(soft_time_limit=600)
+def consolidar_encerramentos_task(numero_pedido: str):
+    """
+    Executada ao fim da janela de agrupamento: encerra numa única atualização
+    todas as solicitações pendentes do pedido.
+    """
+    service = PurchaseOrderClosureService()
+    logs = service.consolidar_encerramentos(numero_pedido)
+
+    return {
+        'numero_pedido': numero_pedido,
+        'solicitacoes': len(logs),
+        'status': logs[0].status if logs else None,
+    }
+
+
+@shared_task(bind=True, soft_time_limit=900)
+def encerrar_pedidos_em_lote_task(self, solicitacoes: list, forcar_consulta: bool = False):
+    """
+    Task assíncrona para encerrar pedidos em lote
+    (ex.: lote de NFs de serviço lançadas de uma vez)
+    """
+    logger.info("Encerrando %s solicitações em lote", len(solicitacoes))
+    service = PurchaseOrderClosureService()
+    logs = service.encerrar_pedidos_em_lote(
+        solicitacoes, forcar_consulta=forcar_consulta, progresso=Progresso(canal('task', self.request.id))
+    )
+
+    return {
+        'total': len(logs),
+        'sucessos': len([log for log in logs if log.status == 'success']),
+        'falhas': len([log for log in logs if log.status == 'failed'])
+    }
+
 
 @shared_task
+@tarefa_periodica(lock_ttl=30 * 60)
 def reprocessar_falhas_task():
     """
     Task periódica para reprocessar encerramentos que falharam
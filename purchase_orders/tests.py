@@ -1,7 +1,33 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
+
+from attachments.models import AttachmentSyncLog
+from .models import (
+    PurchaseOrderClosedIndex,
+    PurchaseOrderClosureLog,
+    PurchaseOrderFinanceMap,
+    PurchaseOrderIntegration,
+    PurchaseOrderOutbox,
+    Supplier,
+)
+from .services import (
+    FullFlowPurchaseOrderService,
+    PurchaseOrderClosureService,
+    SupplierService,
+    SupplierSyncService,
+)
+from .supplier_index import SupplierIndexHolder, SupplierPrefixIndex
 
 
 class PurchaseOrderClosureAPITests(APITestCase):
@@ -34,12 +60,107 @@ class PurchaseOrderClosureAPITests(APITestCase):
         instance.consultar_pedido_compra.assert_called_once_with('PO123')
         instance.encerrar_pedido_compra.assert_called_once_with(numero_pedido='PO123', codigo_item='001')
 
+    @override_settings(PO_CLOSURE_COALESCE_WINDOW_SECONDS=30)
+    @patch('purchase_orders.views.resposta_sobrecarga', return_value=None)
+    @patch('purchase_orders.views.PurchaseOrderClosureService')
+    def test_encerrar_pedido_parses_form_data_flags(self, MockService, _sobrecarga):
+        MockService.return_value.agendar_encerramento_coalescido.return_value.id = 1
+        payload = {
+            'numero_pedido': 'PO123', 'numero_nf_servico': 'NF789', 'id_nf_servico': '999',
+            'assincrono': 'true', 'forcar_consulta': 'false',
+        }
+
+        resp = self.client.post(self.url_encerrar, data=payload, format='multipart')
+        invalido = self.client.post(self.url_encerrar, data={**payload, 'forcar_consulta': 'talvez'},
+                                    format='multipart')
+
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+        MockService.return_value.agendar_encerramento_coalescido.assert_called_once()
+        self.assertEqual(invalido.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('forcar_consulta', invalido.data)
+
     def test_encerrar_pedido_missing_fields(self):
         # Missing required fields
         resp = self.client.post(self.url_encerrar, data={'numero_pedido': 'PO123'}, format='json')
         self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('Campos obrigatórios', resp.data['erro'])
 
+    @patch('purchase_orders.services.OmieAPIClient')
+    def test_encerrar_lote_dedupes_and_skips_closed_orders(self, MockClient):
+        instance = MockClient.return_value
+        instance.po_close_status = 'Encerrado'
+        instance.consultar_pedido_compra.side_effect = lambda numero: {
+            'PO1': {'cStatus': 'Aberto'}, 'PO2': {'cStatus': 'Encerrado'}
+        }[numero]
+        instance.encerrar_pedido_compra.return_value = {'ok': True}
+        solicitacoes = [
+            {'numero_pedido': 'PO1', 'item_pedido': '001', 'numero_nf_servico': 'NF1', 'id_nf_servico': 1},
+            {'numero_pedido': 'PO1', 'item_pedido': '001', 'numero_nf_servico': 'NF1', 'id_nf_servico': 1},
+            {'numero_pedido': 'PO1', 'item_pedido': '002', 'numero_nf_servico': 'NF2', 'id_nf_servico': 2},
+            {'numero_pedido': 'PO2', 'numero_nf_servico': 'NF3', 'id_nf_servico': 3},
+        ]
+
+        # índice local + bulk de logs + upsert do índice (+ savepoint/release)
+        # + contador do dashboard: UPDATE e, na primeira vez do dia, INSERT (savepoint/release)
+        with self.assertNumQueries(9):
+            resp = self.client.post(
+                reverse('purchase-order-closure-encerrar-lote'),
+                data={'solicitacoes': solicitacoes}, format='json',
+            )
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual((resp.data['total'], resp.data['pedidos'], resp.data['sucessos']), (3, 2, 3))
+        self.assertEqual(instance.consultar_pedido_compra.call_count, 2)
+        self.assertEqual(
+            sorted(c.kwargs['codigo_item'] for c in instance.encerrar_pedido_compra.call_args_list),
+            ['001', '002'],
+        )
+        self.assertEqual(PurchaseOrderClosureLog.objects.filter(numero_pedido='PO2').get().detalhes['acao'],
+                         'nenhuma (pedido já encerrado)')
+
+    @patch('purchase_orders.services.OmieAPIClient')
+    def test_encerrar_lote_accepts_mixed_item_types(self, MockClient):
+        instance = MockClient.return_value
+        instance.consultar_pedido_compra.return_value = {'cStatus': 'Aberto'}
+        instance.encerrar_pedido_compra.return_value = {'ok': True}
+        base = {'numero_pedido': 'PO1', 'numero_nf_servico': 'NF1', 'id_nf_servico': 1}
+
+        resp = self.client.post(
+            reverse('purchase-order-closure-encerrar-lote'),
+            data={'solicitacoes': [{**base, 'item_pedido': '001'}, {**base, 'item_pedido': 2},
+                                   {**base, 'item_pedido': ' 2 '}]},
+            format='json',
+        )
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data['total'], 2)
+        self.assertEqual(
+            sorted(c.kwargs['codigo_item'] for c in instance.encerrar_pedido_compra.call_args_list),
+            ['001', '2'],
+        )
+
+    def test_encerrar_lote_rejects_invalid_items(self):
+        resp = self.client.post(
+            reverse('purchase-order-closure-encerrar-lote'),
+            data={'solicitacoes': [{'numero_pedido': 'PO1'}]}, format='json',
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.data['indices_invalidos'], [0])
+
+    @patch('purchase_orders.views.encerrar_pedidos_em_lote_task.delay')
+    def test_encerrar_lote_rejects_non_numeric_id_nf_servico(self, mock_delay):
+        base = {'numero_pedido': 'PO1', 'numero_nf_servico': 'NF1'}
+        resp = self.client.post(
+            reverse('purchase-order-closure-encerrar-lote'),
+            data={'solicitacoes': [{**base, 'id_nf_servico': '12'}, {**base, 'id_nf_servico': 'abc'},
+                                   {**base, 'id_nf_servico': 1.5}],
+                  'assincrono': True},
+            format='json',
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.data['indices_invalidos'], [1, 2])
+        mock_delay.assert_not_called()
+
     @patch('purchase_orders.services.OmieAPIClient')
     def test_reprocessar_falhas_endpoint(self, MockClient):
         # No logs created yet, so reprocess should return zeros
@@ -48,3 +169,517 @@ class PurchaseOrderClosureAPITests(APITestCase):
         self.assertIn('total_reprocessados', resp.data)
         self.assertIn('sucessos', resp.data)
         self.assertIn('falhas', resp.data)
+
+
+@override_settings(FULL_FLOW_RECHECK_BASE_SECONDS=60, FULL_FLOW_RECHECK_MAX_SECONDS=600)
+class FullFlowRecheckQueueTests(TestCase):
+    def _po(self, ncodped, **kwargs):
+        defaults = {'origem': 'backoffice', 'metodo_criacao': 'sistema'}
+        defaults.update(kwargs)
+        return PurchaseOrderIntegration.objects.create(ncodped_omie=ncodped, **defaults)
+
+    def test_only_due_orders_are_queried(self):
+        omie = MagicMock()
+        omie.consultar_pedido_compra.return_value = {'cStatus': 'Aberto'}
+        due = self._po(1)
+        self._po(2, next_check_at=timezone.now() + timedelta(hours=1))
+        financed = self._po(3, status_fluxo='financed', next_check_at=None)
+        PurchaseOrderFinanceMap.objects.create(
+            purchase_order=financed, codigo_lancamento_omie=30, metodo_criacao='sistema_full_flow'
+        )
+
+        resumo = FullFlowPurchaseOrderService(omie_client=omie).processar_pedidos_pendentes()
+
+        omie.consultar_pedido_compra.assert_called_once_with({'nCodPed': 1})
+        self.assertEqual(resumo['consultados'], 1)
+        self.assertEqual(resumo['reagendados'], 1)
+        due.refresh_from_db()
+        self.assertEqual(due.tentativas_verificacao, 1)
+        self.assertGreater(due.next_check_at, timezone.now() + timedelta(seconds=50))
+
+    def test_backoff_is_exponential_and_capped(self):
+        po = self._po(1, tentativas_verificacao=3)
+        po.agendar_proxima_verificacao()
+        self.assertAlmostEqual(
+            (po.next_check_at - po.ultima_verificacao_em).total_seconds(), 480, delta=1
+        )
+        po.agendar_proxima_verificacao()
+        self.assertAlmostEqual(
+            (po.next_check_at - po.ultima_verificacao_em).total_seconds(), 600, delta=1
+        )
+
+    def test_closed_order_generates_finance_and_leaves_queue(self):
+        omie = MagicMock()
+        omie.consultar_pedido_compra.return_value = {'cStatus': 'Encerrado', 'nCodPed': 1}
+        omie.incluir_conta_pagar.return_value = {'codigo_lancamento_omie': 99}
+        omie.listar_anexos.return_value = []
+        po = self._po(1)
+
+        resumo = FullFlowPurchaseOrderService(omie_client=omie).processar_pedidos_pendentes()
+
+        self.assertEqual(resumo['financeiros_gerados'], 1)
+        po.refresh_from_db()
+        self.assertEqual(po.status_fluxo, 'financed')
+        self.assertIsNone(po.next_check_at)
+
+
+class FullFlowOutboxTests(APITestCase):
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir, ignore_errors=True)
+        override = override_settings(FULL_FLOW_SPOOL_DIR=self.spool_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    @patch('purchase_orders.tasks.processar_outbox_pedido_task.delay')
+    @patch('purchase_orders.services.OmieAPIClient')
+    def test_full_flow_endpoint_only_enqueues(self, MockClient, mock_delay):
+        payload = {
+            'pedido': json.dumps({'cCodIntPed': 'PO-1', 'nValorTotal': 10}),
+            'anexos': [SimpleUploadedFile('nota.pdf', b'%PDF-1.4 teste')],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(reverse('po-integrations-full-flow'), data=payload, format='multipart')
+
+        self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+        outbox = PurchaseOrderOutbox.objects.get(pk=resp.data['outbox_id'])
+        self.assertEqual(outbox.cod_int_pedido, 'PO-1')
+        self.assertEqual(outbox.arquivos.get().tamanho, len(b'%PDF-1.4 teste'))
+        mock_delay.assert_called_once_with(outbox.id)
+        self.assertFalse(MockClient.return_value.method_calls)
+        self.assertFalse(MockClient.from_settings.return_value.method_calls)
+
+    @patch('purchase_orders.tasks.processar_outbox_pedido_task.delay')
+    def test_processar_outbox_is_idempotent(self, mock_delay):
+        omie = MagicMock()
+        omie.incluir_pedido_compra.return_value = {'nCodPed': 555}
+        omie.incluir_anexo.side_effect = [Exception('timeout'), {'ok': True}]
+        omie.listar_anexos.return_value = []
+        service = FullFlowPurchaseOrderService(omie_client=omie)
+        outbox = service.enfileirar_pedido_com_anexos(
+            {'cCodIntPed': 'PO-2'}, [SimpleUploadedFile('a.pdf', b'abc')]
+        )
+
+        self.assertEqual(service.processar_outbox(outbox.id).status, 'failed')
+        self.assertEqual(service.processar_outbox(outbox.id).status, 'success')
+
+        omie.incluir_pedido_compra.assert_called_once()
+        self.assertEqual(omie.incluir_anexo.call_count, 2)
+        po = PurchaseOrderIntegration.objects.get(ncodped_omie=555)
+        self.assertEqual(po.cod_int_pedido, 'PO-2')
+        self.assertEqual(AttachmentSyncLog.objects.filter(status='success').count(), 1)
+
+    @patch('purchase_orders.tasks.processar_outbox_pedido_task.delay')
+    def test_concurrent_enqueue_returns_existing_outbox_and_drops_spool(self, mock_delay):
+        service = FullFlowPurchaseOrderService(omie_client=MagicMock())
+        storage = service._spool_storage()
+        salvar = storage.save
+
+        def salvar_com_concorrente(nome, conteudo):
+            # O outro envio do mesmo pedido grava a outbox enquanto este ainda faz o spool
+            PurchaseOrderOutbox.objects.get_or_create(cod_int_pedido='PO-5', defaults={'pedido_data': {}})
+            return salvar(nome, conteudo)
+
+        with patch.object(service, '_spool_storage', return_value=storage), \
+                patch.object(storage, 'save', side_effect=salvar_com_concorrente):
+            outbox = service.enfileirar_pedido_com_anexos(
+                {'cCodIntPed': 'PO-5'}, [SimpleUploadedFile('a.pdf', b'abc')]
+            )
+
+        self.assertEqual(outbox, PurchaseOrderOutbox.objects.get(cod_int_pedido='PO-5'))
+        self.assertFalse(outbox.arquivos.exists())
+        self.assertEqual([f for _, _, arquivos in os.walk(self.spool_dir) for f in arquivos], [])
+        mock_delay.assert_not_called()
+
+    @patch('purchase_orders.tasks.processar_outbox_pedido_task.delay')
+    def test_processar_outbox_skips_when_claimed_elsewhere(self, mock_delay):
+        omie = MagicMock()
+        service = FullFlowPurchaseOrderService(omie_client=omie)
+        outbox = service.enfileirar_pedido_com_anexos(
+            {'cCodIntPed': 'PO-3'}, [SimpleUploadedFile('a.pdf', b'abc')]
+        )
+        # Outro worker já tomou a outbox
+        self.assertTrue(outbox.claim_for_processing())
+
+        resultado = service.processar_outbox(outbox.id)
+
+        self.assertEqual(resultado.status, 'processing')
+        self.assertEqual(resultado.tentativas, 1)
+        self.assertFalse(omie.method_calls)
+
+    @patch('purchase_orders.tasks.processar_outbox_pedido_task.delay')
+    def test_stale_processing_outbox_is_reclaimed_and_reenqueued(self, mock_delay):
+        from .tasks import reprocessar_outbox_pendentes_task
+
+        omie = MagicMock()
+        omie.incluir_pedido_compra.return_value = {'nCodPed': 777}
+        omie.listar_anexos.return_value = []
+        service = FullFlowPurchaseOrderService(omie_client=omie)
+        outbox = service.enfileirar_pedido_com_anexos({'cCodIntPed': 'PO-4'}, [])
+        self.assertTrue(outbox.claim_for_processing())
+
+        reprocessar_outbox_pendentes_task()
+        mock_delay.assert_not_called()
+
+        # Worker morreu: a linha ficou em processing além do timeout
+        PurchaseOrderOutbox.objects.filter(pk=outbox.pk).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        reprocessar_outbox_pendentes_task()
+        mock_delay.assert_called_once_with(outbox.id)
+        self.assertEqual(service.processar_outbox(outbox.id).status, 'success')
+
+
+class SupplierMirrorTests(TestCase):
+    @patch('purchase_orders.services.OmieClient.call')
+    def test_sync_upserts_pages_and_uses_watermark(self, mock_call):
+        mock_call.side_effect = [
+            {'total_de_paginas': 2, 'clientes_cadastro': [
+                {'codigo_cliente_omie': 1, 'razao_social': 'Ação Serviços LTDA', 'cnpj_cpf': '12.345.678/0001-90',
+                 'info': {'dAlt': '10/01/2025', 'hAlt': '08:00:00'}},
+            ]},
+            {'total_de_paginas': 2, 'clientes_cadastro': [
+                {'codigo_cliente_omie': 2, 'razao_social': 'Beta Peças', 'nome_fantasia': 'Beta',
+                 'info': {'dAlt': '11/01/2025', 'hAlt': '09:30:00'}},
+            ]},
+            {'total_de_paginas': 1, 'clientes_cadastro': [
+                {'codigo_cliente_omie': 1, 'razao_social': 'Ação Serviços SA', 'cnpj_cpf': '12.345.678/0001-90',
+                 'info': {'dAlt': '12/01/2025', 'hAlt': '10:00:00'}},
+            ]},
+        ]
+
+        SupplierSyncService().sincronizar()
+        resumo = SupplierSyncService().sincronizar()
+
+        self.assertTrue(resumo['incremental'])
+        self.assertEqual(mock_call.call_args.kwargs['body']['filtrar_por_data_de'], '11/01/2025')
+        self.assertEqual(Supplier.objects.count(), 2)
+        self.assertEqual(Supplier.objects.get(codigo_omie=1).razao_social_busca, 'acao servicos sa')
+
+    def test_search_is_local_and_matches_prefix_and_document(self):
+        Supplier.objects.create(codigo_omie=1, razao_social='Ação Serviços', cnpj_cpf='12.345.678/0001-90')
+        Supplier.objects.create(codigo_omie=2, razao_social='Beta', nome_fantasia='Serviços Beta')
+        Supplier.objects.create(codigo_omie=3, razao_social='Acme', inativo=True)
+
+        with patch('purchase_orders.services.OmieClient.call') as mock_call:
+            por_nome = SupplierService.list_suppliers(search='acao')
+            por_doc = SupplierService.list_suppliers(search='12.345')
+            por_contem = SupplierService.list_suppliers(search='beta')
+            mock_call.assert_not_called()
+
+        self.assertEqual([s['id'] for s in por_nome], [1])
+        self.assertEqual([s['id'] for s in por_doc], [1])
+        self.assertEqual(por_doc[0]['cnpj_cpf'], '12.345.678/0001-90')
+        self.assertEqual([s['id'] for s in por_contem], [2])
+
+
+@override_settings(SUPPLIER_INDEX_CHECK_SECONDS=0, SUPPLIER_INDEX_MAX_BYTES=10 * 1024 * 1024)
+class SupplierPrefixIndexTests(TestCase):
+    def test_ranking_prefers_exact_then_name_prefix_then_word_then_document(self):
+        indice = SupplierPrefixIndex([
+            (1, 'Sol Energia', '', 'sol energia', '', ''),
+            (2, 'Sol', '', 'sol', '', ''),
+            (3, 'Grupo Solar', '', 'grupo solar', '', ''),
+            (4, 'Alfa', '123', 'alfa', '', '123'),
+        ])
+        self.assertEqual([s['id'] for s in indice.buscar('sol')], [2, 1, 3])
+        self.assertEqual([s['id'] for s in indice.buscar('12')], [4])
+        self.assertEqual(indice.buscar('xyz'), [])
+
+    def test_ranking_is_not_cut_by_wide_prefix_slices(self):
+        # Milhares de palavras com o prefixo vêm antes (na ordem das chaves) do nome que casa
+        registros = [
+            (i, f'Grupo Sola{i:04d}', '', f'grupo sola{i:04d}', '', '') for i in range(1, 3001)
+        ]
+        registros.append((9999, 'Solz', '', 'solz', '', ''))
+        indice = SupplierPrefixIndex(registros)
+
+        resultado = [s['id'] for s in indice.buscar('sol', limite=5)]
+
+        self.assertEqual(resultado, [9999, 1, 2, 3, 4])
+
+    def test_holder_applies_deltas_and_drops_inactive(self):
+        holder = SupplierIndexHolder(executar=lambda alvo: alvo())
+        Supplier.objects.create(codigo_omie=1, razao_social='Alfa')
+        self.assertEqual([s['id'] for s in holder.obter().buscar('alf')], [1])
+
+        Supplier.objects.create(codigo_omie=2, razao_social='Alfama')
+        Supplier.objects.filter(codigo_omie=1).update(inativo=True, updated_at=timezone.now())
+        self.assertEqual([s['id'] for s in holder.obter().buscar('alf')], [2])
+
+    @override_settings(SUPPLIER_INDEX_MAX_BYTES=10)
+    def test_over_budget_falls_back_to_database(self):
+        Supplier.objects.create(codigo_omie=1, razao_social='Alfa')
+        self.assertIsNone(SupplierIndexHolder(executar=lambda alvo: alvo()).obter())
+
+    def test_refresh_runs_outside_the_caller(self):
+        agendadas = []
+        holder = SupplierIndexHolder(executar=agendadas.append)
+        Supplier.objects.create(codigo_omie=1, razao_social='Alfa')
+
+        # Índice ainda não montado: o chamador cai no banco sem esperar
+        self.assertIsNone(holder.obter())
+        self.assertIsNone(holder.obter())
+        self.assertEqual(len(agendadas), 1)
+
+        agendadas.pop()()
+        self.assertEqual([s['id'] for s in holder.obter().buscar('alf')], [1])
+
+    def test_database_error_keeps_previous_index(self):
+        from django.db import DatabaseError
+
+        holder = SupplierIndexHolder(executar=lambda alvo: alvo())
+        Supplier.objects.create(codigo_omie=1, razao_social='Alfa')
+        anterior = holder.obter()
+
+        with patch.object(Supplier.objects, 'aggregate', side_effect=DatabaseError('down')):
+            self.assertIs(holder.obter(), anterior)
+        with patch.object(Supplier.objects, 'aggregate', side_effect=DatabaseError('down')):
+            self.assertIsNone(SupplierIndexHolder(executar=lambda alvo: alvo()).obter())
+
+
+@override_settings(PO_CLOSURE_COALESCE_WINDOW_SECONDS=5)
+class ClosureCoalescingTests(APITestCase):
+    @patch('purchase_orders.tasks.consolidar_encerramentos_task.apply_async')
+    @patch('purchase_orders.services.OmieAPIClient')
+    def test_requests_in_window_share_one_omie_update(self, MockClient, mock_apply):
+        instance = MockClient.return_value
+        instance.po_close_status = 'Encerrado'
+        instance.consultar_pedido_compra.return_value = {'cStatus': 'Aberto'}
+        instance.encerrar_pedido_compra.return_value = {'ok': True}
+        url = reverse('purchase-order-closure-encerrar')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for nf, item in (('NF1', None), ('NF2', '001'), ('NF3', None)):
+                payload = {'numero_pedido': 'PO9', 'numero_nf_servico': nf, 'id_nf_servico': 1, 'assincrono': True}
+                if item:
+                    payload['item_pedido'] = item
+                resp = self.client.post(url, data=payload, format='json')
+                self.assertEqual(resp.status_code, status.HTTP_202_ACCEPTED)
+
+        mock_apply.assert_called_once_with(args=['PO9'], countdown=5)
+        instance.encerrar_pedido_compra.assert_not_called()
+
+        logs = PurchaseOrderClosureService().consolidar_encerramentos('PO9')
+
+        self.assertEqual(len(logs), 3)
+        instance.consultar_pedido_compra.assert_called_once_with('PO9')
+        instance.encerrar_pedido_compra.assert_called_once_with(numero_pedido='PO9', codigo_item=None)
+        for log in PurchaseOrderClosureLog.objects.filter(numero_pedido='PO9'):
+            self.assertEqual(log.status, 'success')
+            self.assertEqual(log.detalhes['solicitacoes_agrupadas'], 3)
+        self.assertEqual(PurchaseOrderClosureService().consolidar_encerramentos('PO9'), [])
+
+    @patch('purchase_orders.tasks.consolidar_encerramentos_task.delay')
+    @patch('purchase_orders.tasks.consolidar_encerramentos_task.apply_async', side_effect=Exception('broker fora'))
+    @patch('purchase_orders.services.OmieAPIClient')
+    def test_lost_schedule_and_stuck_rows_are_recovered_by_sweep(self, MockClient, mock_apply, mock_delay):
+        from .tasks import recuperar_encerramentos_coalescidos_task
+
+        service = PurchaseOrderClosureService()
+        with self.captureOnCommitCallbacks(execute=True):
+            perdido = service.agendar_encerramento_coalescido('PO7', None, 'NF1', 1)
+        mock_apply.assert_called_once()
+        preso = service.agendar_encerramento_coalescido('PO8', None, 'NF2', 2)
+        PurchaseOrderClosureLog.objects.filter(pk=preso.pk).update(
+            status='processing', updated_at=timezone.now() - timedelta(hours=1)
+        )
+
+        # Ainda dentro da janela: nada a recuperar além do preso
+        self.assertEqual(service.recuperar_encerramentos_coalescidos(), ['PO8'])
+        PurchaseOrderClosureLog.objects.filter(pk=perdido.pk).update(
+            created_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        resultado = recuperar_encerramentos_coalescidos_task()
+
+        self.assertEqual(resultado['pedidos_reenfileirados'], 1)
+        mock_delay.assert_called_once_with('PO7')
+        preso.refresh_from_db()
+        self.assertEqual(preso.status, 'pending')
+
+
+@override_settings(PO_CLOSED_INDEX_MAX_AGE_SECONDS=3600)
+class ClosedOrderIndexTests(TestCase):
+    def _encerrar(self, **kwargs):
+        return PurchaseOrderClosureService().encerrar_pedido_automaticamente(
+            numero_pedido='PO5', item_pedido=None, numero_nf_servico='NF', id_nf_servico=1, **kwargs
+        )
+
+    @patch('purchase_orders.services.OmieAPIClient')
+    def test_repeat_closure_short_circuits_until_forced_or_stale(self, MockClient):
+        instance = MockClient.return_value
+        instance.po_close_status = 'Encerrado'
+        instance.consultar_pedido_compra.return_value = {'cStatus': 'Aberto'}
+        instance.encerrar_pedido_compra.return_value = {'ok': True}
+
+        self.assertEqual(self._encerrar().status, 'success')
+        self.assertEqual(PurchaseOrderClosedIndex.objects.get(numero_pedido='PO5').status_omie, 'Encerrado')
+
+        instance.reset_mock()
+        repetido = self._encerrar()
+        self.assertEqual(repetido.status, 'success')
+        self.assertIn('índice local', repetido.detalhes['acao'])
+        instance.consultar_pedido_compra.assert_not_called()
+
+        instance.consultar_pedido_compra.return_value = {'cStatus': 'Encerrado'}
+        self._encerrar(forcar_consulta=True)
+        instance.consultar_pedido_compra.assert_called_once_with('PO5')
+
+        PurchaseOrderClosedIndex.objects.update(confirmado_em=timezone.now() - timedelta(hours=2))
+        self._encerrar()
+        self.assertEqual(instance.consultar_pedido_compra.call_count, 2)
+
+    @patch('purchase_orders.services.OmieAPIClient')
+    def test_item_closure_does_not_mark_order_closed(self, MockClient):
+        instance = MockClient.return_value
+        instance.po_close_status = 'Encerrado'
+        instance.consultar_pedido_compra.return_value = {'cStatus': 'Aberto'}
+        instance.encerrar_pedido_compra.return_value = {'ok': True}
+        PurchaseOrderClosureService().encerrar_pedido_automaticamente(
+            numero_pedido='PO6', item_pedido='001', numero_nf_servico='NF', id_nf_servico=1
+        )
+        self.assertFalse(PurchaseOrderClosedIndex.objects.exists())
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.url = reverse('purchase-order-closure-list')
+        agora = timezone.now()
+        self.logs = []
+        for i in range(5):
+            log = PurchaseOrderClosureLog.objects.create(
+                numero_pedido=f'PO{i}', numero_nf_servico='NF', id_nf_servico=1,
+                status='failed' if i % 2 else 'success',
+            )
+            self.logs.append(log)
+        # Dois registros com o mesmo created_at: o desempate é pelo id
+        PurchaseOrderClosureLog.objects.filter(pk__in=[self.logs[1].pk, self.logs[2].pk]).update(created_at=agora)
+
+    def _ids(self, resp):
+        return [item['id'] for item in resp.data['results']]
+
+    def test_percorre_paginas_sem_repetir_e_volta(self):
+        esperado = list(
+            PurchaseOrderClosureLog.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        vistos, paginas = [], []
+        resp = self.client.get(self.url, {'page_size': 2})
+        while True:
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            paginas.append(resp)
+            vistos.extend(self._ids(resp))
+            if not resp.data['next']:
+                break
+            resp = self.client.get(resp.data['next'])
+
+        self.assertEqual(vistos, esperado)
+        self.assertIsNone(paginas[0].data['previous'])
+        voltar = self.client.get(paginas[-1].data['previous'])
+        self.assertEqual(self._ids(voltar), self._ids(paginas[-2]))
+
+    def test_filtro_e_total_aproximado(self):
+        resp = self.client.get(self.url, {'status': 'failed', 'total': 1})
+        self.assertEqual(len(resp.data['results']), 2)
+        self.assertEqual(resp.data['total_aproximado'], {'valor': 2, 'exato': True})
+        self.assertNotIn('count', resp.data)
+
+    def test_cursor_invalido(self):
+        resp = self.client.get(self.url, {'cursor': 'lixo'})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class LeanListTests(APITestCase):
+    def setUp(self):
+        self.log = PurchaseOrderClosureLog.objects.create(
+            numero_pedido='PO1', numero_nf_servico='NF', id_nf_servico=1,
+            status='failed', mensagem_erro='erro', detalhes={'grande': 'x' * 100},
+        )
+        self.url = reverse('purchase-order-closure-list')
+
+    def test_listagem_padrao_omite_colunas_pesadas(self):
+        resp = self.client.get(self.url)
+        item = resp.data['results'][0]
+        self.assertNotIn('detalhes', item)
+        self.assertNotIn('mensagem_erro', item)
+
+        # Mesma representação de data do serializer completo
+        detalhe = self.client.get(reverse('purchase-order-closure-detail', args=[self.log.pk]))
+        self.assertEqual(item['created_at'], detalhe.data['created_at'])
+
+    def test_expand_e_fields(self):
+        resp = self.client.get(self.url, {'expand': 'detalhes'})
+        self.assertEqual(resp.data['results'][0]['detalhes'], {'grande': 'x' * 100})
+
+        resp = self.client.get(self.url, {'fields': 'numero_pedido,status'})
+        self.assertEqual(
+            set(resp.data['results'][0]), {'id', 'created_at', 'numero_pedido', 'status'}
+        )
+
+        resp = self.client.get(self.url, {'fields': 'senha'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_finance_map_listagem(self):
+        po = PurchaseOrderIntegration.objects.create(ncodped_omie=1, origem='omie', metodo_criacao='robo')
+        PurchaseOrderFinanceMap.objects.create(purchase_order=po, codigo_lancamento_omie=10, metodo_criacao='robo')
+
+        resp = self.client.get(reverse('po-finance-map-list'))
+
+        self.assertEqual(resp.data['results'][0]['purchase_order'], po.pk)
+
+
+class ConditionalListTests(APITestCase):
+    def setUp(self):
+        self.url = reverse('po-integrations-list')
+        self.po = PurchaseOrderIntegration.objects.create(ncodped_omie=1, origem='omie', metodo_criacao='robo')
+
+    def test_etag_responde_304_com_uma_query(self):
+        primeira = self.client.get(self.url)
+        etag = primeira['ETag']
+        self.assertTrue(primeira.has_header('Last-Modified'))
+
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Parâmetros diferentes são outra representação
+        resp = self.client.get(self.url, {'origem': 'omie'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        self.po.status_fluxo = 'financed'
+        self.po.save()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_etag_segue_so_a_pagina_sem_count(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        antigos = [
+            PurchaseOrderIntegration.objects.create(ncodped_omie=100 + i, origem='omie', metodo_criacao='robo')
+            for i in range(3)
+        ]
+        etag = self.client.get(self.url, {'page_size': 2})['ETag']
+
+        # Linha fora da página (e da espiada da seguinte) não muda a ETag; sem COUNT(*)
+        PurchaseOrderIntegration.objects.filter(pk=self.po.pk).update(status_fluxo='financed')
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(self.url, {'page_size': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql'].upper()])
+
+        # Remoção de uma linha da página muda a ETag
+        antigos[-1].delete()
+        resp = self.client.get(self.url, {'page_size': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_cache_opcional_por_etag(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        with self.settings(API_LIST_CACHE_SECONDS=30):
+            primeira = self.client.get(self.url)
+            with self.assertNumQueries(1):
+                segunda = self.client.get(self.url)
+        self.assertEqual(segunda.json(), primeira.json())
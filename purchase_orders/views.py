@@ -1,4 +1,6 @@
+import json
 import logging
+from django.conf import settings
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
@@ -6,8 +8,17 @@ from rest_framework.response import Response
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.shortcuts import render
+from django.urls import reverse
 from rest_framework.views import APIView
 
+from django_filters.rest_framework import DjangoFilterBackend
+
+from BackOffice.backpressure import resposta_sobrecarga
+from BackOffice.progress import canal, registrar_dono
+from BackOffice.idempotency import idempotente
+from BackOffice.pagination import KeysetPagination
+from BackOffice.viewsets import ConditionalListMixin, LeanListMixin, parametro_booleano
+
 from .models import (
     PurchaseOrderClosureLog,
     PurchaseOrderIntegration,
@@ -20,9 +31,12 @@ from .serializers import (
 )
 from .services import (
     FullFlowPurchaseOrderService,
+    PurchaseOrderClosureService,
     PurchaseOrderRobotService,
 )
 from .services import SupplierService
+from . import supplier_index
+from .tasks import encerrar_pedido_task, encerrar_pedidos_em_lote_task
 
 logger = logging.getLogger(__name__)
 
@@ -31,13 +45,23 @@ def purchase_orders_page(request):
     return render(request, "pages/purchase_orders.html")
 
 
-class PurchaseOrderClosureViewSet(viewsets.ReadOnlyModelViewSet):
+class PurchaseOrderClosureViewSet(ConditionalListMixin, LeanListMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet para consultar logs de encerramento de pedidos
     """
     queryset = PurchaseOrderClosureLog.objects.all()
+    serializer_class = PurchaseOrderClosureLogSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        "status": ["exact", "in"],
+        "numero_pedido": ["exact"],
+        "item_pedido": ["exact"],
+        "created_at": ["gte", "lte"],
+    }
 
     @action(detail=False, methods=['post'])
+    @idempotente
     def encerrar(self, request):
         """
         Endpoint para disparar manualmente o encerramento de um pedido
@@ -48,14 +72,16 @@ class PurchaseOrderClosureViewSet(viewsets.ReadOnlyModelViewSet):
             "item_pedido": "001",  # opcional
             "numero_nf_servico": "789",
             "id_nf_servico": 999,
-            "assincrono": true  # opcional
+            "assincrono": true,  # opcional
+            "forcar_consulta": false  # opcional: ignora o índice local de encerrados
         }
         """
         numero_pedido = request.data.get('numero_pedido')
         item_pedido = request.data.get('item_pedido')
         numero_nf_servico = request.data.get('numero_nf_servico')
         id_nf_servico = request.data.get('id_nf_servico')
-        assincrono = request.data.get('assincrono', False)
+        assincrono = parametro_booleano(request, 'assincrono')
+        forcar_consulta = parametro_booleano(request, 'forcar_consulta')
 
         if not all([numero_pedido, numero_nf_servico, id_nf_servico]):
             return Response(
@@ -64,9 +90,26 @@ class PurchaseOrderClosureViewSet(viewsets.ReadOnlyModelViewSet):
             )
 
         if assincrono:
+            # Filas acima do limite: 429/503 com Retry-After em vez de enfileirar
+            sobrecarga = resposta_sobrecarga()
+            if sobrecarga is not None:
+                return sobrecarga
+
+        if assincrono and settings.PO_CLOSURE_COALESCE_WINDOW_SECONDS > 0 and not forcar_consulta:
+            # Agrupa com outras solicitações do mesmo pedido dentro da janela
+            log = PurchaseOrderClosureService().agendar_encerramento_coalescido(
+                numero_pedido, item_pedido, numero_nf_servico, id_nf_servico
+            )
+            return Response({
+                'mensagem': 'Encerramento agendado (agrupado por pedido)',
+                'log_id': log.id,
+                'janela_segundos': settings.PO_CLOSURE_COALESCE_WINDOW_SECONDS,
+            }, status=status.HTTP_202_ACCEPTED)
+        elif assincrono:
             # Processa de forma assíncrona
             task = encerrar_pedido_task.delay(
-                numero_pedido, item_pedido, numero_nf_servico, id_nf_servico
+                numero_pedido, item_pedido, numero_nf_servico, id_nf_servico,
+                forcar_consulta=forcar_consulta,
             )
             return Response({
                 'mensagem': 'Encerramento iniciado de forma assíncrona',
@@ -79,7 +122,8 @@ class PurchaseOrderClosureViewSet(viewsets.ReadOnlyModelViewSet):
                 numero_pedido=numero_pedido,
                 item_pedido=item_pedido,
                 numero_nf_servico=numero_nf_servico,
-                id_nf_servico=id_nf_servico
+                id_nf_servico=id_nf_servico,
+                forcar_consulta=forcar_consulta,
             )
 
             return Response({
@@ -89,6 +133,99 @@ class PurchaseOrderClosureViewSet(viewsets.ReadOnlyModelViewSet):
                 'detalhes': resultado.detalhes
             })
 
+    @staticmethod
+    def _normalizar_solicitacao(sol) -> dict | None:
+        """
+        Solicitação do lote com id_nf_servico como int e os códigos (pedido, item,
+        NF) como texto sem espaços; None se inválida.
+        """
+        if not isinstance(sol, dict) or not all(
+            [sol.get('numero_pedido'), sol.get('numero_nf_servico'), sol.get('id_nf_servico')]
+        ):
+            return None
+        id_nf = sol['id_nf_servico']
+        if isinstance(id_nf, bool):
+            return None
+        try:
+            id_nf_int = int(id_nf) if isinstance(id_nf, int) else int(str(id_nf).strip())
+        except ValueError:
+            return None
+        item = sol.get('item_pedido')
+        return {
+            **sol,
+            'numero_pedido': str(sol['numero_pedido']).strip(),
+            'item_pedido': (str(item).strip() or None) if item is not None else None,
+            'numero_nf_servico': str(sol['numero_nf_servico']).strip(),
+            'id_nf_servico': id_nf_int,
+        }
+
+    @action(detail=False, methods=['post'])
+    @idempotente
+    def encerrar_lote(self, request):
+        """
+        Endpoint para encerrar vários pedidos de uma vez
+
+        POST /api/purchase-orders/closure/encerrar_lote/
+        {
+            "solicitacoes": [
+                {"numero_pedido": "123456", "item_pedido": "001", "numero_nf_servico": "789", "id_nf_servico": 999},
+                ...
+            ],
+            "assincrono": true,  # opcional
+            "forcar_consulta": false  # opcional: ignora o índice local de encerrados
+        }
+        """
+        solicitacoes = request.data.get('solicitacoes')
+        assincrono = parametro_booleano(request, 'assincrono')
+        forcar_consulta = parametro_booleano(request, 'forcar_consulta')
+
+        if not isinstance(solicitacoes, list) or not solicitacoes:
+            return Response(
+                {'erro': 'solicitacoes deve ser uma lista não vazia'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        normalizadas = [self._normalizar_solicitacao(sol) for sol in solicitacoes]
+        invalidas = [i for i, sol in enumerate(normalizadas) if sol is None]
+        if invalidas:
+            return Response(
+                {'erro': 'Campos obrigatórios em cada solicitação: numero_pedido, numero_nf_servico, '
+                         'id_nf_servico (inteiro)',
+                 'indices_invalidos': invalidas},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        solicitacoes = normalizadas
+
+        if assincrono:
+            sobrecarga = resposta_sobrecarga()
+            if sobrecarga is not None:
+                return sobrecarga
+            task = encerrar_pedidos_em_lote_task.delay(solicitacoes, forcar_consulta=forcar_consulta)
+            registrar_dono(canal('task', task.id), request.user)
+            return Response({
+                'mensagem': 'Encerramento em lote iniciado de forma assíncrona',
+                'task_id': task.id,
+                'stream_url': reverse('progress-stream', args=['task', task.id]),
+            }, status=status.HTTP_202_ACCEPTED)
+
+        service = PurchaseOrderClosureService()
+        logs = service.encerrar_pedidos_em_lote(solicitacoes, forcar_consulta=forcar_consulta)
+        return Response({
+            'total': len(logs),
+            'pedidos': len({log.numero_pedido for log in logs}),
+            'sucessos': len([log for log in logs if log.status == 'success']),
+            'falhas': len([log for log in logs if log.status == 'failed']),
+            'resultados': [
+                {
+                    'numero_pedido': log.numero_pedido,
+                    'item_pedido': log.item_pedido,
+                    'numero_nf_servico': log.numero_nf_servico,
+                    'status': log.status,
+                    'mensagem_erro': log.mensagem_erro,
+                }
+                for log in logs
+            ],
+        })
+
     @action(detail=False, methods=['post'])
     def reprocessar_falhas(self, request):
         """
@@ -103,19 +240,50 @@ class PurchaseOrderClosureViewSet(viewsets.ReadOnlyModelViewSet):
             'falhas': len([r for r in resultados if r.status == 'failed'])
         })
 
-class PurchaseOrderIntegrationViewSet(viewsets.ReadOnlyModelViewSet):
+class PurchaseOrderIntegrationViewSet(ConditionalListMixin, LeanListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = PurchaseOrderIntegration.objects.all().order_by("-created_at")
     serializer_class = PurchaseOrderIntegrationSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        "origem": ["exact"],
+        "metodo_criacao": ["exact"],
+        "status_fluxo": ["exact"],
+        "ncodped_omie": ["exact"],
+        "cod_int_pedido": ["exact"],
+        "created_at": ["gte", "lte"],
+    }
 
     @action(detail=False, methods=["post"], url_path="full-flow")
+    @idempotente
     def full_flow(self, request):
-        service = FullFlowPurchaseOrderService()
+        """
+        Registra o pedido (e os anexos em spool) na outbox e responde 202.
+        Criação na Omie, upload dos anexos e geração do financeiro são assíncronos.
+        """
         pedido_data = request.data.get("pedido") or {}
+        if isinstance(pedido_data, str):
+            # multipart/form-data: o front envia o pedido como JSON serializado
+            try:
+                pedido_data = json.loads(pedido_data)
+            except ValueError:
+                return Response({'erro': 'pedido deve ser um JSON válido'}, status=status.HTTP_400_BAD_REQUEST)
+
+        sobrecarga = resposta_sobrecarga()
+        if sobrecarga is not None:
+            return sobrecarga
+
+        service = FullFlowPurchaseOrderService()
         arquivos = request.FILES.getlist("anexos")
-        po = service.criar_pedido_com_anexos(pedido_data, arquivos)
-        service.processar_pedido_para_financeiro(po)
-        serializer = self.get_serializer(po)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        outbox = service.enfileirar_pedido_com_anexos(pedido_data, arquivos)
+        registrar_dono(canal('outbox', outbox.id), request.user)
+        return Response({
+            'mensagem': 'Pedido registrado; envio para a Omie em processamento',
+            'outbox_id': outbox.id,
+            'cod_int_pedido': outbox.cod_int_pedido,
+            'status': outbox.status,
+            'stream_url': reverse('progress-stream', args=['outbox', outbox.id]),
+        }, status=status.HTTP_202_ACCEPTED)
 
     @action(detail=False, methods=["post"], url_path="run-robot")
     def run_robot(self, request):
@@ -124,19 +292,33 @@ class PurchaseOrderIntegrationViewSet(viewsets.ReadOnlyModelViewSet):
         return Response({"detail": "Robô executado."}, status=status.HTTP_200_OK)
 
 
-class PurchaseOrderFinanceMapViewSet(viewsets.ReadOnlyModelViewSet):
+class PurchaseOrderFinanceMapViewSet(ConditionalListMixin, LeanListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = (
         PurchaseOrderFinanceMap.objects.select_related("purchase_order")
         .all()
         .order_by("-created_at")
     )
     serializer_class = PurchaseOrderFinanceMapSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        "metodo_criacao": ["exact"],
+        "anexos_sincronizados": ["exact"],
+        "purchase_order": ["exact"],
+        "codigo_lancamento_omie": ["exact"],
+        "created_at": ["gte", "lte"],
+    }
 
 class SupplierListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         search = request.query_params.get("search") or request.query_params.get("q") or ""
-        suppliers = SupplierService.list_suppliers(search=search)
+        # Índice em memória quando habilitado e dentro do orçamento; senão, banco
+        indice = supplier_index.obter_indice()
+        if indice is not None:
+            suppliers = indice.buscar(search)
+        else:
+            suppliers = SupplierService.list_suppliers(search=search)
         return Response(suppliers)
 